@@ -0,0 +1,144 @@
+"""Fixed cost per job of the launcher and of each built-in callback, with real no-op processes.
+
+Each configuration runs `--jobs` jobs of `true` on `--gpus` fake GPU ids with tracing on. It reports the jobs per
+second from the launcher start to the last job end, and the time per job of each traced phase: the scheduler's
+spans, the spawn and wait (run and reap) of every process, and every callback hook, e.g. the env capture and
+log setup in `LoggingCallback.on_job_start`. Spans nest, e.g. `dispatch` includes `allocate_all` and `split`.
+
+    python benchmarks/bench_job_overhead.py --jobs 500 --gpus 8 --output new.json --compare old.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import List
+
+from rich.console import Console
+
+from toyflow.callbacks import (Callback, LoggingCallback, MetricsCallback,
+                               RichCallback, StatusStoreCallback, WebCallback)
+from toyflow.job import Job, JobStatus
+from toyflow.launcher import Launcher
+from toyflow.runtime import quantile
+
+CALLBACKS = {
+    'logging': LoggingCallback,
+    'rich': RichCallback,
+    'web': WebCallback,
+    'status_store': StatusStoreCallback,
+    'metrics': MetricsCallback,
+}
+CONFIGS = {'bare': (), **{name: (name,) for name in CALLBACKS}, 'all': tuple(CALLBACKS)}
+# Spans where the launcher waits rather than works.
+IDLE_SPANS = ('wait_for_next_proposal',)
+
+
+class _Throughput(Callback):
+    def __init__(self):
+        super().__init__(Callback.config_cls())
+        self.start = self.end = 0.0
+
+    def on_launcher_start(self, jobs: List[Job]):
+        self.start = time.perf_counter()
+
+    def on_job_end(self, job: Job):
+        self.end = time.perf_counter()
+
+
+class _BenchLauncher(Launcher):
+    """Keeps only the default callbacks in `enabled_callbacks`, and draws the console view to /dev/null."""
+
+    def __init__(self, *args, enabled_callbacks=(), **kwargs):
+        self.enabled_callbacks = enabled_callbacks
+        super().__init__(*args, **kwargs)
+
+    def _build_default_callbacks(self, **kwargs) -> List[Callback]:
+        enabled = tuple(CALLBACKS[name] for name in self.enabled_callbacks)
+        callbacks = [callback for callback in super()._build_default_callbacks(**kwargs)
+                     if isinstance(callback, enabled)]
+        for callback in callbacks:
+            if isinstance(callback, RichCallback):
+                # pylint: disable=consider-using-with
+                callback.console = Console(file=open(os.devnull, 'w', encoding='utf-8'), force_terminal=True)
+        return callbacks
+
+
+def summarize_phases(events, num_jobs: int):
+    durations = defaultdict(list)
+    for event in events:
+        name = event['name']
+        if event['ph'] == 'X' and name not in IDLE_SPANS and not name.startswith(_Throughput.__name__):
+            durations[name].append(event['dur'] / 1e3)
+    return {
+        name: {
+            'count': len(values),
+            'per_job_ms': sum(values) / num_jobs,
+            'p50_ms': quantile(values, 0.5),
+            'p99_ms': quantile(values, 0.99),
+        } for name, values in durations.items()
+    }
+
+
+def run_config(name: str, num_jobs: int, cuda_list: List[int], root: Path):
+    workdir = root / name
+    start = time.perf_counter()
+    jobs = [Job(cmd=['true'], log_dir=workdir / f'job-{i}', job_name=f'noop-{i}') for i in range(num_jobs)]
+    construct = time.perf_counter() - start
+    throughput = _Throughput()
+    start = time.perf_counter()
+    launcher = _BenchLauncher(
+        cuda_list, jobs, callbacks=[throughput], enabled_callbacks=CONFIGS[name],
+        trace_file=str(workdir / 'trace.json'), status_db=str(root / 'status.db'),
+        env_store_dir=str(root / 'env_snapshots'))
+    init = time.perf_counter() - start
+    start = time.perf_counter()
+    asyncio.run(launcher._start())
+    total = time.perf_counter() - start
+    assert all(job.status == JobStatus.FINISHED for job in jobs), [job.status for job in jobs]
+    return {
+        'jobs_per_s': num_jobs / (throughput.end - throughput.start),
+        'construct_ms_per_job': construct / num_jobs * 1e3,
+        'launcher_init_s': init,
+        'total_s': total,
+        'phases': summarize_phases(launcher.tracer.events, num_jobs),
+    }
+
+
+def print_results(results, baseline=None, top: int = 12):
+    print(f"{'config':<14}{'jobs/s':>18}{'construct_ms/job':>18}{'launcher_init_s':>17}{'total_s':>10}")
+    for name, result in results.items():
+        cell = f"{result['jobs_per_s']:.1f}"
+        if baseline and name in baseline:
+            cell += f" ({(result['jobs_per_s'] / baseline[name]['jobs_per_s'] - 1) * 100:+.1f}%)"
+        print(f"{name:<14}{cell:>18}{result['construct_ms_per_job']:>18.3f}"
+              f"{result['launcher_init_s']:>17.3f}{result['total_s']:>10.2f}")
+    for name, result in results.items():
+        print(f'\n{name}: top phases by time per job')
+        print(f"  {'phase':<40}{'count':>8}{'ms/job':>10}{'p50_ms':>10}{'p99_ms':>10}")
+        phases = sorted(result['phases'].items(), key=lambda item: -item[1]['per_job_ms'])
+        for phase, stats in phases[:top]:
+            print(f"  {phase:<40}{stats['count']:>8}{stats['per_job_ms']:>10.3f}"
+                  f"{stats['p50_ms']:>10.3f}{stats['p99_ms']:>10.3f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=300)
+    parser.add_argument('--gpus', type=int, default=8, help='Number of fake GPU ids; no GPU is used.')
+    parser.add_argument('--configs', nargs='*', default=list(CONFIGS), choices=list(CONFIGS))
+    parser.add_argument('--output', type=Path, default=None)
+    parser.add_argument('--compare', type=Path, default=None, help='Results of a previous run to compare with.')
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {name: run_config(name, args.jobs, list(range(args.gpus)), Path(tmp)) for name in args.configs}
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    print_results(results, baseline)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
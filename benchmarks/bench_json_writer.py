@@ -0,0 +1,81 @@
+"""Event-loop stall caused by job_info.json writes, inline versus through `CoalescingJsonWriter`.
+
+A slow filesystem such as NFS is emulated by sleeping for `--latency-ms` before every real write. Each job
+updates its file `--updates` times in quick succession, like the start and end of a short job.
+
+    python benchmarks/bench_json_writer.py --jobs 200 --latency-ms 20
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from toyflow.utils.json_util import dumps_json, load_json, write_text
+from toyflow.utils.json_writer import CoalescingJsonWriter
+
+
+def make_slow_write(latency: float):
+    def slow_write(text, path):
+        time.sleep(latency)
+        write_text(text, path, atomic=True)
+    return slow_write
+
+
+def make_info(job: int, update: int):
+    return {
+        'job_name': f'job-{job}',
+        'cmd': ['python', 'train.py', f'--seed={job}'],
+        'env': {f'KEY_{i}': 'x' * 32 for i in range(20)},
+        'job_status': 'RUNNING' if update == 0 else 'FINISHED',
+        'update': update,
+    }
+
+
+def run(root: Path, num_jobs: int, num_updates: int, latency: float, use_writer: bool):
+    slow_write = make_slow_write(latency)
+    writer = CoalescingJsonWriter(write_fn=slow_write)
+    stalls = []
+    start = time.perf_counter()
+    for job in range(num_jobs):
+        path = root / f'job-{job}' / 'job_info.json'
+        for update in range(num_updates):
+            t = time.perf_counter()
+            if use_writer:
+                writer.submit(make_info(job, update), path)
+            else:
+                slow_write(dumps_json(make_info(job, update)), path)
+            stalls.append(time.perf_counter() - t)
+    submitted = time.perf_counter() - start
+    writer.close()
+    total = time.perf_counter() - start
+    for job in range(num_jobs):
+        info = load_json(root / f'job-{job}' / 'job_info.json')
+        assert info['update'] == num_updates - 1, info
+    stalls.sort()
+    return {
+        'loop_time_s': submitted,
+        'stall_p50_ms': stalls[len(stalls) // 2] * 1e3,
+        'stall_max_ms': stalls[-1] * 1e3,
+        'until_flushed_s': total,
+        'writes': writer.num_written if use_writer else len(stalls),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=200)
+    parser.add_argument('--updates', type=int, default=2)
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    args = parser.parse_args()
+
+    print(f'{args.jobs} jobs x {args.updates} updates, {args.latency_ms} ms per write')
+    print(f'{"mode":<10} {"loop (s)":>10} {"p50 (ms)":>10} {"max (ms)":>10} {"flushed (s)":>12} {"writes":>8}')
+    for mode, use_writer in (('inline', False), ('writer', True)):
+        with tempfile.TemporaryDirectory() as root:
+            result = run(Path(root), args.jobs, args.updates, args.latency_ms / 1e3, use_writer)
+        print(f'{mode:<10} {result["loop_time_s"]:>10.3f} {result["stall_p50_ms"]:>10.3f} '
+              f'{result["stall_max_ms"]:>10.3f} {result["until_flushed_s"]:>12.3f} {result["writes"]:>8}')
+
+
+if __name__ == '__main__':
+    main()
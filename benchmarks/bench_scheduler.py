@@ -0,0 +1,74 @@
+"""Scheduler policy benchmarks on synthetic workloads, simulated in virtual time.
+
+    python benchmarks/bench_scheduler.py --output new.json --compare old.json
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+from toyflow.simulator import generate_workload, run_simulation
+
+SCENARIOS = {
+    'single-gpu': dict(
+        cuda_list=list(range(8)),
+        workload=dict(num_jobs=400, seed=0, mean_duration=600),
+    ),
+    'mixed-gpu': dict(
+        cuda_list=list(range(8)),
+        workload=dict(num_jobs=300, seed=1, mean_duration=900,
+                      cuda_quantity_weights={1: 0.6, 2: 0.3, 4: 0.1}),
+    ),
+    'heavy-tail': dict(
+        cuda_list=list(range(8)),
+        workload=dict(num_jobs=300, seed=2, mean_duration=600, duration_sigma=2.0,
+                      cuda_quantity_weights={1: 0.8, 8: 0.2}),
+    ),
+    'flaky': dict(
+        cuda_list=list(range(4)),
+        workload=dict(num_jobs=200, seed=3, mean_duration=300, failure_rate=0.3,
+                      cuda_quantity_weights={1: 0.7, 2: 0.3}),
+    ),
+}
+
+REPORTED_KEYS = ['makespan', 'gpu_utilization', 'queue_wait_p50', 'queue_wait_p90', 'queue_wait_p99']
+
+
+def run_benchmarks(names, **launcher_kwargs):
+    results = {}
+    for name in names:
+        scenario = SCENARIOS[name]
+        workload = generate_workload(**scenario['workload'])
+        start = time.perf_counter()
+        result = run_simulation(scenario['cuda_list'], workload, **launcher_kwargs).as_dict()
+        result['wall_time_s'] = time.perf_counter() - start
+        results[name] = result
+    return results
+
+
+def print_results(results, baseline=None):
+    header = f"{'scenario':<12}" + ''.join(f'{key:>18}' for key in REPORTED_KEYS) + f"{'wall_time_s':>14}"
+    print(header)
+    for name, result in results.items():
+        row = f'{name:<12}'
+        for key in REPORTED_KEYS:
+            cell = f'{result[key]:.3f}' if key == 'gpu_utilization' else f'{result[key]:.0f}'
+            if baseline and name in baseline and baseline[name][key]:
+                cell += f' ({(result[key] / baseline[name][key] - 1) * 100:+.1f}%)'
+            row += f'{cell:>18}'
+        row += f"{result['wall_time_s']:>14.2f}"
+        print(row)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenarios', nargs='*', default=list(SCENARIOS))
+    parser.add_argument('--output', type=Path, default=None)
+    parser.add_argument('--compare', type=Path, default=None, help='Results of a previous run to compare with.')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.scenarios)
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    print_results(results, baseline)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
@@ -50,6 +50,9 @@ setup(
     package_data={
         'toyflow': ['src/toyflow/callbacks/web_callback.html'],
     },
+    entry_points={
+        'console_scripts': ['toyflow=toyflow.cli:main'],
+    },
     install_requires=[
         "pandas",
         "flask",
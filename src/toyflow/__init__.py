@@ -1 +1,9 @@
-from toyflow.launcher import Job, Launcher
\ No newline at end of file
+__all__ = ['Job', 'Launcher']
+
+
+def __getattr__(name):
+    # Imported lazily so that the `toyflow` CLI starts without loading the launcher and its dependencies.
+    if name in __all__:
+        from toyflow import launcher
+        return getattr(launcher, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
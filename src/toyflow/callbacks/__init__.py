@@ -1,4 +1,6 @@
 from toyflow.callbacks.base import Callback, CompositeCallback
 from toyflow.callbacks.logging_callback import LoggingCallback
+from toyflow.callbacks.metrics_callback import MetricsCallback
 from toyflow.callbacks.rich_callback import RichCallback
+from toyflow.callbacks.status_store_callback import StatusStoreCallback
 from toyflow.callbacks.web_callback import WebCallback
\ No newline at end of file
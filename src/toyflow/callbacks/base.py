@@ -1,10 +1,12 @@
 import asyncio
 import contextlib
 import logging
+import time
 from dataclasses import dataclass
-from typing import List, TypeVar
+from typing import Callable, List, TypeVar
 
 from toyflow.job import Job
+from toyflow.utils.config import build_config
 
 logging.basicConfig(level=logging.INFO)
 
@@ -23,16 +25,17 @@ class Callback:
 
     @classmethod
     def from_config(cls, **kwargs):
-        valid_keys = {
-            field.name for field in cls.config_cls.__dataclass_fields__.values()}
-        filtered_kwargs = {k: v for k, v in kwargs.items() if k in valid_keys}
-        config = cls.config_cls(**filtered_kwargs)
+        config = build_config(cls.config_cls, **kwargs)
         logging.info(f'Registered {cls.__name__}(config={config})')
         obj = cls(config)
         return obj
 
     def __init__(self, config: CallbackConfig):
         self.config = config
+        self.launcher = None
+
+    def set_launcher(self, launcher):
+        self.launcher = launcher
 
     def on_launcher_start(self, jobs: List[Job]):
         pass
@@ -40,12 +43,21 @@ class Callback:
     def on_launcher_end(self, jobs: List[Job]):
         pass
 
+    def on_jobs_added(self, jobs: List[Job]):
+        """Called when jobs are submitted to a running launcher, see `Launcher.add_jobs`."""
+        pass
+
     def on_job_start(self, job: Job):
         pass
 
     def on_job_end(self, job: Job):
         pass
 
+    def on_job_requeued(self, job: Job):
+        """Called instead of `on_job_end` when a started job goes back to the queue, e.g. evicted from a packed
+        GPU. It gets another `on_job_start` when it is dispatched again."""
+        pass
+
     @contextlib.contextmanager
     def during_job_context(self, job: Job):
         yield
@@ -61,22 +73,43 @@ class CompositeCallback(Callback):
     def __init__(self, config=Callback.config_cls(), callbacks: List[Callback] = tuple()):
         super().__init__(config)
         self.callbacks = callbacks
+        # Called as `observer(callback, hook_name, start, end)` with `time.perf_counter()` stamps.
+        self.hook_observers: List[Callable] = []
 
-    def on_launcher_start(self, jobs: List[Job]):
+    def _call_hook(self, hook_name: str, *args):
+        if not self.hook_observers:
+            for callback in self.callbacks:
+                getattr(callback, hook_name)(*args)
+            return
         for callback in self.callbacks:
-            callback.on_launcher_start(jobs)
+            start = time.perf_counter()
+            getattr(callback, hook_name)(*args)
+            end = time.perf_counter()
+            for observer in self.hook_observers:
+                observer(callback, hook_name, start, end)
+
+    def set_launcher(self, launcher):
+        super().set_launcher(launcher)
+        for callback in self.callbacks:
+            callback.set_launcher(launcher)
+
+    def on_launcher_start(self, jobs: List[Job]):
+        self._call_hook('on_launcher_start', jobs)
 
     def on_launcher_end(self, jobs: List[Job]):
-        for callback in self.callbacks:
-            callback.on_launcher_end(jobs)
+        self._call_hook('on_launcher_end', jobs)
+
+    def on_jobs_added(self, jobs: List[Job]):
+        self._call_hook('on_jobs_added', jobs)
 
     def on_job_start(self, job: Job):
-        for callback in self.callbacks:
-            callback.on_job_start(job)
+        self._call_hook('on_job_start', job)
 
     def on_job_end(self, job: Job):
-        for callback in self.callbacks:
-            callback.on_job_end(job)
+        self._call_hook('on_job_end', job)
+
+    def on_job_requeued(self, job: Job):
+        self._call_hook('on_job_requeued', job)
 
     @contextlib.contextmanager
     def during_job_context(self, job: Job):
@@ -86,9 +119,7 @@ class CompositeCallback(Callback):
             yield
 
     def on_process_start(self, job: Job, process: asyncio.subprocess.Process):
-        for callback in self.callbacks:
-            callback.on_process_start(job, process)
+        self._call_hook('on_process_start', job, process)
 
     def on_process_end(self, job: Job, process: asyncio.subprocess.Process):
-        for callback in self.callbacks:
-            callback.on_process_end(job, process)
+        self._call_hook('on_process_end', job, process)
@@ -6,11 +6,14 @@ import platform
 import sys
 from dataclasses import dataclass
 from pathlib import Path
-from typing import TypeVar
+from typing import Dict, List, TypeVar
 
 from toyflow.callbacks.base import Callback
+from toyflow.env_store import (DEFAULT_ENV_FILENAME, DEFAULT_ENV_STORE,
+                               DEFAULT_LOG_FOLDER_NAME, EnvSnapshots, EnvStore)
 from toyflow.job import Job
-from toyflow.utils.json_util import dump_json, load_json
+from toyflow.utils.json_util import dump_json
+from toyflow.utils.json_writer import CoalescingJsonWriter
 from toyflow.utils.python_env import (get_conda_env_info,
                                       get_environment_variables, get_git_info,
                                       get_pip_editable_packages_with_git_info,
@@ -23,8 +26,8 @@ Task = TypeVar('Task')
 
 @dataclass
 class LoggingCallbackConfig:
-    log_folder_name: str = '.job-log'
-    env_filename: str = 'job_env.json'
+    log_folder_name: str = DEFAULT_LOG_FOLDER_NAME
+    env_filename: str = DEFAULT_ENV_FILENAME
     job_info_filename: str = 'job_info.json'
     add_timestamp_to_log_dir: bool = False
     dependency_keywords: list[str] = (
@@ -40,6 +43,12 @@ class LoggingCallbackConfig:
     force_only_show_env_keys_extra_list: list[str] = ()
     show_diff_in_env: bool = False
     disable_env_info: bool = False
+    # Write job_env.json and job_info.json on a background thread instead of the event loop.
+    async_json_writes: bool = True
+    # Keep the conda export, editable packages and git info in a content-addressed store shared by all runs,
+    # and only their hashes in job_env.json. Read a job's full info back with `toyflow env <log_dir>`.
+    dedup_env_info: bool = True
+    env_store_dir: str = DEFAULT_ENV_STORE
 
 
 class LoggingCallback(Callback):
@@ -50,13 +59,22 @@ class LoggingCallback(Callback):
     ) -> None:
         super().__init__(config)
         self.config: LoggingCallbackConfig
-        self._storage = {}
+        self._running_info: Dict[Job, dict] = {}
+        self.writer = CoalescingJsonWriter()
+        self.env_snapshots = EnvSnapshots(EnvStore(self.config.env_store_dir)) \
+            if self.config.dedup_env_info else None
+
+    def _write_json(self, obj, path: Path):
+        if self.config.async_json_writes:
+            self.writer.submit(obj, path)
+        else:
+            dump_json(obj, path, atomic=True)
 
     def on_job_start(self, job: Job):
         log_dir = Path(job.log_dir, self.config.log_folder_name)
         log_dir.mkdir(parents=True, exist_ok=True)
 
-        dump_json(
+        self._write_json(
             self.get_python_env_info(job),
             Path(log_dir, self.config.env_filename)
         )
@@ -73,9 +91,13 @@ class LoggingCallback(Callback):
         info['extra_info'] = job.extra_info
 
         if not self.config.disable_env_info:
-            info['conda'] = get_simple_conda_env_info(
-                keywords=self.config.dependency_keywords
-            )
+            conda_info = self.env_snapshots.conda_info() if self.env_snapshots else None
+            if conda_info is not None and 'error' in conda_info:
+                info['conda'] = conda_info
+            else:
+                info['conda'] = get_simple_conda_env_info(
+                    keywords=self.config.dependency_keywords, conda_info=conda_info
+                )
             info['cwd_git_diff'] = get_git_info(job.cwd, return_diff=False)
             info['cwd_git_diff']['cwd'] = Path(job.cwd).as_posix()
 
@@ -86,22 +108,16 @@ class LoggingCallback(Callback):
         info['pid'] = process.pid
         info['job_status'] = job.status.name
         info['returncode'] = None
-        dump_json(info, path)
-        if 'running_info' not in self._storage:
-            self._storage['running_info'] = {}
-        self._storage['running_info'][job] = info
+        self._write_json(info, path)
+        self._running_info[job] = info
 
     def on_process_end(self, job: Job, process: asyncio.subprocess.Process):
         path = Path(job.log_dir, self.config.log_folder_name,
                     self.config.job_info_filename)
-        flag = False
-        if 'running_info' in self._storage and job in self._storage['running_info']:
-            info = self._storage['running_info'][job]
-            flag = True
-        elif path.exists():
-            info = load_json(path)
-        else:
-            info = {}
+        info = self._running_info.pop(job, None)
+        if info is None:
+            info = self.get_job_argv(job)
+            info['extra_info'] = job.extra_info
 
         info['end_time'] = datetime.datetime.now().isoformat()
         try:
@@ -113,9 +129,11 @@ class LoggingCallback(Callback):
             pass
         info['returncode'] = process.returncode
         info['job_status'] = job.status.name
-        dump_json(info, path)
-        if flag:
-            del self._storage['running_info'][job]
+        if job.exception is not None:
+            info['exception'] = repr(job.exception)
+        if job._usage:
+            info['resource_usage'] = job._usage
+        self._write_json(info, path)
 
     @contextlib.contextmanager
     def redirect_output(self, job: Job):
@@ -149,19 +167,40 @@ class LoggingCallback(Callback):
         info = {}
         if self.config.disable_env_info:
             return info
+        if self.env_snapshots:
+            return self.get_deduplicated_python_env_info(job)
         info['conda'] = get_conda_env_info()
         info['pip_editable'] = get_pip_editable_packages_with_git_info(
             return_diff=self.config.show_diff_in_env)
-        info['env'] = get_environment_variables(
+        info['env'] = self.get_environment_variables(job)
+        info['cwd_git_diff'] = get_git_info(
+            job.cwd, return_diff=self.config.show_diff_in_env)
+        info['cwd_git_diff']['cwd'] = Path(job.cwd).as_posix()
+        return info
+
+    def get_environment_variables(self, job):
+        return get_environment_variables(
             job.env, remove_sensitive=self.config.remove_sensitive_env_keys,
             remove_sensitive_extra_list=self.config.remove_sensitive_env_keys_extra_list,
             force_only_show_selected_env_keys=self.config.force_only_show_selected_env_keys,
             force_only_show_env_keys_extra_list=self.config.force_only_show_env_keys_extra_list,
         )
-        info['cwd_git_diff'] = get_git_info(
-            job.cwd, return_diff=self.config.show_diff_in_env)
-        info['cwd_git_diff']['cwd'] = Path(job.cwd).as_posix()
+
+    def get_deduplicated_python_env_info(self, job):
+        snapshots = self.env_snapshots
+        info = {}
+        info['env_store'] = snapshots.store.root.as_posix()
+        info['conda'] = snapshots.conda_ref()
+        info['pip_editable'] = snapshots.ref(get_pip_editable_packages_with_git_info(
+            return_diff=self.config.show_diff_in_env, editable_packages=snapshots.editable_packages()))
+        info['env'] = self.get_environment_variables(job)
+        cwd_git_diff = get_git_info(job.cwd, return_diff=self.config.show_diff_in_env)
+        cwd_git_diff['cwd'] = Path(job.cwd).as_posix()
+        info['cwd_git_diff'] = snapshots.ref(cwd_git_diff)
         return info
 
     def on_job_end(self, job: Job):
         return super().on_job_end(job)
+
+    def on_launcher_end(self, jobs: List[Job]):
+        self.writer.close()
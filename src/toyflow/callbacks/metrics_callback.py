@@ -0,0 +1,200 @@
+import asyncio
+import fnmatch
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from toyflow.callbacks.base import Callback
+from toyflow.job import Job, JobStatus
+from toyflow.metrics import DURATION_BUCKETS, MetricsRegistry
+
+logging.basicConfig(level=logging.INFO)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+@dataclass
+class MetricsCallbackConfig:
+    # The web dashboard always serves `/metrics`; set a port to also run a standalone endpoint.
+    metrics_port: Optional[int] = None
+    # Interface of the standalone endpoint; '0.0.0.0' exposes it to other hosts.
+    metrics_host: str = '127.0.0.1'
+    metrics_job_name_patterns: list[str] = ()
+    metrics_loop_lag_interval: float = 1.0
+    # Time every callback hook of every job into `toyflow_callback_hook_duration_seconds`, at a cost per hook.
+    metrics_hook_latency: bool = False
+
+
+class MetricsCallback(Callback):
+    config_cls = MetricsCallbackConfig
+
+    def __init__(self, config: MetricsCallbackConfig) -> None:
+        super().__init__(config)
+        self.config: MetricsCallbackConfig
+        self.registry = MetricsRegistry()
+        registry = self.registry
+        self.jobs = registry.gauge(
+            'toyflow_jobs', 'Number of jobs in each status.', ['status'])
+        self.jobs_ended = registry.counter(
+            'toyflow_jobs_ended_total', 'Number of ended jobs by final status.', ['status'])
+        self.queue_wait = registry.histogram(
+            'toyflow_job_queue_wait_seconds', 'Time from submission to job start.',
+            buckets=DURATION_BUCKETS)
+        self.dispatch_latency = registry.histogram(
+            'toyflow_dispatch_latency_seconds', 'Time from a resource release to the next job start.')
+        self.job_duration = registry.histogram(
+            'toyflow_job_duration_seconds', 'Job duration by name pattern and final status.',
+            ['pattern', 'status'], buckets=DURATION_BUCKETS)
+        self.hook_duration = registry.histogram(
+            'toyflow_callback_hook_duration_seconds', 'Duration of callback hooks.', ['callback', 'hook'])
+        self.loop_lag = registry.histogram(
+            'toyflow_event_loop_lag_seconds', 'Delay of a periodic wakeup of the event loop.')
+        self.gpu_allocated_seconds = registry.counter(
+            'toyflow_gpu_allocated_seconds_total', 'Seconds during which a GPU was allocated to jobs.', ['gpu'])
+        self.gpu_idle_seconds = registry.counter(
+            'toyflow_gpu_idle_seconds_total', 'Seconds during which a GPU was idle.', ['gpu'])
+
+        self._launcher_start_time: Optional[float] = None
+        self._submit_times: Dict[Job, float] = {}
+        self._start_times: Dict[Job, float] = {}
+        self._last_release_time: Optional[float] = None
+        # gpu -> [number of jobs holding it, time it became busy, accumulated busy seconds]
+        self._gpu_busy: Dict[int, list] = {}
+        self._loop_lag_task: Optional[asyncio.Task] = None
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def set_launcher(self, launcher):
+        super().set_launcher(launcher)
+        if self.config.metrics_hook_latency:
+            launcher.callback.hook_observers.append(self._observe_hook)
+        for cuda_id in launcher.cuda_list:
+            self._gpu_busy.setdefault(int(cuda_id), [0, 0.0, 0.0])
+
+    def _observe_hook(self, callback: Callback, hook_name: str, start: float, end: float):
+        self.hook_duration.observe(end - start, type(callback).__name__, hook_name)
+
+    def _get_pattern(self, job: Job) -> str:
+        for pattern in self.config.metrics_job_name_patterns:
+            if fnmatch.fnmatchcase(str(job.job_name), pattern):
+                return pattern
+        return 'other'
+
+    def on_launcher_start(self, jobs: List[Job]):
+        now = time.monotonic()
+        self._launcher_start_time = now
+        for job in jobs:
+            self._submit_times[job] = now
+        self.jobs.set(len(jobs), JobStatus.PENDING.name)
+        self.jobs.set(0, JobStatus.RUNNING.name)
+        self._loop_lag_task = asyncio.get_running_loop().create_task(self._measure_loop_lag())
+        if self.config.metrics_port is not None:
+            self._start_server(self.config.metrics_port)
+
+    def on_launcher_end(self, jobs: List[Job]):
+        if self._loop_lag_task is not None:
+            self._loop_lag_task.cancel()
+            self._loop_lag_task = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def on_jobs_added(self, jobs: List[Job]):
+        now = time.monotonic()
+        for job in jobs:
+            self._submit_times[job] = now
+        self.jobs.inc(JobStatus.PENDING.name, amount=len(jobs))
+
+    def on_job_start(self, job: Job):
+        now = time.monotonic()
+        self.jobs.dec(JobStatus.PENDING.name)
+        self.jobs.inc(JobStatus.RUNNING.name)
+        self._start_times[job] = now
+        submit_time = self._submit_times.pop(job, None)
+        if submit_time is not None:
+            self.queue_wait.observe(now - submit_time)
+        if self._last_release_time is not None:
+            self.dispatch_latency.observe(now - self._last_release_time)
+            self._last_release_time = None
+        for cuda_id in job._resource.get_cuda_ids():
+            busy = self._gpu_busy.setdefault(cuda_id, [0, 0.0, 0.0])
+            if busy[0] == 0:
+                busy[1] = now
+            busy[0] += 1
+
+    def _release_gpus(self, job: Job, now: float):
+        for cuda_id in job._resource.get_cuda_ids():
+            busy = self._gpu_busy.get(cuda_id)
+            if busy is None or busy[0] == 0:
+                continue
+            busy[0] -= 1
+            if busy[0] == 0:
+                busy[2] += now - busy[1]
+
+    def on_job_requeued(self, job: Job):
+        now = time.monotonic()
+        if self._start_times.pop(job, None) is None:
+            return
+        self.jobs.dec(JobStatus.RUNNING.name)
+        self.jobs.inc(JobStatus.PENDING.name)
+        self._submit_times[job] = now
+        self._release_gpus(job, now)
+
+    def on_job_end(self, job: Job):
+        now = time.monotonic()
+        start_time = self._start_times.pop(job, None)
+        self.jobs.inc(job.status.name)
+        self.jobs_ended.inc(job.status.name)
+        if start_time is None:
+            # Ended without starting, i.e. cancelled or failed to prepare.
+            self._submit_times.pop(job, None)
+            self.jobs.dec(JobStatus.PENDING.name)
+            return
+        self.jobs.dec(JobStatus.RUNNING.name)
+        self.job_duration.observe(now - start_time, self._get_pattern(job), job.status.name)
+        self._last_release_time = now
+        self._release_gpus(job, now)
+
+    async def _measure_loop_lag(self):
+        interval = self.config.metrics_loop_lag_interval
+        while True:
+            expected = time.monotonic() + interval
+            await asyncio.sleep(interval)
+            self.loop_lag.observe(max(time.monotonic() - expected, 0.0))
+
+    def render(self) -> str:
+        if self._launcher_start_time is not None:
+            now = time.monotonic()
+            elapsed = now - self._launcher_start_time
+            for cuda_id, (holders, busy_since, busy_seconds) in list(self._gpu_busy.items()):
+                if holders > 0:
+                    busy_seconds += now - busy_since
+                self.gpu_allocated_seconds.set(busy_seconds, str(cuda_id))
+                self.gpu_idle_seconds.set(max(elapsed - busy_seconds, 0.0), str(cuda_id))
+        return self.registry.render()
+
+    def _start_server(self, port: int):
+        callback = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):  # pylint: disable=invalid-name
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = callback.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.config.metrics_host, port), _Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        logging.warning(f'Metrics at: http://{self.config.metrics_host}:{self._server.server_port}/metrics')
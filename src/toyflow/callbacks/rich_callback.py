@@ -1,20 +1,22 @@
-import datetime
+import asyncio
+import collections
 import logging
+import time
 from asyncio.subprocess import Process
-from datetime import datetime
-from typing import List, TypeVar
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Deque, Dict, List, Optional, TypeVar
 
 import rich
-import rich.layout
+import rich.box
 import rich.live
-import rich.panel
-from rich.console import Console
-from rich.progress import (BarColumn, Progress, TaskProgressColumn, TextColumn,
-                           TimeElapsedColumn)
+from rich.console import Console, Group
+from rich.table import Table
 from rich.text import Text
 
 from toyflow.callbacks.base import Callback
-from toyflow.job import Job
+from toyflow.job import Job, JobStatus
+from toyflow.scheduler import QUEUED_STATUSES
 
 logging.basicConfig(level=logging.INFO)
 
@@ -26,92 +28,221 @@ LOG_FOLDER_NAME = '.job-info'
 console = Console()
 
 
+@dataclass
+class RichCallbackConfig:
+    rich_max_running_rows: int = 30
+    rich_max_finished_rows: int = 5
+    rich_max_failed_rows: int = 10
+    rich_min_refresh_interval: float = 1.0
+    rich_max_refresh_interval: float = 10.0
+
+
+@dataclass
+class _Row:
+    job_id: int
+    name: str
+    cuda: str
+    pid: int
+    start: float
+    status: str = 'RUNNING'
+    duration: float = 0.0
+    usage: str = ''
+    expected: Optional[float] = None
+
+
+def _format_duration(seconds: float) -> str:
+    return str(timedelta(seconds=int(seconds)))
+
+
 class RichCallback(Callback):
-    def __init__(self, config) -> None:
+    """Live console view whose cost does not grow with the number of jobs.
+
+    Only running jobs and the last few finished and failed jobs are kept as rows; everything
+    else is aggregated into counters. Redraws are throttled, and the interval grows with the
+    rate of job events.
+    """
+
+    config_cls = RichCallbackConfig
+
+    def __init__(self, config: RichCallbackConfig) -> None:
         super().__init__(config)
+        self.config: RichCallbackConfig
         self.console = console
         self._additional_info = Text('[Running...]')
+        self.num_total = 0
+        self.counts: Dict[str, int] = collections.Counter()
+        self.running: Dict[Job, _Row] = {}
+        self.finished: Deque[_Row] = collections.deque(maxlen=self.config.rich_max_finished_rows)
+        self.failed: Deque[_Row] = collections.deque(maxlen=self.config.rich_max_failed_rows)
+        self.refresh_interval = self.config.rich_min_refresh_interval
+        self._event_rate = 0.0
+        self._last_event_time = time.monotonic()
+        self._last_refresh_time = 0.0
+        self._dirty = False
+        self._start_time = time.monotonic()
+        self._ticker: Optional[asyncio.Task] = None
+        # The ETA scans the queue, so it is only updated every `rich_max_refresh_interval`.
+        self._eta: Optional[float] = None
+        self._eta_time = float('-inf')
 
     def on_launcher_start(self, jobs: List[Job]):
-        self.job_vs_task_id = {}
-        self.progress = Progress(
-            TextColumn("{task.fields[job_id]}"),
-            TextColumn("{task.fields[cuda_list]}"),
-            TextColumn("{task.description}"),
-            TextColumn('{task.fields[status]}'),
-            TextColumn('{task.fields[pid]}'),
-            BarColumn(pulse_style='bar.back'),
-            TaskProgressColumn(),
-            TimeElapsedColumn(),
-            TextColumn("{task.fields[start_time_str]}"),
-            TextColumn("{task.fields[stop_time_str]}"),
-            refresh_per_second=0.33,
-            redirect_stderr=False,
-            redirect_stdout=False,
-            expand=False,
-            console=self.console,
-        )
-        self.live = rich.live.Live(
-            self.layout(), console=self.console, refresh_per_second=0.33)
+        self.num_total = len(jobs)
+        self.counts[JobStatus.PENDING.name] = len(jobs)
+        self._start_time = time.monotonic()
+        self.live = rich.live.Live(self.layout(), console=self.console, auto_refresh=False)
         self.live.start()
-
-        for i, job in enumerate(jobs):
-            job._job_id = i + 1
-            self.job_vs_task_id[job] = self.progress.add_task(
-                description=str(job.job_name),
-                start=False, total=1,
-                start_time_str='None',
-                stop_time_str='None',
-                job_id=i+1,
-                pid=job._pid,
-                cuda_list=[], status='PENDING',
+        self._ticker = asyncio.get_running_loop().create_task(self._tick())
+
+    def on_jobs_added(self, jobs: List[Job]):
+        self.num_total += len(jobs)
+        self.counts[JobStatus.PENDING.name] += len(jobs)
+        self._on_event()
+
+    def _on_event(self):
+        now = time.monotonic()
+        # Exponentially weighted events per second, with a time constant of about 10 seconds.
+        elapsed = max(now - self._last_event_time, 1e-3)
+        decay = min(elapsed / 10.0, 1.0)
+        self._event_rate = (1 - decay) * self._event_rate + decay / elapsed
+        self._last_event_time = now
+        self.refresh_interval = min(
+            self.config.rich_max_refresh_interval,
+            self.config.rich_min_refresh_interval * (1 + self._event_rate / 5),
+        )
+        self._dirty = True
+        if now - self._last_refresh_time >= self.refresh_interval:
+            self.refresh()
+
+    async def _tick(self):
+        while True:
+            await asyncio.sleep(self.config.rich_min_refresh_interval)
+            now = time.monotonic()
+            if now - self._last_refresh_time >= (
+                    self.refresh_interval if self._dirty else self.config.rich_max_refresh_interval):
+                self.refresh()
+
+    def refresh(self):
+        self._last_refresh_time = time.monotonic()
+        self._dirty = False
+        self.live.update(self.layout(), refresh=True)
+
+    def _summary_text(self) -> str:
+        done = self.num_total - self.counts[JobStatus.PENDING.name] - self.counts[JobStatus.RUNNING.name]
+        parts = [f'{name}={count}' for name, count in self.counts.items() if count]
+        elapsed = _format_duration(time.monotonic() - self._start_time)
+        text = f'[{done}/{self.num_total}] {" ".join(parts)} | elapsed {elapsed}'
+        eta = self._get_eta()
+        if eta is not None:
+            text += f' | ETA ~{_format_duration(eta)}'
+        return text
+
+    def _get_eta(self) -> Optional[float]:
+        estimator = getattr(self.launcher, 'runtime_estimator', None)
+        if estimator is None or self.counts[JobStatus.PENDING.name] + self.counts[JobStatus.RUNNING.name] == 0:
+            return None
+        now = time.monotonic()
+        if now - self._eta_time >= self.config.rich_max_refresh_interval:
+            self._eta_time = now
+            scheduler = self.launcher.job_scheduler
+            eta = estimator.eta((job for job in scheduler.jobs if job.status in QUEUED_STATUSES),
+                                self.launcher.devices.num_active(), now)
+            self._eta = None if eta is None else now + eta
+        return None if self._eta is None else max(self._eta - now, 0.0)
+
+    def _table(self, title: str, rows: List[_Row], hidden: int, running: bool) -> Table:
+        table = Table(title=title, title_justify='left', expand=False, box=rich.box.SIMPLE)
+        for column in ('ID', 'CUDA', 'Name', 'PID', 'Status', 'Duration', 'ETA', 'Usage'):
+            table.add_column(column)
+        now = time.monotonic()
+        for row in rows:
+            duration = now - row.start if running else row.duration
+            eta = ''
+            if running and row.expected is not None:
+                eta = f'~{_format_duration(max(row.expected - duration, 0.0))}'
+            table.add_row(
+                str(row.job_id), row.cuda, row.name, str(row.pid), row.status,
+                _format_duration(duration), eta, row.usage,
             )
+        if hidden > 0:
+            table.add_row('', '', f'... and {hidden} more', '', '', '', '', '')
+        return table
 
     def layout(self):
-        from rich.layout import Layout
-        result = Layout()
-        result.split(
-            Layout(self.progress),
-            Layout(self._additional_info, size=1),
+        max_running = self.config.rich_max_running_rows
+        running_rows = []
+        for row in self.running.values():
+            if len(running_rows) >= max_running:
+                break
+            running_rows.append(row)
+        return Group(
+            self._table(f'Running ({len(self.running)})', running_rows,
+                        len(self.running) - len(running_rows), running=True),
+            self._table('Recently finished', list(self.finished), 0, running=False),
+            self._table(f'Failed ({self.counts[JobStatus.FAILED.name]})', list(self.failed),
+                        self.counts[JobStatus.FAILED.name] - len(self.failed), running=False),
+            Text(self._summary_text()),
+            self._additional_info,
         )
-        return result
 
     def on_launcher_end(self, jobs: List[Job]):
+        if self._ticker is not None:
+            self._ticker.cancel()
+            self._ticker = None
+        self.refresh()
         self.live.stop()
-        # display the progress table's string
+        # A compact summary that does not depend on the number of jobs.
         self.console.print('\n\n[Job Summary]')
-        self.console.print(self.progress)
+        self.console.print(self._summary_text())
+        if self.failed:
+            self.console.print(self._table(
+                f'Failed ({self.counts[JobStatus.FAILED.name]})', list(self.failed),
+                self.counts[JobStatus.FAILED.name] - len(self.failed), running=False))
 
     def on_job_start(self, job: Job):
-        self.progress.start_task(self.job_vs_task_id[job])
-        self.progress.update(
-            self.job_vs_task_id[job],
-            cuda_list=str(job._resource.get_cuda_ids()).replace(' ', ''),
-            status='RUNNING',
-            start_time_str=datetime.now().strftime("%m%d-%H%M%S"),
-            stop_time_str='None',
+        self.counts[JobStatus.PENDING.name] -= 1
+        self.counts[JobStatus.RUNNING.name] += 1
+        self.running[job] = _Row(
+            job_id=job._job_id,
+            name=str(job.job_name),
+            cuda=str(job._resource.get_cuda_ids()).replace(' ', ''),
             pid=job._pid,
+            start=time.monotonic(),
+            expected=job._expected_runtime,
         )
+        self._on_event()
+
+    def on_job_requeued(self, job: Job):
+        if self.running.pop(job, None) is not None:
+            self.counts[JobStatus.RUNNING.name] -= 1
+            self.counts[JobStatus.PENDING.name] += 1
+        self._on_event()
 
     def on_process_start(self, job: Job, process: Process):
-        self.progress.update(
-            self.job_vs_task_id[job],
-            pid=process.pid,
-        )
+        row = self.running.get(job)
+        if row is not None:
+            row.pid = process.pid
 
     def update_log(self, text):
         self._additional_info = Text(text)
-        self.live.update(self.layout())
+        self._dirty = True
 
     def on_job_end(self, job: Job):
-        self.progress.update(
-            self.job_vs_task_id[job], completed=1,
-            status=job.status.name,
-            stop_time_str=datetime.now().strftime("%m%d-%H%M%S"),
-        )
-        self.progress.stop_task(self.job_vs_task_id[job])
-        stopped_tasks = len(
-            [task for task in self.progress.tasks if task.completed])
-        total_tasks = len(self.progress.tasks)
+        row = self.running.pop(job, None)
+        if row is None:
+            # Ended without starting, i.e. cancelled or failed to prepare.
+            self.counts[JobStatus.PENDING.name] -= 1
+            row = _Row(job_id=job._job_id, name=str(job.job_name), cuda='[]', pid=job._pid, start=time.monotonic())
+        else:
+            self.counts[JobStatus.RUNNING.name] -= 1
+        self.counts[job.status.name] += 1
+        row.status = job.status.name
+        row.duration = time.monotonic() - row.start
+        if job._usage.get('num_samples'):
+            row.usage = f"cpu={job._usage['avg_cpu_cores']} rss={job._usage['peak_rss_mb']}MB"
+        if job.status == JobStatus.FAILED:
+            self.failed.append(row)
+        else:
+            self.finished.append(row)
         self.update_log(
-            f'[{stopped_tasks}/{total_tasks}] | Last finished ID: {job._job_id} -- {job}')
+            f'Last ended ID: {job._job_id} at {datetime.now().strftime("%m%d-%H%M%S")} -- {job}')
+        self._on_event()
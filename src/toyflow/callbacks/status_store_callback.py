@@ -0,0 +1,138 @@
+import asyncio
+import json
+import logging
+import os
+import platform
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from toyflow.callbacks.base import Callback
+from toyflow.job import Job
+from toyflow.results import ingest_results
+from toyflow.status_store import DEFAULT_STATUS_DB, StatusStore
+
+logging.basicConfig(level=logging.INFO)
+
+
+@dataclass
+class StatusStoreCallbackConfig:
+    status_db: str = DEFAULT_STATUS_DB
+    disable_status_store: bool = False
+
+
+def _to_json(obj) -> Optional[str]:
+    if not obj:
+        return None
+    return json.dumps(obj, default=str)
+
+
+class StatusStoreCallback(Callback):
+    """Keeps the status of every job of the run in a SQLite database, see `toyflow status --help`."""
+
+    config_cls = StatusStoreCallbackConfig
+
+    def __init__(self, config: StatusStoreCallbackConfig) -> None:
+        super().__init__(config)
+        self.config: StatusStoreCallbackConfig
+        self.store: Optional[StatusStore] = None
+        self.run_id: Optional[int] = None
+        self._attempts: Dict[Job, int] = {}
+
+    def on_launcher_start(self, jobs: List[Job]):
+        if self.config.disable_status_store:
+            return
+        self.store = StatusStore(self.config.status_db)
+        self.run_id = self.store.insert_run(platform.node(), os.getpid(), Path.cwd().as_posix(), len(jobs), time.time())
+        self._insert_jobs(jobs)
+        logging.info(f'Job status of run {self.run_id} is kept in {self.config.status_db}')
+
+    def on_jobs_added(self, jobs: List[Job]):
+        if self.store is None:
+            return
+        self.store.execute('UPDATE runs SET num_jobs = num_jobs + ? WHERE run_id = ?', (len(jobs), self.run_id))
+        self._insert_jobs(jobs)
+
+    def _insert_jobs(self, jobs: List[Job]):
+        now = time.time()
+        self.store.executemany(
+            'INSERT INTO jobs (run_id, job_id, job_name, cmd, cwd, log_dir, cuda_quantity, status, submit_time, '
+            'extra_info) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [(
+                self.run_id, job._job_id, job.job_name, job.cmd_str, Path(job.cwd).as_posix(),
+                Path(job.log_dir).as_posix(), job.cuda_quantity, job.status.name, now, _to_json(job.extra_info),
+            ) for job in jobs],
+        )
+
+    def on_launcher_end(self, jobs: List[Job]):
+        if self.store is None:
+            return
+        self.store.execute('UPDATE runs SET end_time = ? WHERE run_id = ?', (time.time(), self.run_id))
+        self.store.close()
+        self.store = None
+
+    def on_job_start(self, job: Job):
+        if self.store is None:
+            return
+        self.store.execute(
+            'UPDATE jobs SET status = ?, cuda = ?, start_time = ?, end_time = NULL, returncode = NULL '
+            'WHERE run_id = ? AND job_id = ?',
+            (job.status.name, ','.join(map(str, job._resource.get_cuda_ids())), time.time(),
+             self.run_id, job._job_id),
+        )
+
+    def on_process_start(self, job: Job, process: asyncio.subprocess.Process):
+        if self.store is None:
+            return
+        attempt = self._attempts[job] = self._attempts.get(job, 0) + 1
+        cuda = ','.join(map(str, job._resource.get_cuda_ids()))
+        self.store.execute(
+            'INSERT OR REPLACE INTO attempts (run_id, job_id, attempt, cuda, pid, start_time) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (self.run_id, job._job_id, attempt, cuda, process.pid, time.time()),
+        )
+        self.store.execute(
+            'UPDATE jobs SET status = ?, attempts = ?, pid = ? WHERE run_id = ? AND job_id = ?',
+            (job.status.name, attempt, process.pid, self.run_id, job._job_id),
+        )
+
+    def on_process_end(self, job: Job, process: asyncio.subprocess.Process):
+        if self.store is None:
+            return
+        exception = repr(job.exception) if job.exception is not None else None
+        self.store.execute(
+            'UPDATE attempts SET end_time = ?, returncode = ?, exception = ?, resource_usage = ? '
+            'WHERE run_id = ? AND job_id = ? AND attempt = ?',
+            (time.time(), process.returncode, exception, _to_json(job._usage),
+             self.run_id, job._job_id, self._attempts.get(job, 1)),
+        )
+        self.store.execute(
+            'UPDATE jobs SET returncode = ? WHERE run_id = ? AND job_id = ?',
+            (process.returncode, self.run_id, job._job_id),
+        )
+
+    def on_job_requeued(self, job: Job):
+        if self.store is None:
+            return
+        self.store.execute(
+            'UPDATE jobs SET status = ?, cuda = NULL, start_time = NULL, pid = NULL WHERE run_id = ? AND job_id = ?',
+            (job.status.name, self.run_id, job._job_id),
+        )
+
+    def on_job_end(self, job: Job):
+        if self.store is None:
+            return
+        exception = repr(job.exception) if job.exception is not None else None
+        self.store.execute(
+            'UPDATE jobs SET status = ?, end_time = ?, exception = ?, resource_usage = ?, '
+            'extra_info = ? WHERE run_id = ? AND job_id = ?',
+            (job.status.name, time.time(), exception, _to_json(job._usage),
+             _to_json(job.extra_info), self.run_id, job._job_id),
+        )
+        if job.results:
+            # Read on the writer thread, so that a sweep's thousands of files never block the launcher.
+            resources = {'cuda': job._resource.get_cuda_ids(), 'cuda_quantity': job.cuda_quantity,
+                         'host_memory_gb': job.host_memory_gb, **job.resources}
+            run_id, job_id, log_dir, pattern = self.run_id, job._job_id, job.log_dir, job.results
+            self.store.submit(lambda conn: ingest_results(conn, run_id, job_id, log_dir, pattern, resources))
@@ -1,6 +1,9 @@
+import asyncio
 import datetime
 import logging
+import hmac
 import os
+import secrets
 import socket
 import threading
 from datetime import datetime, timedelta
@@ -8,24 +11,31 @@ from pathlib import Path
 from typing import List
 
 import pandas as pd
-from flask import Flask
+from flask import Flask, Response, jsonify, request
 
 from toyflow.callbacks.base import Callback
+from toyflow.callbacks.metrics_callback import CONTENT_TYPE as METRICS_CONTENT_TYPE
 from toyflow.job import Job
 
 logging.basicConfig(level=logging.INFO)
 
 with open(Path(__file__).parent / 'web_callback.html', 'r', encoding='utf-8') as f:
     INDEX_HTML = f.read()
+# Header that requests changing the launcher's state must carry, with the token embedded in the dashboard.
+TOKEN_HEADER = 'X-Toyflow-Token'
 
 
 class WebCallback(Callback):
     def __init__(self, config) -> None:
         super().__init__(config)
         self.jobs = []
+        # Only pages served by the dashboard can read it, so other local users and cross-origin pages cannot
+        # change GPUs: a simple form POST can send neither the header nor the token.
+        self.token = secrets.token_urlsafe(16)
 
     def on_launcher_start(self, jobs: List[Job]):
         self.jobs = [*jobs]
+        self.loop = asyncio.get_running_loop()
         self.port = self._get_free_port(start_port=30088)
         self.app = Flask('Web')
         self.app.logger.setLevel(logging.ERROR)
@@ -40,9 +50,15 @@ class WebCallback(Callback):
         if self.server_thread.is_alive():
             self.server_thread.join(timeout=1)
 
+    def on_jobs_added(self, jobs: List[Job]):
+        self.jobs.extend(jobs)
+
     def on_job_start(self, job: Job):
         job._start_time = datetime.now().isoformat()
 
+    def on_job_requeued(self, job: Job):
+        job._start_time = ''
+
     def on_job_end(self, job: Job):
         job._end_time = datetime.now().isoformat()
 
@@ -51,6 +67,12 @@ class WebCallback(Callback):
             '/jobs', 'get_job_info', self.get_job_info, methods=['GET'])
         self.app.add_url_rule(
             '/', 'index', self.get_index_page, methods=['GET'])
+        self.app.add_url_rule(
+            '/metrics', 'get_metrics', self.get_metrics, methods=['GET'])
+        self.app.add_url_rule(
+            '/gpus', 'get_gpus', self.get_gpus, methods=['GET'])
+        self.app.add_url_rule(
+            '/gpus/<int:cuda_id>/<action>', 'update_gpu', self.update_gpu, methods=['POST'])
 
     def _get_free_port(self, start_port=30088):
         port = start_port
@@ -82,6 +104,18 @@ class WebCallback(Callback):
                 'PID': job._pid,
                 'Duration': duration,
             }
+            if job._expected_runtime is not None:
+                item['Expected'] = str(timedelta(seconds=int(job._expected_runtime)))
+                if job._start_time and not job._end_time:
+                    item['ETA'] = (datetime.fromisoformat(job._start_time) + timedelta(
+                        seconds=job._expected_runtime)).strftime("%m%d-%H:%M:%S")
+            if job._usage:
+                item['CPU cores'] = job._usage['avg_cpu_cores']
+                item['Peak RSS (MB)'] = job._usage['peak_rss_mb']
+                item['GPU util / mem (MB)'] = ' '.join(
+                    f"{gpu['avg_utilization']}%/{gpu['peak_memory_used_mb']:.0f}"
+                    for gpu in job._usage['gpus'].values()
+                )
             if job._start_time:
                 item['Start'] = datetime.fromisoformat(
                     job._start_time).strftime("%m%d-%H:%M:%S")
@@ -94,11 +128,50 @@ class WebCallback(Callback):
             'html': df.to_html(classes='table table-striped', index=False, escape=True, table_id="job-table"),
         }
 
+    def get_metrics(self):
+        metrics = getattr(self.launcher, 'metrics', None)
+        if metrics is None:
+            return Response('No metrics available.', status=404)
+        return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+    def _call_in_loop(self, fn, *args):
+        # Flask serves from its own thread, while the launcher state belongs to the event loop.
+        async def call():
+            return fn(*args)
+        return asyncio.run_coroutine_threadsafe(call(), self.loop).result(timeout=10)
+
+    def get_gpus(self):
+        devices = getattr(self.launcher, 'devices', None)
+        if devices is None:
+            return Response('No device manager.', status=404)
+        return jsonify(self._call_in_loop(devices.as_list))
+
+    def _is_authorized(self) -> bool:
+        token = request.headers.get(TOKEN_HEADER, '')
+        if not hmac.compare_digest(token.encode(), self.token.encode()):
+            return False
+        origin = request.headers.get('Origin')
+        return origin is None or origin.split('://', 1)[-1] == request.host
+
+    def update_gpu(self, cuda_id: int, action: str):
+        if not self._is_authorized():
+            return Response('Forbidden.', status=403)
+        devices = getattr(self.launcher, 'devices', None)
+        if devices is None:
+            return Response('No device manager.', status=404)
+        if action not in ('add', 'remove', 'drain', 'quarantine', 'activate'):
+            return Response(f'Unknown action: {action}', status=400)
+        try:
+            self._call_in_loop(getattr(devices, action), cuda_id)
+        except KeyError as e:
+            return Response(str(e), status=404)
+        return jsonify(self._call_in_loop(devices.as_list))
+
     def get_index_page(self):
         return INDEX_HTML.replace(
             '[TITLE]',
             f"Tasks - {os.uname().nodename}"
-        )
+        ).replace('[TOKEN]', self.token)
 
 
 if __name__ == "__main__":
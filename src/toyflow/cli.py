@@ -0,0 +1,386 @@
+"""Command line interface, installed as `toyflow`.
+
+    toyflow status                      # summary of the latest run
+    toyflow query --status FAILED --gpu 3
+    toyflow query --count-by status,cuda
+    toyflow query --sql "SELECT job_name, returncode FROM jobs WHERE returncode != 0"
+    toyflow results --output results.csv  # rows of the results files that jobs declared, with their jobs
+
+    toyflow daemon --cuda 0,1,2,3 &     # a long-running launcher that owns the GPUs
+    toyflow submit --cuda-quantity 2 --log-dir logs/a -- python train.py --lr 0.1
+    toyflow submit --file jobs.jsonl    # one JSON object of `Job` arguments per line
+    toyflow jobs --status RUNNING
+    toyflow cancel 3 4
+    toyflow gpus drain 3                # or add, remove, quarantine, activate
+    toyflow shutdown
+
+    toyflow env logs/a                  # a job's environment, with its shared snapshots filled in
+"""
+import argparse
+import csv
+import datetime
+import json
+import os
+import re
+import sys
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from toyflow.daemon_client import DEFAULT_SOCKET, DaemonClient, DaemonError
+from toyflow.env_store import DEFAULT_LOG_FOLDER_NAME, load_env_info
+from toyflow.status_store import DEFAULT_STATUS_DB, latest_run_id, query
+
+DEFAULT_COLUMNS = ('job_id', 'job_name', 'status', 'cuda', 'pid', 'returncode', 'start_time', 'duration', 'log_dir')
+TIME_COLUMNS = ('submit_time', 'start_time', 'end_time')
+# Computed columns that are available in queries on both tables.
+EXPRESSIONS = {
+    'duration': "ROUND(COALESCE(end_time, CAST(strftime('%s', 'now') AS REAL)) - start_time, 1)",
+}
+
+
+def _format_value(column: str, value) -> str:
+    if value is None:
+        return ''
+    if column in TIME_COLUMNS:
+        return datetime.datetime.fromtimestamp(value).strftime('%Y-%m-%d %H:%M:%S')
+    return str(value)
+
+
+def print_table(columns: Sequence[str], rows: Sequence[tuple], file=sys.stdout):
+    cells = [[_format_value(column, value) for column, value in zip(columns, row)] for row in rows]
+    widths = [max([len(column)] + [len(row[i]) for row in cells]) for i, column in enumerate(columns)]
+    print('  '.join(column.ljust(width) for column, width in zip(columns, widths)).rstrip(), file=file)
+    for row in cells:
+        print('  '.join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip(), file=file)
+
+
+def print_rows(columns: Sequence[str], rows: Sequence[tuple], output_format: str):
+    if output_format == 'json':
+        print(json.dumps([dict(zip(columns, row)) for row in rows], indent=2))
+    elif output_format == 'csv':
+        writer = csv.writer(sys.stdout)
+        writer.writerow(columns)
+        writer.writerows(rows)
+    else:
+        print_table(columns, rows)
+
+
+def _check_db(db: str):
+    if not Path(db).exists():
+        sys.exit(f'No status database at {db}. Pass --db with the `status_db` the launcher was given.')
+
+
+def _resolve_run(db: str, run: str) -> Optional[int]:
+    if run == 'all':
+        return None
+    if run == 'latest':
+        run_id = latest_run_id(db)
+        if run_id is None:
+            sys.exit(f'No runs in {db}.')
+        return run_id
+    return int(run)
+
+
+def _split_names(value: Optional[str]) -> List[str]:
+    if not value:
+        return []
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    for name in names:
+        if not re.fullmatch(r'[A-Za-z_][A-Za-z0-9_]*', name):
+            sys.exit(f'Invalid column name: {name!r}')
+    return names
+
+
+def _column_sql(name: str) -> str:
+    return f'{EXPRESSIONS[name]} AS {name}' if name in EXPRESSIONS else name
+
+
+def cmd_status(args):
+    _check_db(args.db)
+    if args.run == 'all':
+        sys.exit('`toyflow status` summarizes a single run; use `toyflow query --run all` across runs.')
+    run_id = _resolve_run(args.db, args.run)
+    _, runs = query(
+        args.db, 'SELECT host, pid, cwd, num_jobs, start_time, end_time FROM runs WHERE run_id = ?', (run_id,))
+    if not runs:
+        sys.exit(f'No run {run_id} in {args.db}.')
+    host, pid, cwd, num_jobs, start_time, end_time = runs[0]
+    state = f'ended {_format_value("end_time", end_time)}' if end_time else 'running'
+    print(f'Run {run_id}: {num_jobs} jobs on {host} (pid {pid}) in {cwd}, '
+          f'started {_format_value("start_time", start_time)}, {state}')
+    _, counts = query(
+        args.db, 'SELECT status, COUNT(*) FROM jobs WHERE run_id = ? GROUP BY status ORDER BY COUNT(*) DESC',
+        (run_id,))
+    print_table(('status', 'jobs'), counts)
+    columns = ['job_id', 'job_name', 'cuda', 'returncode', 'exception', 'log_dir']
+    for status in ('RUNNING', 'FAILED'):
+        total = dict(counts).get(status, 0)
+        if not total:
+            continue
+        _, rows = query(
+            args.db,
+            f'SELECT {", ".join(map(_column_sql, columns + ["duration"]))} FROM jobs '
+            'WHERE run_id = ? AND status = ? ORDER BY job_id LIMIT ?',
+            (run_id, status, args.limit))
+        shown = f' (first {len(rows)})' if len(rows) < total else ''
+        print(f'\n{status} jobs: {total}{shown}')
+        print_table(columns + ['duration'], rows)
+
+
+def cmd_query(args):
+    _check_db(args.db)
+    if args.sql:
+        columns, rows = query(args.db, args.sql)
+        print_rows(columns, rows, args.format)
+        return
+    table = 'attempts' if args.attempts else 'jobs'
+    where, params = [], []
+    run_id = _resolve_run(args.db, args.run)
+    if run_id is not None:
+        where.append('run_id = ?')
+        params.append(run_id)
+    if args.status:
+        statuses = [status.upper() for status in args.status.split(',')]
+        if table == 'attempts':
+            sys.exit('--status only applies to jobs.')
+        where.append(f'status IN ({", ".join("?" * len(statuses))})')
+        params.extend(statuses)
+    if args.name:
+        if table == 'attempts':
+            where.append('job_id IN (SELECT job_id FROM jobs WHERE job_name GLOB ?)')
+        else:
+            where.append('job_name GLOB ?')
+        params.append(args.name)
+    for gpu in args.gpu or ():
+        where.append("(',' || cuda || ',') LIKE ?")
+        params.append(f'%,{gpu},%')
+    if args.failed_only:
+        where.append('returncode IS NOT NULL AND returncode != 0')
+    where_sql = f' WHERE {" AND ".join(where)}' if where else ''
+
+    group_by = _split_names(args.count_by)
+    if group_by:
+        columns = group_by + ['count']
+        sql = (f'SELECT {", ".join(group_by)}, COUNT(*) AS count FROM {table}{where_sql} '
+               f'GROUP BY {", ".join(group_by)} ORDER BY count DESC')
+    else:
+        columns = _split_names(args.columns) or list(DEFAULT_COLUMNS)
+        if table == 'attempts' and not args.columns:
+            columns = ['job_id', 'attempt', 'cuda', 'pid', 'returncode', 'start_time', 'duration', 'exception']
+        order_by = _split_names(args.order_by) or ['job_id']
+        sql = (f'SELECT {", ".join(map(_column_sql, columns))} FROM {table}{where_sql} '
+               f'ORDER BY {", ".join(order_by)}{" DESC" if args.desc else ""}')
+    if args.limit:
+        sql += f' LIMIT {int(args.limit)}'
+    columns, rows = query(args.db, sql, params)
+    print_rows(columns, rows, args.format)
+
+
+def cmd_results(args):
+    _check_db(args.db)
+    # pandas takes a while to import, and only this command needs it.
+    from toyflow.results import load_results  # pylint: disable=import-outside-toplevel
+    df = load_results(args.db, _resolve_run(args.db, args.run))
+    if args.output is None:
+        print(df.to_string(index=False) if len(df) else 'No results.')
+    elif args.output.endswith('.parquet'):
+        df.to_parquet(args.output, index=False)
+    elif args.output.endswith('.json'):
+        df.to_json(args.output, orient='records', indent=2)
+    else:
+        df.to_csv(args.output, index=False)
+
+
+def _parse_option(option: str):
+    key, sep, value = option.partition('=')
+    if not sep:
+        sys.exit(f'Expected KEY=VALUE, got {option!r}')
+    try:
+        return key, json.loads(value)
+    except json.JSONDecodeError:
+        return key, value
+
+
+def cmd_daemon(args):
+    # Imported here so that the client commands do not load the launcher.
+    from toyflow.daemon import LauncherDaemon
+    cuda_list = [int(cuda_id) for cuda_id in args.cuda.split(',') if cuda_id.strip()]
+    options = dict(_parse_option(option) for option in args.option or ())
+    options['daemon_socket'] = args.socket
+    LauncherDaemon(cuda_list, **options).start()
+
+
+def cmd_submit(args):
+    defaults = {'cuda_quantity': args.cuda_quantity}
+    if args.distributed:
+        defaults['distributed'] = True
+    if not args.daemon_env:
+        defaults['env'] = dict(os.environ)
+    if args.file:
+        if args.cmd:
+            sys.exit('Pass either --file or a command, not both.')
+        defaults['cwd'] = args.cwd or '.'
+        defaults['log_dir'] = args.log_dir or defaults['cwd']
+        with open(args.file, 'r', encoding='utf-8') as f:
+            jobs = [json.loads(line) for line in f if line.strip()]
+    else:
+        cmd = args.cmd[1:] if args.cmd[:1] == ['--'] else args.cmd
+        if not cmd:
+            sys.exit('Nothing to submit: pass a command after `--`, or --file.')
+        job = {'cmd': cmd, 'cwd': args.cwd or '.', 'log_dir': args.log_dir or '.'}
+        if args.name:
+            job['job_name'] = args.name
+        jobs = [job]
+    job_ids = _client(args).submit(jobs, defaults=defaults)
+    if len(job_ids) == 1:
+        print(f'Submitted job {job_ids[0]}')
+    else:
+        print(f'Submitted {len(job_ids)} jobs: {job_ids[0]}..{job_ids[-1]}')
+
+
+def cmd_cancel(args):
+    if not args.job_ids and not args.name:
+        sys.exit('Pass job ids or --name.')
+    cancelled = _client(args).cancel(job_ids=args.job_ids, name=args.name)
+    shown = ', '.join(map(str, cancelled[:20])) + (', ...' if len(cancelled) > 20 else '')
+    print(f'Cancelled {len(cancelled)} jobs: {shown}')
+
+
+def cmd_jobs(args):
+    statuses = args.status.split(',') if args.status else None
+    response = _client(args).status(job_ids=args.job_ids, status=statuses, limit=args.limit)
+    print(' '.join(f'{status}={count}' for status, count in response['counts'].items()) or 'No jobs.')
+    if response['jobs']:
+        columns = ['job_id', 'job_name', 'status', 'cuda', 'pid', 'log_dir']
+        rows = [
+            tuple(','.join(map(str, job[c])) if c == 'cuda' else job[c] for c in columns)
+            for job in response['jobs']
+        ]
+        print_table(columns, rows)
+
+
+def cmd_gpus(args):
+    devices = _client(args).gpus(action=args.action, cuda_ids=args.cuda_ids)
+    columns = ['cuda_id', 'state', 'num_running', 'consecutive_failures', 'reason']
+    print_table(columns, [tuple(device[c] for c in columns) for device in devices])
+
+
+def cmd_shutdown(args):
+    _client(args).shutdown(cancel_pending=args.cancel_pending)
+    print('The daemon exits once its running jobs are done.')
+
+
+def cmd_env(args):
+    info = load_env_info(args.path, store_root=args.store, log_folder_name=args.log_folder_name)
+    if args.key:
+        info = info[args.key]
+    print(json.dumps(info, indent=2, ensure_ascii=False))
+
+
+def _client(args) -> DaemonClient:
+    return DaemonClient(args.socket)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='toyflow', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_common(subparser, run_help='Run id, "latest" or "all".'):
+        subparser.add_argument('--db', default=DEFAULT_STATUS_DB, help='Status database written by the launcher.')
+        subparser.add_argument('--run', default='latest', help=run_help)
+
+    status = subparsers.add_parser('status', help='Summarize a run.')
+    add_common(status, run_help='Run id or "latest".')
+    status.add_argument('--limit', type=int, default=20, help='Max number of running and failed jobs to list.')
+    status.set_defaults(func=cmd_status)
+
+    query_parser = subparsers.add_parser('query', help='Filter and aggregate jobs.')
+    add_common(query_parser)
+    query_parser.add_argument('--status', help='Comma separated statuses, e.g. FAILED,RUNNING.')
+    query_parser.add_argument('--name', help='Glob on the job name, e.g. "train-*".')
+    query_parser.add_argument('--gpu', type=int, action='append', help='Jobs that used this GPU; repeatable.')
+    query_parser.add_argument('--failed-only', action='store_true', help='Only non-zero return codes.')
+    query_parser.add_argument('--attempts', action='store_true', help='Query process attempts instead of jobs.')
+    query_parser.add_argument('--columns', help=f'Comma separated columns; default: {",".join(DEFAULT_COLUMNS)}.')
+    query_parser.add_argument('--count-by', help='Comma separated columns to group and count by.')
+    query_parser.add_argument('--order-by', help='Comma separated columns to sort by.')
+    query_parser.add_argument('--desc', action='store_true')
+    query_parser.add_argument('--limit', type=int)
+    query_parser.add_argument('--format', choices=('table', 'csv', 'json'), default='table')
+    query_parser.add_argument('--sql', help='Run a read-only SQL query on the `runs`, `jobs` and `attempts` tables.')
+    query_parser.set_defaults(func=cmd_query)
+
+    results = subparsers.add_parser('results', help='Collected results of jobs that declared `results`.')
+    add_common(results)
+    results.add_argument('--output', help='Write to a .csv, .json or .parquet file instead of printing.')
+    results.set_defaults(func=cmd_results)
+
+    def add_socket(subparser):
+        subparser.add_argument('--socket', default=DEFAULT_SOCKET, help='Unix socket of the daemon.')
+
+    daemon = subparsers.add_parser('daemon', help='Run a launcher that accepts jobs until shut down.')
+    add_socket(daemon)
+    daemon.add_argument('--cuda', required=True, help='Comma separated GPU ids, e.g. 0,1,2,3.')
+    daemon.add_argument('--option', action='append', metavar='KEY=VALUE',
+                        help='Launcher option, e.g. status_db=runs.db; values are parsed as JSON when possible.')
+    daemon.set_defaults(func=cmd_daemon)
+
+    submit = subparsers.add_parser('submit', help='Submit jobs to the daemon.')
+    add_socket(submit)
+    submit.add_argument('--file', help='JSON lines of `Job` arguments, submitted in one batch.')
+    submit.add_argument('--name', help='Job name.')
+    submit.add_argument('--cwd', help='Working directory; defaults to the current one.')
+    submit.add_argument('--log-dir', help='Log directory; defaults to the working directory.')
+    submit.add_argument('--cuda-quantity', type=int, default=1)
+    submit.add_argument('--distributed', action='store_true',
+                        help='Run one rank per GPU with MASTER_ADDR, MASTER_PORT, WORLD_SIZE, RANK and LOCAL_RANK set.')
+    submit.add_argument('--daemon-env', action='store_true',
+                        help="Run with the daemon's environment instead of this shell's.")
+    submit.add_argument('cmd', nargs=argparse.REMAINDER, help='The command, after `--`.')
+    submit.set_defaults(func=cmd_submit)
+
+    cancel = subparsers.add_parser('cancel', help='Cancel pending or running jobs of the daemon.')
+    add_socket(cancel)
+    cancel.add_argument('job_ids', type=int, nargs='*')
+    cancel.add_argument('--name', help='Glob on the job name.')
+    cancel.set_defaults(func=cmd_cancel)
+
+    jobs = subparsers.add_parser('jobs', help='List the jobs of the daemon.')
+    add_socket(jobs)
+    jobs.add_argument('job_ids', type=int, nargs='*')
+    jobs.add_argument('--status', help='Comma separated statuses.')
+    jobs.add_argument('--limit', type=int, default=50)
+    jobs.set_defaults(func=cmd_jobs)
+
+    gpus = subparsers.add_parser('gpus', help='List, add, remove, drain, quarantine or activate GPUs of the daemon.')
+    add_socket(gpus)
+    gpus.add_argument('action', nargs='?', choices=('add', 'remove', 'drain', 'quarantine', 'activate'))
+    gpus.add_argument('cuda_ids', type=int, nargs='*')
+    gpus.set_defaults(func=cmd_gpus)
+
+    shutdown = subparsers.add_parser('shutdown', help='Stop the daemon after its running jobs.')
+    add_socket(shutdown)
+    shutdown.add_argument('--cancel-pending', action='store_true')
+    shutdown.set_defaults(func=cmd_shutdown)
+
+    env = subparsers.add_parser('env', help="Print a job's environment info.")
+    env.add_argument('path', help='Log dir of the job, or its job_env.json.')
+    env.add_argument('--key', choices=('conda', 'pip_editable', 'env', 'cwd_git_diff'), help='Only print this part.')
+    env.add_argument('--store', help='Snapshot store; defaults to the one recorded in job_env.json.')
+    env.add_argument('--log-folder-name', default=DEFAULT_LOG_FOLDER_NAME,
+                     help='The `log_folder_name` of the launcher, where job_env.json is in the log dir.')
+    env.set_defaults(func=cmd_env)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    args = build_parser().parse_args(argv)
+    try:
+        args.func(args)
+    except DaemonError as e:
+        sys.exit(str(e))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+import asyncio
+import collections
+import fnmatch
+import json
+import logging
+import os
+import signal
+import socket
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from toyflow.callbacks import Callback
+from toyflow.daemon_client import DEFAULT_SOCKET
+from toyflow.job import Job
+from toyflow.launcher import Launcher
+from toyflow.scheduler import QUEUED_STATUSES
+from toyflow.utils.config import build_config
+
+logging.basicConfig(level=logging.INFO)
+
+# Fields of `Job` that clients may set.
+JOB_FIELDS = (
+    'cmd', 'cwd', 'log_dir', 'job_name', 'env', 'cuda_quantity', 'cpu_quantity', 'extra_info',
+    'apply_shlex_parsing_for_cmd', 'host_memory_gb', 'results', 'distributed',
+)
+# A batch of 10k jobs with their environments is a single, large line.
+MAX_REQUEST_BYTES = 1 << 30
+
+
+@dataclass
+class DaemonConfig:
+    daemon_socket: str = DEFAULT_SOCKET
+
+
+def job_from_dict(spec: Dict[str, Any]) -> Job:
+    unknown = set(spec) - set(JOB_FIELDS)
+    if unknown:
+        raise ValueError(f'Unknown job fields: {sorted(unknown)}')
+    spec = dict(spec)
+    if spec.get('env') is not None:
+        # The launcher sets CUDA_VISIBLE_DEVICES in place, so jobs must not share the dict.
+        spec['env'] = dict(spec['env'])
+    return Job(**spec)
+
+
+def job_to_dict(job: Job) -> Dict[str, Any]:
+    return {
+        'job_id': job._job_id,
+        'job_name': job.job_name,
+        'status': job.status.name,
+        'cuda': job._resource.get_cuda_ids(),
+        'pid': job._pid,
+        'cmd': job.cmd_str,
+        'log_dir': Path(job.log_dir).as_posix(),
+    }
+
+
+class LauncherDaemon:
+    """A launcher that owns its GPUs until shut down and takes jobs from `toyflow submit` clients."""
+
+    def __init__(self, cuda_list: List[int], callbacks: Optional[List[Callback]] = None, **kwargs):
+        self.config = build_config(DaemonConfig, **kwargs)
+        kwargs['keep_alive'] = True
+        self.launcher = Launcher(cuda_list, [], callbacks=callbacks, **kwargs)
+        self.socket_path = Path(self.config.daemon_socket)
+        self._client_tasks: Set[asyncio.Task] = set()
+
+    @property
+    def jobs(self) -> List[Job]:
+        return self.launcher.job_scheduler.jobs
+
+    def _get_job(self, job_id: int) -> Job:
+        if not 1 <= job_id <= len(self.jobs):
+            raise ValueError(f'No job with id {job_id}.')
+        return self.jobs[job_id - 1]
+
+    def handle_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        op = request.get('op')
+        if op == 'ping':
+            return {'pid': os.getpid(), 'num_jobs': len(self.jobs)}
+        if op == 'submit':
+            defaults = request.get('defaults') or {}
+            # Build every job first, so that an invalid spec rejects the whole batch.
+            jobs = [job_from_dict({**defaults, **spec}) for spec in request['jobs']]
+            self.launcher.add_jobs(jobs)
+            return {'job_ids': [job._job_id for job in jobs]}
+        if op == 'cancel':
+            if request.get('job_ids'):
+                jobs = [self._get_job(int(job_id)) for job_id in request['job_ids']]
+            elif request.get('name'):
+                jobs = [job for job in self.jobs if fnmatch.fnmatchcase(str(job.job_name), request['name'])]
+            else:
+                raise ValueError('Pass `job_ids` or `name`.')
+            return {'cancelled': [job._job_id for job in jobs if self.launcher.cancel_job(job)]}
+        if op == 'status':
+            if request.get('job_ids'):
+                jobs = [self._get_job(int(job_id)) for job_id in request['job_ids']]
+            else:
+                jobs = self.jobs
+            counts = collections.Counter(job.status.name for job in jobs)
+            if request.get('status'):
+                statuses = {status.upper() for status in request['status']}
+                jobs = [job for job in jobs if job.status.name in statuses]
+            limit = request.get('limit')
+            if limit is not None:
+                jobs = jobs[:int(limit)]
+            return {'counts': counts, 'jobs': [job_to_dict(job) for job in jobs]}
+        if op == 'gpus':
+            action = request.get('action')
+            if action:
+                if action not in ('add', 'remove', 'drain', 'quarantine', 'activate'):
+                    raise ValueError(f'Unknown action: {action!r}')
+                for cuda_id in request.get('cuda_ids') or ():
+                    getattr(self.launcher.devices, action)(int(cuda_id))
+            return {'devices': self.launcher.devices.as_list()}
+        if op == 'shutdown':
+            if request.get('cancel_pending'):
+                for job in self.jobs:
+                    if job.status in QUEUED_STATUSES:
+                        self.launcher.cancel_job(job)
+            self.launcher.stop(reject_new_jobs=True)
+            return {}
+        raise ValueError(f'Unknown op: {op!r}')
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._client_tasks.add(task)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    response = {'ok': True, **self.handle_request(json.loads(line))}
+                except Exception as e:
+                    response = {'ok': False, 'error': f'{type(e).__name__}: {e}'}
+                writer.write(json.dumps(response, default=str).encode('utf-8') + b'\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError) as e:
+            logging.warning(f'Dropped a daemon client: {e!r}')
+        except asyncio.CancelledError:
+            # The daemon is shutting down while the client keeps its connection open.
+            pass
+        finally:
+            self._client_tasks.discard(task)
+            writer.close()
+
+    def _claim_socket(self):
+        if self.socket_path.exists():
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                if sock.connect_ex(str(self.socket_path)) == 0:
+                    raise RuntimeError(f'Another toyflow daemon is listening on {self.socket_path}.')
+            self.socket_path.unlink()
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+
+    async def serve(self):
+        self._claim_socket()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # The socket is created with these permissions, so other users never get a window to connect.
+        umask = os.umask(0o077)
+        try:
+            sock.bind(str(self.socket_path))
+        except OSError:
+            sock.close()
+            raise
+        finally:
+            os.umask(umask)
+        server = await asyncio.start_unix_server(self._handle_connection, sock=sock, limit=MAX_REQUEST_BYTES)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.launcher.stop, True)
+        logging.warning(f'toyflow daemon listening on {self.socket_path}')
+        try:
+            await self.launcher._start()
+        finally:
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.remove_signal_handler(sig)
+            server.close()
+            for task in list(self._client_tasks):
+                task.cancel()
+            await asyncio.gather(*self._client_tasks, return_exceptions=True)
+            await server.wait_closed()
+            if self.socket_path.exists():
+                self.socket_path.unlink()
+
+    def start(self):
+        asyncio.run(self.serve())
+        logging.info('Daemon stopped')
@@ -0,0 +1,76 @@
+import json
+import os
+import socket
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+DEFAULT_SOCKET = os.path.join(os.path.expanduser('~'), '.toyflow', 'daemon.sock')
+
+
+class DaemonError(RuntimeError):
+    pass
+
+
+class DaemonClient:
+    """Talks to a `toyflow daemon` over its Unix socket, one JSON line per request and per response."""
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET, timeout: Optional[float] = 60.0):
+        self.socket_path = str(socket_path)
+        self.timeout = timeout
+
+    def request(self, op: str, **payload) -> Dict[str, Any]:
+        data = json.dumps({'op': op, **payload}, default=str).encode('utf-8') + b'\n'
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_path)
+            except (FileNotFoundError, ConnectionRefusedError) as e:
+                raise DaemonError(f'No toyflow daemon is listening on {self.socket_path}.') from e
+            sock.sendall(data)
+            chunks = []
+            while True:
+                chunk = sock.recv(1 << 20)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                if chunk.endswith(b'\n'):
+                    break
+        if not chunks:
+            raise DaemonError('The daemon closed the connection without a response.')
+        response = json.loads(b''.join(chunks))
+        if not response.get('ok'):
+            raise DaemonError(response.get('error', 'Unknown error.'))
+        return response
+
+    def submit(self, jobs: List[Dict[str, Any]], defaults: Optional[Dict[str, Any]] = None) -> List[int]:
+        """Submits job specs (keyword arguments of `Job`) in one round trip and returns their ids.
+
+        `defaults` are applied to every job. Relative `cwd` and `log_dir` are resolved here, against the
+        client's working directory.
+        """
+        defaults = dict(defaults or {})
+        for key in ('cwd', 'log_dir'):
+            if key in defaults:
+                defaults[key] = str(Path(defaults[key]).resolve())
+        specs = []
+        for job in jobs:
+            job = dict(job)
+            for key in ('cwd', 'log_dir'):
+                if key in job:
+                    job[key] = str(Path(job[key]).resolve())
+            specs.append(job)
+        return self.request('submit', jobs=specs, defaults=defaults)['job_ids']
+
+    def cancel(self, job_ids: Optional[List[int]] = None, name: Optional[str] = None) -> List[int]:
+        return self.request('cancel', job_ids=job_ids, name=name)['cancelled']
+
+    def status(self, job_ids: Optional[List[int]] = None, status: Optional[List[str]] = None,
+               limit: Optional[int] = None) -> Dict[str, Any]:
+        return self.request('status', job_ids=job_ids, status=status, limit=limit)
+
+    def gpus(self, action: Optional[str] = None, cuda_ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+        """Lists the GPUs, after applying `action` (add, remove, drain, quarantine or activate) to `cuda_ids`."""
+        return self.request('gpus', action=action, cuda_ids=cuda_ids)['devices']
+
+    def shutdown(self, cancel_pending: bool = False):
+        self.request('shutdown', cancel_pending=cancel_pending)
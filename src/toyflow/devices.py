@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+from toyflow.job import Job, JobStatus
+from toyflow.resource import ResourcePool, ResourceType
+from toyflow.utils.config import build_config
+from toyflow.utils.gpu_probe import GpuProbe, get_default_gpu_probe
+
+logging.basicConfig(level=logging.INFO)
+
+
+class DeviceState(Enum):
+    ACTIVE = 'active'
+    # Running jobs finish, but no new job is placed on the device.
+    DRAINING = 'draining'
+    QUARANTINED = 'quarantined'
+    REMOVED = 'removed'
+
+
+@dataclass
+class DeviceHealthConfig:
+    # Quarantine a GPU after this many consecutive failed jobs on it; 0 disables it.
+    gpu_quarantine_after_failures: int = 0
+    # Seconds between health probes with nvidia-smi; 0 disables them.
+    gpu_health_probe_interval: float = 0.0
+
+
+@dataclass
+class Device:
+    cuda_id: int
+    state: DeviceState = DeviceState.ACTIVE
+    reason: str = ''
+    num_running: int = 0
+    consecutive_failures: int = 0
+    since: float = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'cuda_id': self.cuda_id,
+            'state': self.state.value,
+            'reason': self.reason,
+            'num_running': self.num_running,
+            'consecutive_failures': self.consecutive_failures,
+            'since': self.since,
+        }
+
+
+class DeviceManager:
+    """Tracks the state of each GPU of a pool and keeps the pool from handing out unusable ones.
+
+    Devices that are not ACTIVE stay in the pool but are hidden from `ResourcePool.allocate_all`, so their
+    running jobs release them normally, and re-activating a device makes it schedulable again.
+    """
+
+    def __init__(self, config: DeviceHealthConfig, resource_pool: ResourcePool, cuda_list: List[int],
+                 gpu_probe: Optional[GpuProbe] = None):
+        self.config = config
+        self.resource_pool = resource_pool
+        self.gpu_probe = gpu_probe
+        now = time.time()
+        self.devices: Dict[int, Device] = {cuda_id: Device(cuda_id, since=now) for cuda_id in cuda_list}
+        self._probe_task: Optional[asyncio.Task] = None
+        # Called as `listener(device)` whenever a device changes state, e.g. to wake up the dispatch loop.
+        self.listeners = []
+
+    @classmethod
+    def from_config(cls, resource_pool: ResourcePool, cuda_list: List[int], **kwargs):
+        config = build_config(DeviceHealthConfig, **kwargs)
+        gpu_probe = get_default_gpu_probe() if config.gpu_health_probe_interval > 0 else None
+        return cls(config, resource_pool, cuda_list, gpu_probe=gpu_probe)
+
+    def _get(self, cuda_id: int) -> Device:
+        device = self.devices.get(int(cuda_id))
+        if device is None:
+            raise KeyError(f'Unknown GPU {cuda_id}.')
+        return device
+
+    def _set_state(self, device: Device, state: DeviceState, reason: str = ''):
+        if device.state == state and device.reason == reason:
+            return
+        device.state, device.reason, device.since = state, reason, time.time()
+        if state == DeviceState.ACTIVE:
+            device.consecutive_failures = 0
+            self.resource_pool.unschedulable.discard(device.cuda_id)
+        else:
+            self.resource_pool.unschedulable.add(device.cuda_id)
+        level = logging.INFO if state in (DeviceState.ACTIVE, DeviceState.DRAINING) else logging.WARNING
+        logging.log(level, f'GPU {device.cuda_id} is {state.value}' + (f': {reason}' if reason else ''))
+        for listener in self.listeners:
+            listener(device)
+
+    def add(self, cuda_id: int):
+        """Adds a new GPU to the pool, or re-activates a removed one."""
+        cuda_id = int(cuda_id)
+        device = self.devices.get(cuda_id)
+        if device is None:
+            device = self.devices[cuda_id] = Device(cuda_id, since=time.time())
+            self.resource_pool.add_device(ResourceType.CUDA, cuda_id)
+            logging.info(f'GPU {cuda_id} is added')
+            for listener in self.listeners:
+                listener(device)
+        else:
+            self._set_state(device, DeviceState.ACTIVE)
+
+    def remove(self, cuda_id: int):
+        """Stops placing jobs on the GPU. Jobs running on it are not interrupted."""
+        self._set_state(self._get(cuda_id), DeviceState.REMOVED)
+
+    def drain(self, cuda_id: int):
+        self._set_state(self._get(cuda_id), DeviceState.DRAINING)
+
+    def quarantine(self, cuda_id: int, reason: str = 'manual'):
+        self._set_state(self._get(cuda_id), DeviceState.QUARANTINED, reason)
+
+    def activate(self, cuda_id: int):
+        """Returns a drained or quarantined GPU to service."""
+        self._set_state(self._get(cuda_id), DeviceState.ACTIVE)
+
+    def num_active(self) -> int:
+        return sum(1 for device in self.devices.values() if device.state == DeviceState.ACTIVE)
+
+    def as_list(self) -> List[Dict[str, Any]]:
+        return [device.as_dict() for device in self.devices.values()]
+
+    def on_job_start(self, job: Job):
+        for cuda_id in job._resource.get_cuda_ids():
+            if cuda_id in self.devices:
+                self.devices[cuda_id].num_running += 1
+
+    def on_job_end(self, job: Job):
+        threshold = self.config.gpu_quarantine_after_failures
+        # Only jobs that held a GPU on their own say something about it, and jobs killed for their memory limit
+        # or for hanging are failed by their own behavior.
+        exclusive = set(job._resource[ResourceType.CUDA]) if ResourceType.CUDA in job._resource else set()
+        counts = not isinstance(job.exception, (MemoryError, TimeoutError))
+        for cuda_id in job._resource.get_cuda_ids():
+            device = self.devices.get(cuda_id)
+            if device is None:
+                continue
+            device.num_running -= 1
+            if cuda_id not in exclusive:
+                continue
+            if job.status == JobStatus.FINISHED:
+                device.consecutive_failures = 0
+            elif job.status == JobStatus.FAILED and counts:
+                device.consecutive_failures += 1
+                if (threshold > 0 and device.consecutive_failures >= threshold
+                        and device.state == DeviceState.ACTIVE):
+                    if self.num_active() <= 1:
+                        # Failing everywhere points at the jobs rather than the devices.
+                        logging.warning(f'GPU {cuda_id} failed {device.consecutive_failures} jobs in a row, '
+                                        'but is the last active GPU and stays in service')
+                        continue
+                    self.quarantine(cuda_id, f'{device.consecutive_failures} consecutive failed jobs')
+
+    def start(self):
+        if self.gpu_probe is not None and self.config.gpu_health_probe_interval > 0:
+            self._probe_task = asyncio.get_running_loop().create_task(self._run_probe())
+
+    async def stop(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except asyncio.CancelledError:
+                pass
+            self._probe_task = None
+
+    def check_health(self, stats: Dict[int, Any]):
+        # An empty result means the probe itself failed, which says nothing about single devices.
+        if not stats:
+            return
+        for cuda_id, device in self.devices.items():
+            if device.state in (DeviceState.ACTIVE, DeviceState.DRAINING) and cuda_id not in stats:
+                self.quarantine(cuda_id, 'failed health probe')
+
+    async def _run_probe(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.config.gpu_health_probe_interval)
+            try:
+                stats = await loop.run_in_executor(None, self.gpu_probe.query)
+            except Exception as e:
+                logging.warning(f'GPU health probe failed: {e!r}')
+                continue
+            self.check_health(stats)
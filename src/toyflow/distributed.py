@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import os
+import socket
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from toyflow.job import Job
+from toyflow.utils.config import build_config
+
+logging.basicConfig(level=logging.INFO)
+
+
+@dataclass
+class DistributedConfig:
+    # Rendezvous ports of `Job(distributed=True)` jobs are taken from this range, both ends included.
+    distributed_port_range: Tuple[int, int] = (29500, 29999)
+    # MASTER_ADDR of distributed jobs; all of their ranks run on this host.
+    distributed_master_addr: str = '127.0.0.1'
+
+
+def is_port_free(port: int, host: str = '') -> bool:
+    """Whether a server could listen on `port`, with SO_REUSEADDR as torch's rendezvous store does."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind((host, port))
+        except OSError:
+            return False
+    return True
+
+
+class PortAllocator:
+    """Hands out rendezvous ports from `distributed_port_range`, one per running distributed job.
+
+    A port is only handed out if nothing listens on it, so launchers of other processes on the host are
+    skipped once their jobs have bound their ports. Each launcher starts at a different point of the range, so
+    that jobs that start at the same time on the host rarely get the same port before binding it.
+    """
+
+    config_cls = DistributedConfig
+
+    @classmethod
+    def from_config(cls, **kwargs):
+        return cls(build_config(cls.config_cls, **kwargs))
+
+    def __init__(self, config: DistributedConfig):
+        first, last = config.distributed_port_range
+        if not 0 < first <= last < 65536:
+            raise ValueError(f'Invalid distributed_port_range: {config.distributed_port_range}')
+        self.config = config
+        self.ports: Dict[Job, int] = {}
+        self._next = first + os.getpid() % (last - first + 1)
+
+    def reserve(self, job: Job) -> Optional[int]:
+        """A free port for `job`, which it holds until `release`; None if the range is exhausted."""
+        if job in self.ports:
+            return self.ports[job]
+        first, last = self.config.distributed_port_range
+        held = set(self.ports.values())
+        for i in range(last - first + 1):
+            port = first + (self._next - first + i) % (last - first + 1)
+            if port not in held and is_port_free(port):
+                self.ports[job] = port
+                self._next = port + 1
+                return port
+        return None
+
+    def release(self, job: Job):
+        self.ports.pop(job, None)
+
+
+def get_rank_envs(env: Dict[str, str], cuda_ids: Sequence[int], master_addr: str, port: int) -> List[Dict[str, str]]:
+    """Environments of the ranks of a job on `cuda_ids`, one per GPU, as `torchrun` would set them.
+
+    Every rank sees all the GPUs of the job, so that NCCL can use peer-to-peer between them, and picks its own
+    with `LOCAL_RANK`.
+    """
+    world_size = len(cuda_ids)
+    return [{
+        **env,
+        'MASTER_ADDR': master_addr,
+        'MASTER_PORT': str(port),
+        'WORLD_SIZE': str(world_size),
+        'RANK': str(rank),
+        'LOCAL_RANK': str(rank),
+        'LOCAL_WORLD_SIZE': str(world_size),
+    } for rank in range(world_size)]
+
+
+class ProcessGang:
+    """The rank processes of a distributed job, which the launcher waits for and kills as a single process.
+
+    When a rank fails, the others are killed with `kill`, since they would otherwise hang in their next
+    collective. The gang's return code is the one of the first rank that failed, or 0.
+    """
+
+    def __init__(self, processes: List[asyncio.subprocess.Process], kill: Callable[[object], None]):
+        self.processes = processes
+        self.kill = kill
+        self.failed_rank: Optional[int] = None
+        self._returncode = 0
+
+    @property
+    def pid(self) -> int:
+        return self.processes[0].pid
+
+    @property
+    def pids(self) -> List[int]:
+        return [process.pid for process in self.processes]
+
+    @property
+    def returncode(self) -> Optional[int]:
+        if any(process.returncode is None for process in self.processes):
+            return None
+        return self._returncode
+
+    async def wait(self) -> int:
+        tasks = {asyncio.ensure_future(process.wait()): rank for rank, process in enumerate(self.processes)}
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    returncode = task.result()
+                    if returncode != 0 and self.failed_rank is None:
+                        self.failed_rank, self._returncode = tasks[task], returncode
+                        if pending:
+                            logging.warning(f'Rank {tasks[task]} exited with {returncode}; stopping the others.')
+                        for process in self.processes:
+                            if process.returncode is None:
+                                self.kill(process)
+        finally:
+            for task in pending:
+                task.cancel()
+        return self.returncode
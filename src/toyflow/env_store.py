@@ -0,0 +1,172 @@
+import hashlib
+import json
+import logging
+import os
+import site
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from toyflow.utils.json_util import load_json, write_text
+from toyflow.utils.python_env import (get_conda_env_info,
+                                      get_pip_editable_packages)
+
+logging.basicConfig(level=logging.INFO)
+
+DEFAULT_ENV_STORE = os.path.join(os.path.expanduser('~'), '.toyflow', 'env_snapshots')
+# A dict with only this key stands for the snapshot with that hash in the per-job files.
+SNAPSHOT_KEY = '$snapshot'
+# Where `LoggingCallback` writes a job's environment info under its log dir, by default.
+DEFAULT_LOG_FOLDER_NAME = '.job-log'
+DEFAULT_ENV_FILENAME = 'job_env.json'
+
+
+def canonical_json(obj: Any) -> str:
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'), default=str)
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EnvStore:
+    """Content-addressed JSON snapshots: each distinct object is written once, named by the SHA-256 of its content.
+
+    Objects never change once written, so any number of launchers, also on other hosts, can share a store.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def _object_path(self, digest: str) -> Path:
+        return self.root / 'objects' / digest[:2] / f'{digest}.json'
+
+    def _index_path(self, fingerprint: Dict[str, Any]) -> Path:
+        return self.root / 'index' / f'{_sha256(canonical_json(fingerprint))}.json'
+
+    def put(self, obj: Any) -> str:
+        text = canonical_json(obj)
+        digest = _sha256(text)
+        path = self._object_path(digest)
+        if not path.exists():
+            write_text(text, path, atomic=True)
+        return digest
+
+    def get(self, digest: str) -> Any:
+        return load_json(self._object_path(digest))
+
+    def lookup(self, fingerprint: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The entry remembered for `fingerprint`, if its snapshots are still in the store."""
+        try:
+            entry = load_json(self._index_path(fingerprint))
+        except (OSError, ValueError):
+            return None
+        if not self._object_path(entry['conda']).exists():
+            return None
+        return entry
+
+    def remember(self, fingerprint: Dict[str, Any], entry: Dict[str, Any]):
+        write_text(canonical_json(entry), self._index_path(fingerprint), atomic=True)
+
+
+def get_env_fingerprint() -> Dict[str, Any]:
+    """Cheaply identifies the installed packages: installing or removing one changes the mtime of
+    `conda-meta` or of a `site-packages` directory."""
+    prefix = os.environ.get('CONDA_PREFIX') or sys.prefix
+    dirs = [Path(prefix, 'conda-meta')]
+    if hasattr(site, 'getsitepackages'):
+        dirs.extend(Path(path) for path in site.getsitepackages())
+    dirs.append(Path(site.getusersitepackages()))
+    mtimes = {}
+    for path in dirs:
+        try:
+            mtimes[path.as_posix()] = path.stat().st_mtime_ns
+        except OSError:
+            continue
+    return {'prefix': prefix, 'executable': sys.executable, 'mtimes': mtimes}
+
+
+def _run_or_error(fn):
+    try:
+        return fn()
+    except (OSError, ValueError, subprocess.CalledProcessError) as e:
+        logging.warning(f'Failed to capture the environment with {fn.__name__}: {e!r}')
+        return {'error': repr(e)}
+
+
+def _is_error(result: Any) -> bool:
+    return isinstance(result, dict) and set(result) == {'error'}
+
+
+class EnvSnapshots:
+    """The parts of a job's environment info that are shared by many jobs, kept in an `EnvStore`.
+
+    `conda env export` and the list of editable pip packages only run when the fingerprint of the installed
+    packages is new, so later jobs and later runs reuse the same snapshot.
+    """
+
+    def __init__(self, store: EnvStore):
+        self.store = store
+        self._cached: Optional[Tuple[Dict[str, Any], Dict[str, Any]]] = None
+        self._conda_info: Optional[Tuple[str, Any]] = None
+
+    def _get_entry(self) -> Dict[str, Any]:
+        fingerprint = get_env_fingerprint()
+        if self._cached is not None and self._cached[0] == fingerprint:
+            return self._cached[1]
+        entry = self.store.lookup(fingerprint)
+        if entry is None:
+            conda_info = _run_or_error(get_conda_env_info)
+            editable_packages = _run_or_error(get_pip_editable_packages)
+            entry = {
+                'conda': self.store.put(conda_info),
+                'pip_editable_packages': editable_packages if isinstance(editable_packages, list) else [],
+            }
+            if _is_error(conda_info) or _is_error(editable_packages):
+                # A failed capture may be transient, so later runs try again rather than reuse it.
+                logging.warning('The environment snapshot is incomplete, so it is only used by this run.')
+            else:
+                self.store.remember(fingerprint, entry)
+        self._cached = (fingerprint, entry)
+        return entry
+
+    def ref(self, obj: Any) -> Dict[str, str]:
+        return {SNAPSHOT_KEY: self.store.put(obj)}
+
+    def conda_ref(self) -> Dict[str, str]:
+        return {SNAPSHOT_KEY: self._get_entry()['conda']}
+
+    def conda_info(self) -> Any:
+        digest = self._get_entry()['conda']
+        if self._conda_info is None or self._conda_info[0] != digest:
+            self._conda_info = (digest, self.store.get(digest))
+        return self._conda_info[1]
+
+    def editable_packages(self) -> List[Dict[str, Any]]:
+        return self._get_entry()['pip_editable_packages']
+
+
+def resolve_snapshots(obj: Any, store: EnvStore) -> Any:
+    """Replaces the snapshot references in `obj` with the snapshots."""
+    if isinstance(obj, dict):
+        if len(obj) == 1 and SNAPSHOT_KEY in obj:
+            return store.get(obj[SNAPSHOT_KEY])
+        return {key: resolve_snapshots(value, store) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [resolve_snapshots(value, store) for value in obj]
+    return obj
+
+
+def load_env_info(path, store_root=None, log_folder_name: str = DEFAULT_LOG_FOLDER_NAME,
+                  env_filename: str = DEFAULT_ENV_FILENAME) -> Dict[str, Any]:
+    """Reads a `job_env.json`, or the one in a job's log dir, with the full content of its snapshots.
+
+    `log_folder_name` and `env_filename` are the ones `LoggingCallback` was configured with.
+    """
+    path = Path(path)
+    if path.is_dir():
+        path = path / log_folder_name / env_filename
+    info = load_json(path)
+    store = EnvStore(store_root or info.get('env_store') or DEFAULT_ENV_STORE)
+    return resolve_snapshots(info, store)
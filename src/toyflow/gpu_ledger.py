@@ -0,0 +1,232 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from toyflow.utils.config import build_config
+from toyflow.utils.proc_stats import get_process_start_time
+
+logging.basicConfig(level=logging.INFO)
+
+DEFAULT_GPU_LEDGER = '/dev/shm/toyflow-gpu-ledger.json' if os.path.isdir('/dev/shm') \
+    else '/var/tmp/toyflow-gpu-ledger.json'
+# Quantity of a whole GPU, as in the launcher's `ResourcePool`.
+GPU_CAPACITY = 1.0
+
+
+@dataclass
+class GpuLedgerConfig:
+    # Share the GPUs of the host with the launchers of other processes and users through `gpu_ledger_path`.
+    use_gpu_ledger: bool = False
+    gpu_ledger_path: str = DEFAULT_GPU_LEDGER
+
+
+def _is_alive(pid: int, start_time: Optional[int]) -> bool:
+    actual = get_process_start_time(pid)
+    return actual is not None and (start_time is None or actual == start_time)
+
+
+class GpuLedger:
+    """Host-wide record of which process holds which GPUs, in a JSON file guarded by `flock`.
+
+    Each entry is `{"pid", "start_time", "cuda_id", "quantity", "label"}`. Entries of processes that are gone,
+    or whose pid now belongs to another process, are dropped at the next write. Waiting launchers listen on
+    Unix datagram sockets in `<path>.d`, and are sent a datagram whenever GPUs are released, so they do not
+    need to poll the file.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.notify_dir = Path(f'{self.path}.d')
+        self.pid = os.getpid()
+        self.start_time = get_process_start_time(self.pid)
+        self._socket: Optional[socket.socket] = None
+        self._socket_path: Optional[Path] = None
+        self._cache_key = None
+        self._cache_entries: List[dict] = []
+
+    def _open(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            # Writable by the launchers of other users; the umask may have removed that.
+            if os.fstat(fd).st_uid == os.getuid():
+                os.fchmod(fd, 0o666)
+        except OSError:
+            pass
+        return os.fdopen(fd, 'r+', encoding='utf-8')
+
+    @staticmethod
+    def _read(f) -> List[dict]:
+        f.seek(0)
+        text = f.read()
+        if not text.strip():
+            return []
+        try:
+            return json.loads(text)
+        except ValueError:
+            logging.warning('The GPU ledger is corrupt and is reset.')
+            return []
+
+    def _update(self, fn: Callable[[List[dict]], Optional[List[dict]]]):
+        """Calls `fn` with the live entries under an exclusive lock, and saves what it returns, if not None."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._open() as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            entries = self._read(f)
+            live = [entry for entry in entries if _is_alive(entry['pid'], entry.get('start_time'))]
+            result = fn(live)
+            if result is None and len(live) < len(entries):
+                result = live
+            if result is not None:
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(result))
+                f.flush()
+        if len(live) < len(entries):
+            dead = sorted({entry['pid'] for entry in entries} - {entry['pid'] for entry in live})
+            logging.info(f'Dropped the GPUs of exited processes {dead} from {self.path}')
+            self.notify()
+
+    def entries(self) -> List[dict]:
+        """The entries of live processes. The file is only read again after it changed."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return []
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if key != self._cache_key:
+            with self._open() as f:
+                fcntl.flock(f, fcntl.LOCK_SH)
+                self._cache_entries = self._read(f)
+            self._cache_key = key
+        return [entry for entry in self._cache_entries if _is_alive(entry['pid'], entry.get('start_time'))]
+
+    def used_by_others(self) -> Dict[int, float]:
+        used: Dict[int, float] = {}
+        for entry in self.entries():
+            if entry['pid'] != self.pid:
+                used[entry['cuda_id']] = used.get(entry['cuda_id'], 0.0) + entry['quantity']
+        return used
+
+    def reserve(self, quantities: Dict[int, float], label: str = '') -> bool:
+        """Records `quantities` of GPUs as held by this process; False, with nothing recorded, if another
+        process holds too much of one of them."""
+        if not quantities:
+            return True
+
+        reserved = False
+
+        def add(entries: List[dict]):
+            nonlocal reserved
+            used: Dict[int, float] = {}
+            for entry in entries:
+                used[entry['cuda_id']] = used.get(entry['cuda_id'], 0.0) + entry['quantity']
+            if any(used.get(cuda_id, 0.0) + quantity > GPU_CAPACITY + 1e-9
+                   for cuda_id, quantity in quantities.items()):
+                return None
+            reserved = True
+            now = time.time()
+            return entries + [
+                {'pid': self.pid, 'start_time': self.start_time, 'cuda_id': cuda_id, 'quantity': quantity,
+                 'label': label, 'since': now}
+                for cuda_id, quantity in quantities.items()
+            ]
+
+        self._update(add)
+        return reserved
+
+    def release(self, quantities: Dict[int, float]):
+        if not quantities:
+            return
+        remaining = dict(quantities)
+
+        def remove(entries: List[dict]):
+            result = []
+            for entry in entries:
+                quantity = remaining.get(entry['cuda_id'], 0.0)
+                if entry['pid'] == self.pid and quantity >= entry['quantity'] - 1e-9:
+                    remaining[entry['cuda_id']] = quantity - entry['quantity']
+                    continue
+                result.append(entry)
+            return result
+
+        self._update(remove)
+        self.notify()
+
+    def release_all(self):
+        self._update(lambda entries: [entry for entry in entries if entry['pid'] != self.pid])
+        self.notify()
+
+    def listen(self, on_release: Callable[[], None]):
+        """Calls `on_release` on the running loop whenever another process releases GPUs."""
+        self.notify_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            if self.notify_dir.stat().st_uid == os.getuid():
+                # Like /tmp: anyone may add a socket, but only remove their own.
+                os.chmod(self.notify_dir, 0o1777)
+        except OSError:
+            pass
+        path = self.notify_dir / f'{self.pid}-{uuid.uuid4().hex[:8]}.sock'
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(str(path))
+        os.chmod(path, 0o666)
+        sock.setblocking(False)
+
+        def on_readable():
+            try:
+                while True:
+                    sock.recv(64)
+            except BlockingIOError:
+                pass
+            on_release()
+
+        asyncio.get_running_loop().add_reader(sock.fileno(), on_readable)
+        self._socket, self._socket_path = sock, path
+
+    def notify(self):
+        """Wakes up the launchers waiting for GPUs; sockets of exited launchers are removed."""
+        try:
+            paths = list(self.notify_dir.glob('*.sock'))
+        except OSError:
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.setblocking(False)
+            for path in paths:
+                if path == self._socket_path:
+                    continue
+                try:
+                    sock.sendto(b'1', str(path))
+                except (ConnectionRefusedError, FileNotFoundError):
+                    try:
+                        path.unlink()
+                    except OSError:
+                        pass
+                except OSError:
+                    # A full queue already has a wake-up in it.
+                    continue
+
+    def close(self):
+        if self._socket is not None:
+            try:
+                asyncio.get_running_loop().remove_reader(self._socket.fileno())
+            except RuntimeError:
+                pass
+            self._socket.close()
+            self._socket_path.unlink(missing_ok=True)
+            self._socket = self._socket_path = None
+        self.release_all()
+
+
+def build_gpu_ledger(**kwargs) -> Optional[GpuLedger]:
+    config = build_config(GpuLedgerConfig, **kwargs)
+    if not config.use_gpu_ledger:
+        return None
+    logging.info(f'Sharing GPUs with other launchers on this host through {config.gpu_ledger_path}')
+    return GpuLedger(config.gpu_ledger_path)
@@ -6,24 +6,32 @@ from dataclasses import dataclass, field
 from enum import IntEnum
 from pathlib import Path
 from typing import Any, Callable, Dict, List, Optional, Union
-from unittest.mock import Mock
 
 from toyflow.resource import Resource
 
 logging.basicConfig(level=logging.INFO)
 
 
+def _noop(*args, **kwargs):
+    pass
+
+
 class JobStatus(IntEnum):
     PENDING = 0
     LAUNCHING = 1
     RUNNING = 2
     FAILED = 3
     FINISHED = 4
+    CANCELLED = 5
+    PREPARING = 6
+    PREPARED = 7
+    # Killed by the watchdog for a lack of output, before it is failed or restarted.
+    HUNG = 8
 
 
 @dataclass
 class Job:
-    cmd: Union[str, List[Any]]
+    cmd: Union[str, List[Any], None] = None
     cwd: Union[str, Path, os.PathLike] = '.'
     log_dir: Union[str, Path, os.PathLike] = '.'
     job_name: Optional[str] = None
@@ -35,6 +43,20 @@ class Job:
     status: JobStatus = JobStatus.PENDING
     extra_info: Dict[str, Any] = field(default_factory=dict)
     apply_shlex_parsing_for_cmd: bool = True
+    fn: Optional[Callable] = None
+    fn_args: Optional[tuple] = None
+    fn_kwargs: Optional[Dict[str, Any]] = None
+    # Quantities of other resources of the launcher's `resource_capacities`, e.g. `{'ram_gb': 64, 'license': 1}`.
+    resources: Dict[str, float] = field(default_factory=dict)
+    # May run next to another job on a GPU that has headroom, when the launcher packs GPUs; see `toyflow.packing`.
+    packable: bool = False
+    # Host memory the job needs, in GB; it only starts when the host can spare that much, and is limited to it.
+    host_memory_gb: Optional[float] = None
+    # A results file or glob relative to `log_dir`, e.g. 'eval/*.json', collected when the job ends; see
+    # `toyflow.results`.
+    results: Optional[str] = None
+    # Runs `cmd` once per GPU, as the ranks of a torch.distributed job; see `toyflow.distributed`.
+    distributed: bool = False
     _stdout = sys.stdout
     _stderr = sys.stderr
     _resource: Resource = field(default_factory=Resource)
@@ -42,6 +64,14 @@ class Job:
     _pid: int = -1
     _start_time: str = ''
     _end_time: str = ''
+    _result: Any = None
+    _exception: Optional[BaseException] = None
+    _usage: Dict[str, Any] = field(default_factory=dict)
+    _cancel_requested: bool = False
+    # Set when a packed job is evicted, to put it back in the queue instead of ending it.
+    _requeue_requested: bool = False
+    _runtime_key: Optional[str] = None
+    _expected_runtime: Optional[float] = None
 
     def __post_init__(self):
         self.cwd = Path(self.cwd).resolve()
@@ -49,7 +79,13 @@ class Job:
         self._env_str = '<from parent>' if self.env is None else "<customized>"
         self.env = self.env or os.environ.copy()
         self.job_name = str(self.job_name) if self.job_name else None
-        self.prepare_fn = self.prepare_fn or Mock()
+        self.prepare_fn = self.prepare_fn or _noop
+
+        if self.cmd is None:
+            assert self.fn is not None, "Either `cmd` or `fn` must be provided."
+            # Only used for display; callable jobs never go through the shell.
+            self.cmd = ['python-callable',
+                        f'{getattr(self.fn, "__module__", "?")}.{getattr(self.fn, "__qualname__", repr(self.fn))}']
 
         if not self.apply_shlex_parsing_for_cmd:
             assert isinstance(self.cmd, str), \
@@ -60,9 +96,38 @@ class Job:
                 "as the command to run in shell. Use with care."
             ))
 
+        for name, quantity in self.resources.items():
+            assert name not in ('cpu', 'cuda', 'cuda_share'), \
+                "Use `cuda_quantity` and `cpu_quantity` for CPUs and GPUs."
+            assert quantity > 0, f"The quantity of {name} must be positive."
+
+        assert not (self.distributed and self.is_callable), "Callable jobs cannot be distributed."
+
+        assert self.host_memory_gb is None or self.host_memory_gb > 0, "host_memory_gb must be positive."
+
         # Call these two methods to check if the cmd is valid.
         self.cmd_list, self.cmd_str
 
+    @property
+    def needs_prepare(self) -> bool:
+        """Whether `prepare_fn` has to run before the job is dispatched."""
+        return self.prepare_fn is not _noop
+
+    @property
+    def is_callable(self) -> bool:
+        """Whether the job runs `fn` on a pool worker instead of `cmd` in a shell."""
+        return self.fn is not None
+
+    @property
+    def result(self) -> Any:
+        """Return value of `fn` for callable jobs."""
+        return self._result
+
+    @property
+    def exception(self) -> Optional[BaseException]:
+        """Exception raised by `fn` for callable jobs, if any."""
+        return self._exception
+
     @property
     def cmd_str(self) -> str:
         """Returns the command as a single string."""
@@ -1,17 +1,47 @@
 import asyncio
+import functools
 import logging
+import signal
 import sys
-from typing import List, Optional
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Union
 
 from toyflow.callbacks import (Callback, CompositeCallback, LoggingCallback,
-                               RichCallback, WebCallback)
+                               MetricsCallback, RichCallback,
+                               StatusStoreCallback, WebCallback)
+from toyflow.devices import Device, DeviceManager
+from toyflow.distributed import PortAllocator, ProcessGang, get_rank_envs
+from toyflow.gpu_ledger import build_gpu_ledger
 from toyflow.job import Job, JobStatus
+from toyflow.memory import MemoryGuard
+from toyflow.packing import GpuPacker
+from toyflow.prepare import JobPreparer
 from toyflow.resource import Resource, ResourceItem, ResourcePool, ResourceType
-from toyflow.scheduler import JobScheduler
+from toyflow.runtime import RuntimeEstimator
+from toyflow.scheduler import (QUEUED_STATUSES, JobScheduler, SchedulerConfig,
+                               is_ready)
+from toyflow.telemetry import ResourceSampler
+from toyflow.topology import build_gpu_placement
+from toyflow.tracing import CALLBACK_TID, build_tracer
+from toyflow.utils.config import build_config
+from toyflow.utils.proc_stats import get_process_tree, signal_pids
+from toyflow.watchdog import Watchdog
+from toyflow.worker_pool import WorkerPool
 
 logging.basicConfig(level=logging.INFO)
 
 
+@dataclass
+class LauncherConfig:
+    # Keep running when all jobs are done and wait for `add_jobs`, until `stop` is called.
+    keep_alive: bool = False
+    # Seconds between SIGTERM and SIGKILL when a running job is cancelled.
+    cancel_grace_period: float = 10.0
+    # Capacities of other resources that jobs declare in `Job.resources`, e.g. `{'ram_gb': 512, 'license': 4}`.
+    # A dict of capacities by id, e.g. `{'nvme_gb': {0: 900, 1: 900}}`, makes a job take its quantity from one.
+    resource_capacities: Optional[Dict[str, Union[float, Dict[int, float]]]] = None
+
+
 class Launcher:
     def __init__(
         self,
@@ -20,62 +50,414 @@ class Launcher:
         callbacks: Optional[List[Callback]] = None,
         **kwargs,
     ):
+        self.config = build_config(LauncherConfig, **kwargs)
+        self.cuda_list = [int(cuda_id) for cuda_id in cuda_list]
         resource_items = [ResourceItem(ResourceType.CPU, 0, float('inf'))]
         for cuda_id in cuda_list:
             resource_items.append(ResourceItem(
                 ResourceType.CUDA, int(cuda_id), 1.0
             ))
-        self.resource_pool = ResourcePool(resource_items)
+        self.packer = self._build_packer(**kwargs)
+        if self.packer.enabled:
+            for cuda_id in cuda_list:
+                resource_items.append(ResourceItem(
+                    ResourceType.CUDA_SHARE, int(cuda_id), self.packer.config.packing_max_jobs_per_gpu))
+        # The largest quantity of each other resource that a single job can get.
+        self.resource_capacities: Dict[ResourceType, float] = {}
+        for name, capacity in (self.config.resource_capacities or {}).items():
+            rtype = ResourceType(name)
+            capacities = capacity if isinstance(capacity, dict) else {0: capacity}
+            for rid, quantity in capacities.items():
+                resource_items.append(ResourceItem(rtype, int(rid), float(quantity)))
+            self.resource_capacities[rtype] = max(map(float, capacities.values()), default=0.0)
+        self.resource_pool = ResourcePool(resource_items, ledger=build_gpu_ledger(**kwargs))
+        self.devices = DeviceManager.from_config(self.resource_pool, self.cuda_list, **kwargs)
+        self.devices.listeners.append(self._on_device_change)
+        self.gpu_placement = build_gpu_placement(**kwargs)
 
-        all_callbacks = [
-            LoggingCallback.from_config(**kwargs),
-            RichCallback.from_config(**kwargs),
-            WebCallback.from_config(**kwargs),
-        ]
+        all_callbacks = self._build_default_callbacks(**kwargs)
         if callbacks:
             all_callbacks.extend(callbacks)
 
         self.callback: CompositeCallback = CompositeCallback(
             callbacks=all_callbacks)
-        self.job_scheduler = JobScheduler(jobs)
+        self.tracer = build_tracer(**kwargs)
+        if self.tracer.enabled:
+            self.callback.hook_observers.append(self._trace_hook)
+            self._traced_gpu_jobs = {cuda_id: 0 for cuda_id in self.cuda_list}
+        self.callback.set_launcher(self)
+        self.runtime_estimator = RuntimeEstimator.from_config(**kwargs)
+        self.job_scheduler = JobScheduler(
+            jobs, policy=build_config(SchedulerConfig, **kwargs).scheduling_policy,
+            runtime_estimator=self.runtime_estimator)
+        self.worker_pool = WorkerPool.from_config(**kwargs)
+        self.preparer = JobPreparer.from_config(len(self.cuda_list), **kwargs)
+        self.preparer.on_done = self._on_prepared
+        self.resource_sampler = ResourceSampler.from_config(**kwargs)
+        self.watchdog = Watchdog.from_config(self._kill_process, self.resource_sampler, **kwargs)
+        self.memory_guard = MemoryGuard.from_config(**kwargs)
+        self.port_allocator = PortAllocator.from_config(**kwargs)
         self.resource_release_event = asyncio.Event()
+        self.packer.listeners.append(self.resource_release_event.set)
+        self._keep_alive = self.config.keep_alive
+        self._processes: Dict[Job, object] = {}
+        self._futures: Dict[Job, asyncio.Future] = {}
+        self._started = False
+        self._closed = False
+        self._run_task: Optional[asyncio.Task] = None
+        # Jobs already warned about in `_check_unsatisfiable_jobs`.
+        self._unsatisfiable_jobs = set()
+
+    def _build_default_callbacks(self, **kwargs) -> List[Callback]:
+        self.metrics = MetricsCallback.from_config(**kwargs)
+        return [
+            LoggingCallback.from_config(**kwargs),
+            RichCallback.from_config(**kwargs),
+            WebCallback.from_config(**kwargs),
+            StatusStoreCallback.from_config(**kwargs),
+            self.metrics,
+        ]
+
+    def _build_packer(self, **kwargs) -> GpuPacker:
+        return GpuPacker.from_config(self._evict_packed_job, **kwargs)
+
+    def _split_for_job(self, available_resource: Resource, job: Job) -> Optional[Resource]:
+        if self.gpu_placement is None:
+            requirement = {ResourceType.CUDA: [1.0] * job.cuda_quantity}
+            if job.resources:
+                requirement.update(self._other_requirement(job))
+            return available_resource.split(requirement)
+        free_cuda_ids = [
+            rid for rid, quantity in available_resource[ResourceType.CUDA].items() if quantity >= 1.0
+        ]
+        cuda_ids = self.gpu_placement.choose(free_cuda_ids, job.cuda_quantity)
+        if cuda_ids is None:
+            return None
+        allocated = available_resource.split_ids(
+            {ResourceType.CUDA: {cuda_id: 1.0 for cuda_id in cuda_ids}})
+        if allocated is not None and job.resources:
+            others = available_resource.split(self._other_requirement(job))
+            allocated = None if others is None else allocated.add_(others)
+        return allocated
+
+    def _pack_next_job(self, available_resource: Resource):
+        """Picks a ready packable job and a busy GPU with headroom to run it on, next to the jobs there."""
+        free_cuda_ids = available_resource[ResourceType.CUDA]
+        cuda_ids = [
+            cuda_id for cuda_id, quantity in available_resource[ResourceType.CUDA_SHARE].items()
+            if quantity >= 1.0 and cuda_id not in free_cuda_ids and cuda_id not in self.resource_pool.unschedulable
+            and cuda_id in self.devices.devices and self.devices.devices[cuda_id].num_running > 0
+        ]
+        cuda_id = self.packer.choose(cuda_ids, asyncio.get_running_loop().time())
+        if cuda_id is None:
+            return None, None
+        for job in self.job_scheduler.queued_jobs():
+            if (job.packable and job.cuda_quantity == 1 and not job.resources and is_ready(job)
+                    and self.memory_guard.admits(job)):
+                gpu = self.packer.stats[cuda_id]
+                logging.info(f'Packing job {job.job_name} onto GPU {cuda_id} ({gpu.utilization:.0f}%, '
+                             f'{gpu.memory_used_mb:.0f}/{gpu.memory_total_mb:.0f} MB)')
+                self.packer.on_packed(job, cuda_id)
+                return job, available_resource.split_ids({ResourceType.CUDA_SHARE: {cuda_id: 1.0}})
+        return None, None
+
+    def _evict_packed_job(self, job: Job):
+        job._requeue_requested = True
+        process = self._processes.get(job)
+        if process is not None:
+            self._kill_process(process)
+
+    @staticmethod
+    def _other_requirement(job: Job) -> Dict[ResourceType, List[float]]:
+        return {ResourceType(name): [float(quantity)] for name, quantity in job.resources.items()}
+
+    async def _spawn_process(self, job: Job):
+        if job.is_callable:
+            return self.worker_pool.start_task(job)
+        if job.distributed:
+            envs = get_rank_envs(job.env, job._resource.get_cuda_ids(),
+                                 self.port_allocator.config.distributed_master_addr, self.port_allocator.ports[job])
+            processes = await asyncio.gather(*(self._spawn_shell(job, env) for env in envs))
+            return ProcessGang(list(processes), self._kill_process)
+        return await self._spawn_shell(job, job.env)
+
+    async def _spawn_shell(self, job: Job, env: Dict[str, str]) -> asyncio.subprocess.Process:
+        return await asyncio.create_subprocess_shell(
+            job.cmd_str,
+            env=env,
+            stdout=job._stdout, stderr=job._stderr,
+            cwd=job.cwd,
+            shell=True,
+            preexec_fn=self.memory_guard.get_preexec_fn(job),
+        )
+
+    def _trace_hook(self, callback: Callback, hook_name: str, start: float, end: float):
+        self.tracer.complete(f'{type(callback).__name__}.{hook_name}', start, end, tid=CALLBACK_TID)
+
+    def _trace_gpu_occupancy(self, resources: Resource, delta: int):
+        if not self.tracer.enabled:
+            return
+        for cuda_id in resources.get_cuda_ids():
+            self._traced_gpu_jobs[cuda_id] = self._traced_gpu_jobs.get(cuda_id, 0) + delta
+        self.tracer.counter('GPU occupancy', {
+            f'cuda:{cuda_id}': num_jobs for cuda_id, num_jobs in self._traced_gpu_jobs.items()
+        })
+
+    def add_jobs(self, jobs: List[Job]):
+        """Queues more jobs. Once the launcher runs, this must be called from its event loop."""
+        if self._closed:
+            raise RuntimeError('The launcher is closed.')
+        self.job_scheduler.add_jobs(jobs)
+        if self._started:
+            self.callback.on_jobs_added(jobs)
+        self.resource_release_event.set()
+
+    def submit(self, job: Job) -> "asyncio.Future[Job]":
+        """Queues `job` and returns a future that resolves to it once it has ended, whatever its status.
+
+        Cancelling the future cancels the job. Can be called from callbacks, or from any coroutine on the
+        launcher's loop, e.g. inside `async with launcher:`.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.add_jobs([job])
+        self._futures[job] = future
+        future.add_done_callback(lambda f: f.cancelled() and self.cancel_job(job))
+        return future
+
+    def _resolve_future(self, job: Job):
+        future = self._futures.pop(job, None)
+        if future is not None and not future.done():
+            future.set_result(job)
+
+    def cancel_job(self, job: Job) -> bool:
+        """Cancels a pending job, or terminates a running one. Returns False if the job has already ended."""
+        if job.status in QUEUED_STATUSES:
+            self.preparer.on_cancel(job)
+            self.job_scheduler.update_job(job, JobStatus.CANCELLED)
+            self.callback.on_job_end(job)
+            self._resolve_future(job)
+            return True
+        if job.status not in (JobStatus.LAUNCHING, JobStatus.RUNNING):
+            return False
+        job._cancel_requested = True
+        process = self._processes.get(job)
+        if process is not None:
+            self._kill_process(process)
+        return True
+
+    def stop(self, reject_new_jobs: bool = False):
+        """Lets a `keep_alive` launcher exit once its queued and running jobs are done."""
+        self._keep_alive = False
+        self._closed = self._closed or reject_new_jobs
+        self.resource_release_event.set()
+
+    async def close(self):
+        """Stops accepting jobs and waits until the queued and running ones are done."""
+        self.stop(reject_new_jobs=True)
+        if self._run_task is not None:
+            await self._run_task
+
+    async def __aenter__(self) -> "Launcher":
+        self._keep_alive = True
+        self._run_task = asyncio.create_task(self._start())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            for job in self.job_scheduler.jobs:
+                self.cancel_job(job)
+        await self.close()
+
+    def _on_prepared(self, job: Job, exception: Optional[BaseException]):
+        if exception is not None:
+            self.callback.on_job_end(job)
+            self._resolve_future(job)
+        self.resource_release_event.set()
+
+    def _exceeded_capacity(self, job: Job) -> Optional[str]:
+        if job.host_memory_gb:
+            reason = self.memory_guard.exceeds_host(job)
+            if reason is not None:
+                return reason
+        for name, quantity in job.resources.items():
+            capacity = self.resource_capacities.get(ResourceType(name), 0.0)
+            if quantity > capacity:
+                return f'needs {quantity} {name}, but at most {capacity} is available'
+        return None
+
+    def _check_unsatisfiable_jobs(self, idle: bool):
+        """Handles queued jobs that need more GPUs than are active, or more of another resource than it has.
+
+        Jobs that need too many GPUs are failed once nothing runs, since the launcher would otherwise wait
+        forever. While jobs run, or in `keep_alive` mode, GPUs may still be added or activated, so they only get
+        a warning. Other resources and host memory have fixed capacities, so those jobs are failed right away.
+        """
+        num_active = self.devices.num_active()
+        for job in self.job_scheduler.jobs:
+            if job.status not in QUEUED_STATUSES:
+                continue
+            reason = self._exceeded_capacity(job) if job.resources or job.host_memory_gb else None
+            if reason is None:
+                if job.cuda_quantity <= num_active:
+                    continue
+                reason = f'needs {job.cuda_quantity} GPUs, but only {num_active} are active'
+                if self._keep_alive or not idle:
+                    if job not in self._unsatisfiable_jobs:
+                        logging.warning(
+                            f'Job {job.job_name} {reason}; it waits until more GPUs are added or activated.')
+                        self._unsatisfiable_jobs.add(job)
+                    continue
+            logging.error(f'Job {job.job_name} failed: {reason}.')
+            self.preparer.on_cancel(job)
+            self.job_scheduler.update_job(job, JobStatus.FAILED)
+            job._exception = RuntimeError(reason)
+            self.callback.on_job_end(job)
+            self._resolve_future(job)
+
+    def _on_device_change(self, device: Device):
+        if device.cuda_id not in self.cuda_list:
+            self.cuda_list.append(device.cuda_id)
+            if self.packer.enabled:
+                self.resource_pool.add_device(
+                    ResourceType.CUDA_SHARE, device.cuda_id, self.packer.config.packing_max_jobs_per_gpu)
+        # A device may have become schedulable again.
+        self.resource_release_event.set()
+
+    def _kill_process(self, process):
+        if isinstance(process, ProcessGang):
+            for rank in process.processes:
+                self._kill_process(rank)
+            return
+        if not isinstance(process, asyncio.subprocess.Process):
+            process.terminate()
+            return
+        # Shell jobs run under `sh -c`, so signal the whole tree rather than only the shell.
+        pids = get_process_tree(process.pid)[::-1]
+        signal_pids(pids, signal.SIGTERM)
+        asyncio.get_running_loop().call_later(
+            self.config.cancel_grace_period,
+            lambda: process.returncode is None and signal_pids(pids, signal.SIGKILL),
+        )
 
     async def _run_job_and_then_release_resource(self, job: Job, resources: Resource):
         job._resource = resources
         job.env['CUDA_VISIBLE_DEVICES'] = ','.join(
             map(str, resources.get_cuda_ids())
         )
-        retries_left = 1
+        # Offset by 2 to keep the scheduler and callback tracks separate.
+        trace_tid = job._job_id + 2
+        if self.tracer.enabled:
+            self.tracer.set_track_name(trace_tid, f'job #{job._job_id} {job.job_name}')
+            self._trace_gpu_occupancy(resources, 1)
+        try:
+            await self._run_attempts(job, trace_tid)
+        except Exception as e:  # pylint: disable=broad-except
+            # E.g. a callback raised, or the command could not be spawned; the job must still end and release.
+            logging.exception(f'Job {job.job_name} failed in the launcher: {e!r}')
+            job._exception = e
+            job.status = JobStatus.FAILED
+            process = self._processes.pop(job, None)
+            if process is not None and process.returncode is None:
+                self._kill_process(process)
+            self.watchdog.unwatch(job)
+            self.resource_sampler.untrack(job)
+        finally:
+            await self._end_job(job, resources, trace_tid)
 
+    async def _run_attempts(self, job: Job, trace_tid: int):
+        retries_left = 1
+        self.worker_pool.evict_idle(job)
+        self.runtime_estimator.on_job_start(job, asyncio.get_running_loop().time())
+        self.devices.on_job_start(job)
         self.callback.on_job_start(job)
+        if job.distributed and self.port_allocator.reserve(job) is None:
+            first, last = self.port_allocator.config.distributed_port_range
+            job._exception = RuntimeError(f'No free rendezvous port in {first}-{last}')
+            logging.error(f'Job {job.job_name} failed: {job._exception}.')
+            retries_left = 0
 
         with self.callback.during_job_context(job):
-            while retries_left > 0 and job.status != JobStatus.FINISHED:
-                process = await asyncio.create_subprocess_shell(
-                    job.cmd_str,
-                    env=job.env,
-                    stdout=job._stdout, stderr=job._stderr,
-                    cwd=job.cwd,
-                    shell=True,
-                )
+            while (retries_left > 0 and job.status != JobStatus.FINISHED and not job._cancel_requested
+                   and not job._requeue_requested):
+                self.memory_guard.start_attempt(job)
+                with self.tracer.span('spawn', tid=trace_tid):
+                    process = await self._spawn_process(job)
                 job._pid = process.pid
+                self._processes[job] = process
+                if job._cancel_requested or job._requeue_requested:
+                    self._kill_process(process)
+                self.resource_sampler.track(job, process.pids if isinstance(process, ProcessGang) else process.pid)
+                self.watchdog.watch(job, process)
                 self.callback.on_process_start(job, process)
-                await process.wait()
+                with self.tracer.span('wait', tid=trace_tid, args={'pid': process.pid}):
+                    await process.wait()
+                self._processes.pop(job, None)
+                hang_reason = self.watchdog.unwatch(job)
+                self.resource_sampler.untrack(job)
+                memory_breach = self.memory_guard.get_breach(job, process.returncode)
 
+                if hang_reason is not None:
+                    job._exception = TimeoutError(hang_reason)
+                    self.callback.on_process_end(job, process)
+                    if self.watchdog.should_restart(job):
+                        logging.warning(f'Restarting hung job {job.job_name}.')
+                        job._exception = None
+                        self.job_scheduler.update_job(job, JobStatus.RUNNING)
+                    else:
+                        retries_left = 0
+                    continue
+                if memory_breach is not None:
+                    logging.error(f'Job {job.job_name} {memory_breach}.')
+                    job._exception = MemoryError(memory_breach)
+                    retries_left = 0
+                    self.callback.on_process_end(job, process)
+                    continue
                 if process.returncode == 0:
                     self.job_scheduler.update_job(job, JobStatus.FINISHED)
                 else:
                     retries_left -= 1
                 self.callback.on_process_end(job, process)
 
-            if job.status != JobStatus.FINISHED:
+            if job.status != JobStatus.FINISHED and job._cancel_requested:
+                job.status = JobStatus.CANCELLED
+            elif job.status != JobStatus.FINISHED and job._requeue_requested:
+                # Evicted from a packed GPU; it runs again from the start.
+                job.status = JobStatus.PREPARED if job.needs_prepare else JobStatus.PENDING
+                logging.warning(f'Requeued packed job {job.job_name}.')
+            elif job.status != JobStatus.FINISHED:
                 job.status = JobStatus.FAILED
                 logging.error(
                     f"Task {job.job_name} failed after retries.")
 
-        self.callback.on_job_end(job)
-        await self.resource_pool.release(resources)
-        self.resource_release_event.set()
+    async def _end_job(self, job: Job, resources: Resource, trace_tid: int):
+        requeued = job.status in QUEUED_STATUSES
+        job._requeue_requested = False
+        try:
+            self.packer.on_job_end(job)
+            self.memory_guard.release(job)
+            self.port_allocator.release(job)
+            self.runtime_estimator.on_job_end(job, asyncio.get_running_loop().time())
+            self.devices.on_job_end(job)
+            if requeued:
+                self.preparer.on_requeue(job)
+                self.callback.on_job_requeued(job)
+            else:
+                self.callback.on_job_end(job)
+        except Exception as e:  # pylint: disable=broad-except
+            logging.exception(f'Failed to end job {job.job_name}: {e!r}')
+        finally:
+            with self.tracer.span('release', tid=trace_tid):
+                await self.resource_pool.release(resources, reserved=True)
+            self._trace_gpu_occupancy(resources, -1)
+            self.resource_release_event.set()
+            if not requeued:
+                self._resolve_future(job)
+
+    @staticmethod
+    def _on_task_done(running_tasks: set, task: asyncio.Task):
+        running_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error('A job task of the launcher failed', exc_info=task.exception())
 
     async def _wait_for_next_proposal(self, timeout: float = 5):
         try:
@@ -85,31 +467,67 @@ class Launcher:
         self.resource_release_event.clear()
 
     async def _start(self):
-        running_tasks = []
+        running_tasks = set()
+        self._started = True
         self.callback.on_launcher_start(self.job_scheduler.jobs)
-        while self.job_scheduler.has_pending_jobs():
-            available_resource = await self.resource_pool.allocate_all()
-            sub_resource = None
-            job = self.job_scheduler.get_next_job(available_resource)
-            if job is not None:
-                sub_resource = available_resource.split(
-                    {ResourceType.CUDA: [1.0] * job.cuda_quantity})
+        self.resource_sampler.start()
+        self.watchdog.start()
+        self.packer.start()
+        self.devices.start()
+        if self.resource_pool.ledger is not None:
+            self.resource_pool.ledger.listen(self.resource_release_event.set)
+        # Keep dispatching while jobs run, since their callbacks may submit more.
+        while (self.job_scheduler.has_pending_jobs() or self._keep_alive
+               or not all(task.done() for task in running_tasks)):
+            if self.job_scheduler.has_jobs_to_prepare():
+                with self.tracer.span('prepare'):
+                    self.preparer.fill(self.job_scheduler.queued_jobs())
+            with self.tracer.span('dispatch'):
+                with self.tracer.span('allocate_all'):
+                    available_resource = await self.resource_pool.allocate_all()
+                sub_resource = None
+                self.memory_guard.refresh()
+                with self.tracer.span('get_next_job'):
+                    job = self.job_scheduler.get_next_job(available_resource, admit=self.memory_guard.admits)
+                if job is not None:
+                    with self.tracer.span('split'):
+                        sub_resource = self._split_for_job(available_resource, job)
+                    if sub_resource is not None and not self.resource_pool.reserve(sub_resource, str(job.job_name)):
+                        # Another launcher on the host took a GPU since `allocate_all`.
+                        sub_resource = None
+                elif self.packer.enabled:
+                    with self.tracer.span('pack'):
+                        job, sub_resource = self._pack_next_job(available_resource)
+                if sub_resource is not None:
+                    available_resource.minus_(sub_resource)
+                with self.tracer.span('release'):
+                    await self.resource_pool.release(available_resource)
             if job is None or sub_resource is None:
-                await self.resource_pool.release(available_resource)
-                await self._wait_for_next_proposal(timeout=5)
+                self._check_unsatisfiable_jobs(idle=all(task.done() for task in running_tasks))
+                with self.tracer.span('wait_for_next_proposal'):
+                    await self._wait_for_next_proposal(timeout=5)
                 continue
 
-            available_resource.minus_(sub_resource)
-            await self.resource_pool.release(available_resource)
+            self.preparer.on_dispatch(job)
+            self.memory_guard.reserve(job)
             self.job_scheduler.update_job(job, JobStatus.RUNNING)
 
             running_task = asyncio.create_task(
                 self._run_job_and_then_release_resource(job, sub_resource)
             )
-            running_tasks.append(running_task)
+            running_tasks.add(running_task)
+            running_task.add_done_callback(functools.partial(self._on_task_done, running_tasks))
 
-        await asyncio.gather(*running_tasks)
+        self.worker_pool.shutdown()
+        self.preparer.shutdown()
+        await self.resource_sampler.stop()
+        await self.watchdog.stop()
+        await self.packer.stop()
+        await self.devices.stop()
+        if self.resource_pool.ledger is not None:
+            self.resource_pool.ledger.close()
         self.callback.on_launcher_end(self.job_scheduler.jobs)
+        self.tracer.save()
 
     def start(self):
         if 'ipykernel' in sys.modules:
@@ -0,0 +1,262 @@
+import logging
+import os
+import re
+import resource
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from toyflow.job import Job
+from toyflow.utils.config import build_config
+
+logging.basicConfig(level=logging.INFO)
+
+GB = 2 ** 30
+MEMORY_LIMIT_MODES = ('auto', 'cgroup', 'rlimit', 'none')
+MEMORY_RLIMITS = {'data': resource.RLIMIT_DATA, 'as': resource.RLIMIT_AS}
+CGROUP2_ROOT = Path('/sys/fs/cgroup')
+# What programs print when a host allocation fails under an rlimit. `\bMemoryError` leaves out torch's
+# `OutOfMemoryError` for CUDA, and 'out of memory' is left out since CUDA prints it too.
+ALLOCATION_ERRORS = re.compile(r'\bMemoryError\b|Cannot allocate memory|std::bad_alloc')
+
+
+@dataclass
+class MemoryConfig:
+    # GB of MemAvailable in /proc/meminfo that is never handed to jobs with `Job.host_memory_gb`.
+    memory_headroom_gb: float = 4.0
+    # How `Job.host_memory_gb` is enforced: 'cgroup' runs each job in its own cgroup v2 with `memory.max` (and no
+    # swap), 'rlimit' sets `memory_rlimit` on each of its processes, and 'auto' uses a cgroup when it can.
+    memory_limit: str = 'auto'
+    # 'data' (RLIMIT_DATA) or 'as' (RLIMIT_AS, which also counts address space that CUDA reserves but never uses).
+    memory_rlimit: str = 'data'
+    # A cgroup v2 directory whose children may use the memory controller; defaults to the launcher's own cgroup.
+    memory_cgroup_parent: Optional[str] = None
+
+
+def read_meminfo() -> Dict[str, int]:
+    """/proc/meminfo in bytes, e.g. `MemTotal` and `MemAvailable`."""
+    result = {}
+    try:
+        with open('/proc/meminfo', 'r', encoding='utf-8') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                parts = value.split()
+                if parts:
+                    result[key] = int(parts[0]) * (1024 if parts[1:] == ['kB'] else 1)
+    except OSError:
+        pass
+    return result
+
+
+def get_own_cgroup() -> Optional[Path]:
+    """The cgroup v2 directory of this process, if cgroup v2 is mounted at /sys/fs/cgroup."""
+    if not (CGROUP2_ROOT / 'cgroup.controllers').exists():
+        return None
+    try:
+        with open('/proc/self/cgroup', 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('0::'):
+                    return CGROUP2_ROOT / line[3:].strip().lstrip('/')
+    except OSError:
+        pass
+    return None
+
+
+def _get_size(stream) -> Optional[int]:
+    """Size of the file that `stream` writes to, or None if it is not a file."""
+    path = getattr(stream, 'name', None)
+    if not isinstance(path, str) or not os.path.isfile(path):
+        return None
+    return os.path.getsize(path)
+
+
+def _read_tail(stream, start: int = 0, size: int = 4096) -> str:
+    """At most the last `size` bytes after `start` of the file that `stream` writes to, or '' if it is not a file."""
+    path = getattr(stream, 'name', None)
+    if not isinstance(path, str) or not os.path.isfile(path):
+        return ''
+    with open(path, 'rb') as f:
+        f.seek(max(os.fstat(f.fileno()).st_size - size, start, 0))
+        return f.read().decode('utf-8', errors='replace')
+
+
+class MemoryGuard:
+    """Starts jobs that declare `Job.host_memory_gb` only while the host can spare it, and limits them to it.
+
+    The host can spare MemAvailable, minus `memory_headroom_gb`, minus what running jobs declared but do not use
+    yet; what they use is already missing from MemAvailable. A job that is killed by its limit, or fails on an
+    allocation under an rlimit, fails with a `MemoryError` rather than an ordinary nonzero exit.
+    """
+
+    config_cls = MemoryConfig
+
+    @classmethod
+    def from_config(cls, **kwargs):
+        return cls(build_config(cls.config_cls, **kwargs))
+
+    def __init__(self, config: MemoryConfig):
+        if config.memory_limit not in MEMORY_LIMIT_MODES:
+            raise ValueError(f'Unknown memory_limit: {config.memory_limit}')
+        if config.memory_rlimit not in MEMORY_RLIMITS:
+            raise ValueError(f'Unknown memory_rlimit: {config.memory_rlimit}')
+        self.config = config
+        # Declared bytes of the jobs that were dispatched and have not ended.
+        self._reserved: Dict[Job, int] = {}
+        self._cgroups: Dict[Job, Path] = {}
+        self._oom_kills: Dict[Job, int] = {}
+        # Size of the stderr of each job when its current attempt started.
+        self._stderr_offsets: Dict[Job, int] = {}
+        self._mode: Optional[str] = None
+        self._cgroup_parent: Optional[Path] = None
+        self._spare: Optional[float] = None
+
+    def _used(self, job: Job) -> int:
+        cgroup = self._cgroups.get(job)
+        if cgroup is not None:
+            try:
+                return int((cgroup / 'memory.current').read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                pass
+        # The latest sample of the telemetry; without it, all of the declared memory is still outstanding.
+        return int(job._usage.get('rss_mb', 0) * 2 ** 20)
+
+    def outstanding(self) -> int:
+        """Bytes that running jobs declared but do not use yet."""
+        return sum(max(reserved - self._used(job), 0) for job, reserved in self._reserved.items())
+
+    def refresh(self):
+        """Forgets the last reading of /proc/meminfo; called before each dispatch round."""
+        self._spare = None
+
+    def spare(self) -> float:
+        """Bytes that can be reserved; /proc/meminfo is only read once per round, and only for jobs that need it."""
+        if self._spare is None:
+            available = read_meminfo().get('MemAvailable')
+            self._spare = float('inf') if available is None else \
+                available - self.config.memory_headroom_gb * GB - self.outstanding()
+        return self._spare
+
+    def admits(self, job: Job) -> bool:
+        return not job.host_memory_gb or job.host_memory_gb * GB <= self.spare()
+
+    def exceeds_host(self, job: Job) -> Optional[str]:
+        total = read_meminfo().get('MemTotal')
+        if total is None or not job.host_memory_gb:
+            return None
+        capacity = total / GB - self.config.memory_headroom_gb
+        if job.host_memory_gb > capacity:
+            return f'needs {job.host_memory_gb} GB of host memory, but at most {capacity:.1f} GB is available'
+        return None
+
+    def reserve(self, job: Job):
+        if not job.host_memory_gb:
+            return
+        self._reserved[job] = int(job.host_memory_gb * GB)
+        if self._spare is not None:
+            self._spare -= self._reserved[job]
+
+    def release(self, job: Job):
+        self._reserved.pop(job, None)
+        self._oom_kills.pop(job, None)
+        self._stderr_offsets.pop(job, None)
+        cgroup = self._cgroups.pop(job, None)
+        if cgroup is not None:
+            try:
+                cgroup.rmdir()
+            except OSError as e:
+                logging.warning(f'Failed to remove the cgroup {cgroup} of {job.job_name}: {e!r}')
+
+    @staticmethod
+    def _enable_memory_controller(parent: Path) -> bool:
+        try:
+            subtree_control = parent / 'cgroup.subtree_control'
+            if 'memory' not in subtree_control.read_text(encoding='utf-8').split():
+                # Fails with EBUSY if the parent has processes of its own, unless it is the root.
+                subtree_control.write_text('+memory', encoding='utf-8')
+        except OSError:
+            return False
+        return os.access(parent, os.W_OK)
+
+    def _get_mode(self) -> str:
+        if self._mode is None:
+            mode = self.config.memory_limit
+            if mode in ('auto', 'cgroup'):
+                parent = Path(self.config.memory_cgroup_parent) if self.config.memory_cgroup_parent \
+                    else get_own_cgroup()
+                if parent is not None and self._enable_memory_controller(parent):
+                    self._cgroup_parent = parent
+                    mode = 'cgroup'
+                else:
+                    if mode == 'cgroup':
+                        logging.warning(f'Cannot create cgroups with the memory controller under {parent}; '
+                                        'limiting the memory of jobs with rlimits instead.')
+                    mode = 'rlimit'
+            logging.info(f'Host memory of jobs is limited by {mode}')
+            self._mode = mode
+        return self._mode
+
+    def _create_cgroup(self, job: Job, limit: int) -> Optional[Path]:
+        cgroup = self._cgroup_parent / f'toyflow-{os.getpid()}-{job._job_id}'
+        try:
+            cgroup.mkdir(exist_ok=True)
+            (cgroup / 'memory.max').write_text(str(limit), encoding='utf-8')
+            if (cgroup / 'memory.swap.max').exists():
+                (cgroup / 'memory.swap.max').write_text('0', encoding='utf-8')
+        except OSError as e:
+            logging.warning(f'Failed to create a cgroup for {job.job_name}, so its memory is not limited: {e!r}')
+            return None
+        self._cgroups[job] = cgroup
+        self._oom_kills[job] = 0
+        return cgroup
+
+    def start_attempt(self, job: Job):
+        """Called before each attempt of `job`, so that `get_breach` only reads what the attempt printed."""
+        if job.host_memory_gb:
+            self._stderr_offsets[job] = _get_size(job._stderr) or 0
+
+    def get_preexec_fn(self, job: Job) -> Optional[Callable[[], None]]:
+        """Sets up the limit of `job` before a process of it starts, and returns what the process runs first."""
+        if not job.host_memory_gb or job.is_callable:
+            return None
+        mode = self._get_mode()
+        limit = int(job.host_memory_gb * GB)
+        if mode == 'cgroup':
+            cgroup = self._cgroups.get(job) or self._create_cgroup(job, limit)
+            if cgroup is None:
+                return None
+            procs = str(cgroup / 'cgroup.procs')
+
+            def enter_cgroup():
+                # '0' is the writing process, and its children inherit the cgroup.
+                with open(procs, 'w', encoding='utf-8') as f:
+                    f.write('0')
+
+            return enter_cgroup
+        if mode == 'rlimit':
+            rlimit = MEMORY_RLIMITS[self.config.memory_rlimit]
+
+            def set_rlimit():
+                resource.setrlimit(rlimit, (limit, limit))
+
+            return set_rlimit
+        return None
+
+    def get_breach(self, job: Job, returncode: Optional[int]) -> Optional[str]:
+        """Why the last process of `job` failed, if it was for exceeding its memory limit."""
+        if not job.host_memory_gb or returncode == 0 or self._mode in (None, 'none'):
+            return None
+        reason = f'exceeded its memory limit of {job.host_memory_gb} GB'
+        cgroup = self._cgroups.get(job)
+        if cgroup is not None:
+            try:
+                lines = (cgroup / 'memory.events').read_text(encoding='utf-8').splitlines()
+                events = dict(line.split() for line in lines)
+                oom_kills = int(events.get('oom_kill', 0))
+            except (OSError, ValueError):
+                return None
+            previous, self._oom_kills[job] = self._oom_kills.get(job, 0), oom_kills
+            return f'{reason} and was killed by the OOM killer' if oom_kills > previous else None
+        if self._mode == 'rlimit' and \
+                ALLOCATION_ERRORS.search(_read_tail(job._stderr, self._stderr_offsets.get(job, 0))):
+            return f'{reason}: an allocation failed'
+        return None
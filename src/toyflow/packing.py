@@ -0,0 +1,139 @@
+import asyncio
+import contextlib
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from toyflow.job import Job
+from toyflow.utils.config import build_config
+from toyflow.utils.gpu_probe import GpuProbe, GpuStats, get_default_gpu_probe
+
+logging.basicConfig(level=logging.INFO)
+
+
+@dataclass
+class PackingConfig:
+    # Run queued `Job(packable=True)` jobs next to the jobs holding GPUs that are observed to have headroom.
+    gpu_packing: bool = False
+    # Max number of packed jobs on a GPU, on top of the job that holds it.
+    packing_max_jobs_per_gpu: int = 2
+    # Seconds between observations of the GPUs. A GPU takes at most one packed job per observation, so that
+    # the next observation includes its load.
+    packing_interval: float = 30.0
+    # A GPU has headroom while it is below this utilization (in %) and has this much memory free.
+    packing_max_utilization: float = 50.0
+    packing_min_free_memory_mb: float = 8192.0
+    # A GPU above either of these (in %) is contended: its newest packed job is evicted and requeued, and no
+    # job is packed onto it for `packing_backoff` seconds.
+    packing_contention_utilization: float = 95.0
+    packing_contention_memory: float = 95.0
+    packing_backoff: float = 600.0
+
+
+class GpuPacker:
+    """Admits packable jobs onto busy GPUs with headroom, and evicts them again when the GPUs are contended.
+
+    Packed jobs take one of the `packing_max_jobs_per_gpu` slots of `ResourceType.CUDA_SHARE` that the launcher
+    adds for each GPU, rather than the GPU itself. Decisions use the last observation of `gpu_probe`. On
+    contention the GPU's newest packed job is evicted first, one per observation, and the launcher puts it back
+    in the queue.
+    """
+
+    config_cls = PackingConfig
+
+    @classmethod
+    def from_config(cls, evict: Callable[[Job], None], gpu_probe: Optional[GpuProbe] = None, **kwargs):
+        config = build_config(cls.config_cls, **kwargs)
+        if config.gpu_packing and gpu_probe is None:
+            gpu_probe = get_default_gpu_probe()
+            if gpu_probe is None:
+                logging.warning('gpu_packing needs a GPU probe, i.e. nvidia-smi; GPUs are not packed.')
+        return cls(config, evict, gpu_probe)
+
+    def __init__(self, config: PackingConfig, evict: Callable[[Job], None], gpu_probe: Optional[GpuProbe] = None):
+        self.config = config
+        self.evict = evict
+        self.gpu_probe = gpu_probe
+        self.stats: Dict[int, GpuStats] = {}
+        # Packed jobs on each GPU, oldest first.
+        self.packed: Dict[int, List[Job]] = {}
+        # GPUs observed since a job was last packed onto them.
+        self._fresh: Set[int] = set()
+        self._backoff_until: Dict[int, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        # Called with no arguments after each observation, e.g. to wake up the dispatch loop.
+        self.listeners = []
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.gpu_packing and self.gpu_probe is not None
+
+    def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.config.packing_interval)
+            try:
+                if self.gpu_probe.blocking:
+                    stats = await loop.run_in_executor(None, self.gpu_probe.query)
+                else:
+                    stats = self.gpu_probe.query()
+            except Exception as e:  # pylint: disable=broad-except
+                logging.warning(f'GPU packing probe failed: {e!r}')
+                continue
+            self.observe(stats, loop.time())
+
+    def _contended(self, gpu: GpuStats) -> bool:
+        memory = 100.0 * gpu.memory_used_mb / gpu.memory_total_mb if gpu.memory_total_mb > 0 else 0.0
+        return (gpu.utilization >= self.config.packing_contention_utilization
+                or memory >= self.config.packing_contention_memory)
+
+    def observe(self, stats: Dict[int, GpuStats], now: float):
+        self.stats = stats
+        self._fresh = set(stats)
+        for cuda_id, jobs in self.packed.items():
+            gpu = stats.get(cuda_id)
+            if not jobs or gpu is None or not self._contended(gpu):
+                continue
+            self._backoff_until[cuda_id] = now + self.config.packing_backoff
+            victim = next((job for job in reversed(jobs) if not job._requeue_requested), None)
+            if victim is not None:
+                logging.warning(f'GPU {cuda_id} is contended ({gpu.utilization:.0f}%, '
+                                f'{gpu.memory_used_mb:.0f}/{gpu.memory_total_mb:.0f} MB); '
+                                f'requeueing packed job {victim.job_name}.')
+                self.evict(victim)
+        for listener in self.listeners:
+            listener()
+
+    def has_headroom(self, cuda_id: int, now: float) -> bool:
+        gpu = self.stats.get(cuda_id)
+        if gpu is None or cuda_id not in self._fresh or now < self._backoff_until.get(cuda_id, 0.0):
+            return False
+        return (gpu.utilization < self.config.packing_max_utilization
+                and gpu.memory_total_mb - gpu.memory_used_mb >= self.config.packing_min_free_memory_mb)
+
+    def choose(self, cuda_ids: Iterable[int], now: float) -> Optional[int]:
+        """The least utilized of `cuda_ids` with headroom, or None."""
+        candidates = [cuda_id for cuda_id in cuda_ids if self.has_headroom(cuda_id, now)]
+        return min(candidates, key=lambda cuda_id: self.stats[cuda_id].utilization, default=None)
+
+    def on_packed(self, job: Job, cuda_id: int):
+        self.packed.setdefault(cuda_id, []).append(job)
+        self._fresh.discard(cuda_id)
+
+    def on_job_end(self, job: Job):
+        for jobs in self.packed.values():
+            if job in jobs:
+                jobs.remove(job)
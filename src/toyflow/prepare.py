@@ -0,0 +1,112 @@
+import asyncio
+import concurrent.futures
+import logging
+import multiprocessing
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from toyflow.job import Job, JobStatus
+from toyflow.utils.config import build_config
+
+logging.basicConfig(level=logging.INFO)
+
+
+@dataclass
+class PrepareConfig:
+    # Max number of `prepare_fn`s running at once, to keep staging from saturating the disk.
+    prepare_concurrency: int = 4
+    # Max number of jobs at the head of the queue that are being prepared or are prepared and waiting for
+    # GPUs; defaults to the number of GPUs plus `prepare_concurrency`.
+    prepare_lookahead: Optional[int] = None
+    prepare_executor: str = 'thread'  # or 'process', for CPU-bound preparation with picklable functions
+
+
+def _run_prepare_fn(prepare_fn: Callable, args: tuple):
+    prepare_fn(*args)
+
+
+class JobPreparer:
+    """Runs `Job.prepare_fn` on a bounded pool ahead of dispatch, so jobs are staged before GPUs free up.
+
+    Jobs with a `prepare_fn` go PENDING -> PREPARING -> PREPARED, and only PREPARED ones are dispatched.
+    A job whose `prepare_fn` raises ends as FAILED without running.
+    """
+
+    def __init__(self, config: PrepareConfig, num_gpus: int):
+        self.config = config
+        self.lookahead = config.prepare_lookahead
+        if self.lookahead is None:
+            self.lookahead = num_gpus + config.prepare_concurrency
+        self._executor: Optional[concurrent.futures.Executor] = None
+        self._in_flight: Dict[Job, asyncio.Future] = {}
+        self.num_waiting = 0  # PREPARED jobs that are not dispatched yet
+        # Called as `on_done(job, exception)` on the event loop when a preparation finishes.
+        self.on_done: Optional[Callable] = None
+
+    @classmethod
+    def from_config(cls, num_gpus: int, **kwargs):
+        return cls(build_config(PrepareConfig, **kwargs), num_gpus)
+
+    def _get_executor(self) -> concurrent.futures.Executor:
+        if self._executor is None:
+            if self.config.prepare_executor == 'process':
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    self.config.prepare_concurrency, mp_context=multiprocessing.get_context('spawn'))
+            elif self.config.prepare_executor == 'thread':
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    self.config.prepare_concurrency, thread_name_prefix='toyflow-prepare')
+            else:
+                raise ValueError(f'Unknown prepare_executor: {self.config.prepare_executor}')
+        return self._executor
+
+    def fill(self, queue: List[Job]):
+        """Starts preparing jobs from the head of `queue`, in dispatch order, within the limits."""
+        budget = self.lookahead - len(self._in_flight) - self.num_waiting
+        slots = self.config.prepare_concurrency - len(self._in_flight)
+        if budget <= 0 or slots <= 0:
+            return
+        for job in queue[:self.lookahead]:
+            if budget <= 0 or slots <= 0:
+                break
+            if job.status != JobStatus.PENDING or not job.needs_prepare:
+                continue
+            job.status = JobStatus.PREPARING
+            future = asyncio.wrap_future(self._get_executor().submit(
+                _run_prepare_fn, job.prepare_fn, tuple(job.prepare_fn_args or ())))
+            self._in_flight[job] = future
+            future.add_done_callback(lambda f, job=job: self._finish(job, f))
+            budget -= 1
+            slots -= 1
+
+    def _finish(self, job: Job, future: asyncio.Future):
+        self._in_flight.pop(job, None)
+        exception = future.exception()
+        if job.status != JobStatus.PREPARING:
+            # Cancelled meanwhile.
+            return
+        if exception is None:
+            job.status = JobStatus.PREPARED
+            self.num_waiting += 1
+        else:
+            logging.error(f'prepare_fn of {job.job_name} failed: {exception!r}')
+            job._exception = exception
+            job.status = JobStatus.FAILED
+        if self.on_done is not None:
+            self.on_done(job, exception)
+
+    def on_dispatch(self, job: Job):
+        if job.status == JobStatus.PREPARED:
+            self.num_waiting -= 1
+
+    def on_requeue(self, job: Job):
+        if job.status == JobStatus.PREPARED:
+            self.num_waiting += 1
+
+    def on_cancel(self, job: Job):
+        if job.status == JobStatus.PREPARED:
+            self.num_waiting -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -1,17 +1,54 @@
 import asyncio
+import bisect
 import logging
-from collections import defaultdict
-from copy import deepcopy
+from collections.abc import Mapping
 from dataclasses import dataclass
-from enum import Enum
-from typing import Dict, List
+from types import MappingProxyType
+from typing import Dict, Iterator, List, Optional, Union
 
 logging.basicConfig(level=logging.INFO)
 
 
-class ResourceType(Enum):
-    CPU = "cpu"
-    CUDA = "cuda"
+class _ResourceTypeMeta(type):
+    def __iter__(cls) -> Iterator["ResourceType"]:
+        return iter(list(cls._registry.values()))
+
+
+class ResourceType(metaclass=_ResourceTypeMeta):
+    """A kind of consumable resource. `CPU` and `CUDA` are built in; `ResourceType('ram_gb')` names any other,
+    e.g. host memory, scratch space or license seats, and is the same object for the same name."""
+    __slots__ = ('value',)
+    _registry: Dict[str, "ResourceType"] = {}
+    CPU: "ResourceType"
+    CUDA: "ResourceType"
+    CUDA_SHARE: "ResourceType"
+
+    def __new__(cls, value: Union[str, "ResourceType"]):
+        if isinstance(value, ResourceType):
+            return value
+        rtype = cls._registry.get(value)
+        if rtype is None:
+            rtype = super().__new__(cls)
+            rtype.value = str(value)
+            cls._registry[rtype.value] = rtype
+        return rtype
+
+    @property
+    def name(self) -> str:
+        return self.value.upper()
+
+    def __repr__(self):
+        return f'ResourceType({self.value!r})'
+
+    def __reduce__(self):
+        return ResourceType, (self.value,)
+
+
+ResourceType.CPU = ResourceType('cpu')
+ResourceType.CUDA = ResourceType('cuda')
+# Slots for packed jobs that run next to the job holding a GPU, see `toyflow.packing`.
+ResourceType.CUDA_SHARE = ResourceType('cuda_share')
+BUILTIN_RESOURCE_TYPES = (ResourceType.CPU, ResourceType.CUDA)
 
 
 @dataclass
@@ -21,79 +58,315 @@ class ResourceItem:
     quantity: float = 1.0
 
 
-class Resource(Dict[ResourceType, Dict[int, float]]):
+def _iter_bits(mask: int) -> Iterator[int]:
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class _Axis:
+    """Maps the ids of one resource type to vector positions. Shared by all resources split from a pool."""
+    __slots__ = ('rids', 'index')
+
+    def __init__(self):
+        self.rids: List[int] = []
+        self.index: Dict[int, int] = {}
+
+    def get_or_add(self, rid: int) -> int:
+        i = self.index.get(rid)
+        if i is None:
+            i = self.index[rid] = len(self.rids)
+            self.rids.append(rid)
+        return i
+
+
+class _Vector:
+    """Quantities of one resource type, with bitmasks of the positions holding >0, >=1 and >1 units."""
+    __slots__ = ('axis', 'values', 'support', 'units', 'over')
+
+    def __init__(self, axis: _Axis, values: Optional[List[float]] = None):
+        self.axis = axis
+        self.values = values if values is not None else [0.0] * len(axis.rids)
+        self.support = self.units = self.over = 0
+        for i, value in enumerate(self.values):
+            if value != 0:
+                self._update_masks(i)
+
+    def copy(self) -> "_Vector":
+        result = _Vector.__new__(_Vector)
+        result.axis = self.axis
+        result.values = self.values.copy()
+        result.support, result.units, result.over = self.support, self.units, self.over
+        return result
+
+    def zeros_like(self) -> "_Vector":
+        return _Vector(self.axis)
+
+    def _update_masks(self, i: int):
+        value = self.values[i]
+        bit = 1 << i
+        self.support = self.support | bit if value > 0 else self.support & ~bit
+        self.units = self.units | bit if value >= 1.0 else self.units & ~bit
+        self.over = self.over | bit if value > 1.0 else self.over & ~bit
+
+    def _position(self, rid: int) -> int:
+        i = self.axis.get_or_add(rid)
+        if i >= len(self.values):
+            self.values.extend([0.0] * (len(self.axis.rids) - len(self.values)))
+        return i
+
+    def increase(self, rid: int, quantity: float):
+        i = self._position(rid)
+        self.values[i] += quantity
+        self._update_masks(i)
+
+    def add(self, other: "_Vector", sign: float):
+        mask = other.support
+        if not mask:
+            return
+        if other.axis is not self.axis or len(self.values) < len(other.values):
+            for j in _iter_bits(mask):
+                quantity = other.values[j]
+                i = self._position(other.axis.rids[j])
+                assert sign > 0 or self.values[i] >= quantity
+                self.values[i] += sign * quantity
+                self._update_masks(i)
+            return
+        values, other_values = self.values, other.values
+        units, over = self.units, self.over
+        if not other.over and other.units == mask:
+            # Whole devices, as `split` hands out for whole GPUs: they fill empty positions or empty full ones.
+            if sign > 0 and not self.support & mask:
+                fill, self.support, self.units = 1.0, self.support | mask, units | mask
+            elif sign < 0 and units & mask == mask and not over & mask:
+                fill, self.support, self.units = 0.0, self.support & ~mask, units & ~mask
+            else:
+                fill = None
+            if fill is not None:
+                while mask:
+                    bit = mask & -mask
+                    mask ^= bit
+                    values[bit.bit_length() - 1] = fill
+                return
+        if sign > 0:
+            # Quantities only grow, so every touched position is in the support and only gains bits.
+            self.support |= mask
+            while mask:
+                bit = mask & -mask
+                mask ^= bit
+                i = bit.bit_length() - 1
+                value = values[i] = values[i] + other_values[i]
+                if value >= 1.0:
+                    units |= bit
+                    if value > 1.0:
+                        over |= bit
+        else:
+            # Quantities only shrink, so positions only lose bits.
+            support = self.support
+            while mask:
+                bit = mask & -mask
+                mask ^= bit
+                i = bit.bit_length() - 1
+                value = values[i] = values[i] - other_values[i]
+                assert value >= 0
+                if value <= 1.0:
+                    over &= ~bit
+                    if value < 1.0:
+                        units &= ~bit
+                        if value <= 0:
+                            support &= ~bit
+            self.support = support
+        self.units, self.over = units, over
+
+    def items(self):
+        rids = self.axis.rids
+        return [(rids[i], self.values[i]) for i in _iter_bits(self.support)]
+
+    def count_available(self) -> int:
+        return bin(self.support).count('1')
+
+    def allocate(self, requests: List[float]) -> Optional["_Vector"]:
+        """Best fit: each request, from large to small, takes the device with the least quantity that fits."""
+        picked: List[int] = []
+        if all(request == 1.0 for request in requests) and not self.over:
+            # Every device with a whole unit holds exactly one, so best fit is the first ones in order.
+            mask = self.units
+            for _ in requests:
+                if not mask:
+                    return None
+                low = mask & -mask
+                picked.append(low.bit_length() - 1)
+                mask ^= low
+            quantities = requests
+        else:
+            candidates = sorted(range(len(self.values)), key=lambda i: (self.values[i], i))
+            keys = [self.values[i] for i in candidates]
+            order = sorted(range(len(requests)), key=lambda k: -requests[k])
+            positions = [0] * len(requests)
+            for k in order:
+                pos = bisect.bisect_left(keys, requests[k])
+                if pos == len(keys):
+                    return None
+                positions[k] = candidates.pop(pos)
+                keys.pop(pos)
+            picked = positions
+            quantities = requests
+        result = self.zeros_like()
+        for i, quantity in zip(picked, quantities):
+            result.values[i] = quantity
+            result._update_masks(i)
+        return result
+
+
+class Resource(Mapping):
+    """Resource quantities by type and id, e.g. `{ResourceType.CUDA: {0: 1.0, 1: 1.0}}`.
+
+    Quantities are kept in lists indexed by a per-type axis that is shared with the pool they come from, with
+    bitmasks of the devices that hold any, whole and more than whole units, so that fit checks and `split` do
+    not scan or copy the pool. `add_` and `minus_` only visit the devices involved, but keeping the bitmasks
+    makes them no faster than adding to dicts.
+    """
+    __slots__ = ('_vectors',)
+
+    def __init__(self):
+        self._vectors: Dict[ResourceType, _Vector] = {}
+
     @classmethod
     def from_resource_items(cls, resource_items: List[ResourceItem]):
-        result: Resource = cls(
-            {rtype: defaultdict(float) for rtype in ResourceType}
-        )
+        result: Resource = cls()
+        for rtype in BUILTIN_RESOURCE_TYPES:
+            result._vectors[rtype] = _Vector(_Axis())
         for item in resource_items:
-            result[item.rtype][item.rid] += item.quantity
+            vector = result._vectors.get(item.rtype)
+            if vector is None:
+                vector = result._vectors[item.rtype] = _Vector(_Axis())
+            vector.increase(item.rid, item.quantity)
         return result
 
+    def __getitem__(self, rtype: ResourceType) -> Mapping:
+        """A read-only snapshot of the quantities of `rtype` by id; change them with `add_` and `minus_`."""
+        return MappingProxyType(dict(self._vectors[rtype].items()))
+
+    def __iter__(self):
+        return iter(self._vectors)
+
+    def __len__(self):
+        return len(self._vectors)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.as_dict()})'
+
     def get_cuda_ids(self):
-        return list(self.get(ResourceType.CUDA, {}).keys())
+        """Ids of the GPUs held, including the ones shared by a packed job."""
+        cuda_ids = []
+        for rtype in (ResourceType.CUDA, ResourceType.CUDA_SHARE):
+            vector = self._vectors.get(rtype)
+            if vector is not None:
+                cuda_ids.extend(rid for rid, _ in vector.items())
+        return cuda_ids
+
+    def count_available(self, rtype: ResourceType) -> int:
+        """Number of devices of `rtype` with a positive quantity."""
+        vector = self._vectors.get(rtype)
+        return 0 if vector is None else vector.count_available()
+
+    def max_quantity(self, rtype: ResourceType) -> float:
+        """Largest quantity of `rtype` on a single device, i.e. the largest request of it that fits."""
+        vector = self._vectors.get(rtype)
+        if vector is None or not vector.support:
+            return 0.0
+        return max(vector.values[i] for i in _iter_bits(vector.support))
 
     def as_dict(self):
-        return {rtype.value: {rid: quantity for rid, quantity in resources.items()} for rtype, resources in self.items()}
+        return {rtype.value: dict(vector.items()) for rtype, vector in self._vectors.items()}
 
-    def add_(self, other: "Resource"):
-        for rtype, resources in other.items():
-            for rid, quantity in resources.items():
-                self[rtype][rid] += quantity
+    def _add(self, other: "Resource", sign: float):
+        vectors = self._vectors
+        for rtype, other_vector in other._vectors.items():
+            vector = vectors.get(rtype)
+            if vector is None:
+                assert sign > 0 or not other_vector.support
+                vectors[rtype] = other_vector.copy()
+            elif other_vector.support:
+                vector.add(other_vector, sign)
         return self
 
+    def add_(self, other: "Resource"):
+        return self._add(other, 1.0)
+
     def minus_(self, other: "Resource"):
-        for rtype, resources in other.items():
-            for rid, quantity in resources.items():
-                assert self[rtype][rid] >= quantity
-                self[rtype][rid] -= quantity
-        return self
+        return self._add(other, -1.0)
+
+    def _fill_missing_types(self, allocated: "Resource") -> "Resource":
+        for rtype, vector in self._vectors.items():
+            if rtype not in allocated._vectors:
+                allocated._vectors[rtype] = vector.zeros_like()
+        return allocated
 
     def split(self, requirement: Dict[ResourceType, List[float]]):
-        try:
-            allocated: Resource = Resource.from_resource_items([])
-            all_resources = deepcopy(self)
-            for rtype, quantities in requirement.items():
-                if rtype not in all_resources:
-                    raise ValueError(f"Resource type {rtype} not found")
-                allocated[rtype] = self._greedy_allocate(
-                    all_resources[rtype], quantities)
-            return allocated
-        except ValueError:
-            return None
-
-    @staticmethod
-    def _greedy_allocate(available_resources: Dict[int, float], requests: List[float]) -> Dict[int, float]:
-        available_resources = available_resources.copy()
-        allocation = [None] * len(requests)
-        # Sort requests from large to small
-        sorted_requests = sorted(enumerate(requests), key=lambda x: -x[1])
-        used_resources = set()
-        for i, request in sorted_requests:
-            # Sort available resources from small to large
-            sorted_memories = sorted(
-                available_resources.items(), key=lambda x: x[1])
-            for rid, available_quantity in sorted_memories:
-                if available_quantity >= request and rid not in used_resources:
-                    available_resources[rid] -= request
-                    allocation[i] = rid
-                    used_resources.add(rid)
-                    break
-        if None in allocation:
-            raise ValueError("Cannot allocate")
-        return {allocation[i]: requests[i] for i in range(len(requests))}
+        allocated: Resource = Resource()
+        for rtype, quantities in requirement.items():
+            if rtype not in self._vectors:
+                return None
+            vector = self._vectors[rtype].allocate(quantities)
+            if vector is None:
+                return None
+            allocated._vectors[rtype] = vector
+        return self._fill_missing_types(allocated)
+
+    def split_ids(self, allocation: Dict[ResourceType, Dict[int, float]]):
+        """Like `split`, but takes the given quantities from the given ids, e.g. ones chosen by a placement."""
+        allocated: Resource = Resource()
+        for rtype, quantities in allocation.items():
+            vector = self._vectors.get(rtype)
+            if vector is None:
+                return None
+            result = vector.zeros_like()
+            for rid, quantity in quantities.items():
+                i = vector.axis.index.get(rid)
+                if i is None or i >= len(vector.values) or vector.values[i] < quantity:
+                    return None
+                result.values[i] = quantity
+                result._update_masks(i)
+            allocated._vectors[rtype] = result
+        return self._fill_missing_types(allocated)
 
 
 class ResourcePool:
-    def __init__(self, resource_items: List[ResourceItem]) -> None:
+    def __init__(self, resource_items: List[ResourceItem], ledger=None) -> None:
         self._resource: Resource = Resource.from_resource_items(resource_items)
         self.lock = asyncio.Lock()
+        # CUDA ids that stay in the pool but are not handed out, e.g. drained or quarantined devices.
+        self.unschedulable = set()
+        # A `toyflow.gpu_ledger.GpuLedger` shared with the pools of other processes on the host, if any.
+        self.ledger = ledger
+
+    def add_device(self, rtype: ResourceType, rid: int, quantity: float = 1.0):
+        vector = self._resource._vectors.get(rtype)
+        if vector is None:
+            vector = self._resource._vectors[rtype] = _Vector(_Axis())
+        vector.increase(rid, quantity)
 
     async def allocate_all(self):
         async with self.lock:
             result = self._resource
-            self._resource = Resource.from_resource_items([])
+            self._resource = Resource()
+            used_by_others = self.ledger.used_by_others() if self.ledger is not None else None
+            if self.unschedulable or used_by_others:
+                held = {}
+                for rid, quantity in result[ResourceType.CUDA].items():
+                    if rid in self.unschedulable:
+                        held[rid] = quantity
+                    elif used_by_others and rid in used_by_others:
+                        # Only whatever other processes left of the device is available.
+                        excess = min(quantity, quantity + used_by_others[rid] - 1.0)
+                        if excess > 1e-9:
+                            held[rid] = excess
+                if held:
+                    held_resource = result.split_ids({ResourceType.CUDA: held})
+                    result.minus_(held_resource)
+                    self._resource.add_(held_resource)
             return result
 
     async def allocate(self, resource: Resource):
@@ -101,9 +374,18 @@ class ResourcePool:
             self._resource.minus_(resource)
             return resource
 
-    async def release(self, resource: Resource):
+    def reserve(self, resource: Resource, label: str = '') -> bool:
+        """Records the GPUs of `resource` in the ledger; False if another process took one of them first."""
+        if self.ledger is None:
+            return True
+        return self.ledger.reserve(resource[ResourceType.CUDA], label)
+
+    async def release(self, resource: Resource, reserved: bool = False):
+        """Returns `resource` to the pool, and also to the ledger if it was reserved there."""
         async with self.lock:
             self._resource.add_(resource)
+        if reserved and self.ledger is not None:
+            self.ledger.release(resource[ResourceType.CUDA])
 
 
 if __name__ == '__main__':
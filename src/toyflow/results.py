@@ -0,0 +1,111 @@
+"""Results that jobs write under their `log_dir`, collected into the status database.
+
+A job that declares `Job(..., results='metrics.json')` (a path or glob relative to its `log_dir`) has its results
+read once, after it ends, into the `results` table of the status database. `load_results` joins them with the
+job's `extra_info`, resources and timings, without touching the log dirs again:
+
+    df = load_results(run_id='latest')
+    df.groupby('extra_info.lr')['accuracy'].max()
+"""
+import json
+import logging
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+import pandas as pd
+
+from toyflow.status_store import DEFAULT_STATUS_DB, latest_run_id, query
+
+logging.basicConfig(level=logging.INFO)
+
+RESULT_SUFFIXES = ('.json', '.jsonl')
+JOB_COLUMNS = ('job_name', 'status', 'cuda', 'returncode', 'submit_time', 'start_time', 'end_time', 'log_dir')
+
+
+def find_result_files(log_dir: Union[str, Path], pattern: str) -> List[Path]:
+    """Files under `log_dir` that match `pattern`, a path or glob that may also be absolute."""
+    if Path(pattern).is_absolute():
+        root, pattern = Path(Path(pattern).anchor), str(Path(pattern).relative_to(Path(pattern).anchor))
+    else:
+        root = Path(log_dir)
+    return sorted(path for path in root.glob(pattern) if path.is_file())
+
+
+def _as_row(value: Any) -> Dict[str, Any]:
+    return value if isinstance(value, dict) else {'value': value}
+
+
+def read_result_rows(path: Path) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """(line, row) pairs of a results file: a JSON object or list of objects, or JSON lines."""
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.suffix == '.jsonl':
+            for line, text in enumerate(f):
+                if text.strip():
+                    yield line, _as_row(json.loads(text))
+            return
+        data = json.load(f)
+    for line, value in enumerate(data if isinstance(data, list) else [data]):
+        yield line, _as_row(value)
+
+
+def ingest_results(conn: sqlite3.Connection, run_id: int, job_id: int, log_dir: Union[str, Path], pattern: str,
+                   resources: Dict[str, Any]) -> int:
+    """Replaces the results of a job with the rows of its result files, and returns the number of rows."""
+    rows = []
+    try:
+        paths = find_result_files(log_dir, pattern)
+    except (OSError, ValueError) as e:
+        # E.g. an invalid glob, or a log dir that cannot be read; the job keeps no results.
+        logging.warning(f'Failed to find the result files {pattern!r} in {log_dir}: {e!r}')
+        paths = []
+    for path in paths:
+        if path.suffix not in RESULT_SUFFIXES:
+            logging.warning(f'Skipping result file {path}: only {", ".join(RESULT_SUFFIXES)} files are read.')
+            continue
+        try:
+            rows.extend((run_id, job_id, path.as_posix(), line, json.dumps(resources), json.dumps(row, default=str))
+                        for line, row in read_result_rows(path))
+        except Exception as e:  # pylint: disable=broad-except
+            logging.warning(f'Failed to read result file {path}: {e!r}')
+    conn.execute('DELETE FROM results WHERE run_id = ? AND job_id = ?', (run_id, job_id))
+    conn.executemany(
+        'INSERT INTO results (run_id, job_id, path, line, resources, data) VALUES (?, ?, ?, ?, ?, ?)', rows)
+    return len(rows)
+
+
+def _load_json(text: Optional[str]) -> Dict[str, Any]:
+    return json.loads(text) if text else {}
+
+
+def load_results(status_db: Union[str, Path] = DEFAULT_STATUS_DB,
+                 run_id: Union[int, str, None] = 'latest') -> pd.DataFrame:
+    """One row per result row of the run (or of all runs for `run_id=None`), with the job it came from.
+
+    Keys of the results become columns as they are, and those of `extra_info`, the resources and the resource usage
+    are prefixed with `extra_info.`, `resources.` and `usage.`; `duration` is in seconds.
+    """
+    if run_id == 'latest':
+        run_id = latest_run_id(status_db)
+    where, params = ('WHERE r.run_id = ?', (run_id,)) if run_id is not None else ('', ())
+    job_columns = ', '.join(f'j.{column}' for column in JOB_COLUMNS)
+    columns, rows = query(
+        status_db,
+        f'SELECT r.run_id, r.job_id, r.path, r.line, {job_columns}, j.extra_info, j.resource_usage, r.resources, '
+        f'r.data FROM results r LEFT JOIN jobs j ON j.run_id = r.run_id AND j.job_id = r.job_id {where} '
+        'ORDER BY r.run_id, r.job_id, r.path, r.line',
+        params)
+    records = []
+    for row in rows:
+        record = dict(zip(columns, row))
+        record['duration'] = record['end_time'] - record['start_time'] \
+            if record['end_time'] is not None and record['start_time'] is not None else None
+        for column, prefix in (('extra_info', 'extra_info'), ('resources', 'resources'),
+                               ('resource_usage', 'usage')):
+            record.update({f'{prefix}.{key}': value for key, value in _load_json(record.pop(column)).items()})
+        data = _load_json(record.pop('data'))
+        # Result keys win over job columns with the same name, which stay available with a `job.` prefix.
+        record.update({f'job.{key}': record.pop(key) for key in data if key in record})
+        record.update(data)
+        records.append(record)
+    return pd.DataFrame.from_records(records)
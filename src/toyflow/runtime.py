@@ -0,0 +1,153 @@
+import collections
+import logging
+import re
+import sqlite3
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Deque, Dict, Iterable, List, Optional
+
+from toyflow.job import Job, JobStatus
+from toyflow.status_store import DEFAULT_STATUS_DB, query
+from toyflow.utils.config import build_config
+
+logging.basicConfig(level=logging.INFO)
+
+# Integers, decimals and floats in scientific notation, e.g. the `0.1` of `--lr 0.1`.
+NUMBER_PATTERN = re.compile(r'(?<![\w.])[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?(?![\w.])')
+
+
+@dataclass
+class RuntimeConfig:
+    # 'name' shares the history of jobs with the same name; 'cmd' of jobs whose commands only differ in
+    # numbers, e.g. `python train.py --lr 0.1` and `--lr 0.01`.
+    runtime_history_key: str = 'name'
+    # The estimate is this quantile of the recent runtimes of the key, e.g. 0.9 for a pessimistic one.
+    runtime_quantile: float = 0.5
+    runtime_history_size: int = 20
+    # Finished jobs of earlier runs are read from the status database.
+    status_db: str = DEFAULT_STATUS_DB
+    runtime_history_max_rows: int = 100000
+    disable_runtime_history: bool = False
+
+
+def quantile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    position = (len(values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def cmd_template(cmd: str) -> str:
+    return NUMBER_PATTERN.sub('<n>', cmd)
+
+
+class RuntimeEstimator:
+    """Expected runtimes of jobs, from the runtimes of earlier jobs with the same name or command template.
+
+    The history is the status database of earlier runs plus the jobs that finished in this one. Jobs without
+    history get the median estimate of the known keys.
+    """
+
+    @classmethod
+    def from_config(cls, **kwargs) -> "RuntimeEstimator":
+        return cls(build_config(RuntimeConfig, **kwargs))
+
+    def __init__(self, config: RuntimeConfig):
+        if config.runtime_history_key not in ('name', 'cmd'):
+            raise ValueError(f'Unknown runtime_history_key: {config.runtime_history_key}')
+        self.config = config
+        self.history: Dict[str, Deque[float]] = collections.defaultdict(
+            lambda: collections.deque(maxlen=config.runtime_history_size))
+        self._estimates: Dict[str, float] = {}
+        self._default: Optional[float] = None
+        self._start_times: Dict[Job, float] = {}
+        if not config.disable_runtime_history:
+            self.load_history(config.status_db)
+
+    def key(self, job: Job) -> str:
+        if job._runtime_key is None:
+            job._runtime_key = self._key(job.job_name, job.cmd_str)
+        return job._runtime_key
+
+    def _key(self, job_name: Optional[str], cmd: str) -> str:
+        if self.config.runtime_history_key == 'name' and job_name:
+            return job_name
+        return cmd_template(cmd)
+
+    def load_history(self, path):
+        if not Path(path).exists():
+            return
+        try:
+            _, rows = query(
+                path,
+                'SELECT job_name, cmd, end_time - start_time FROM ('
+                '  SELECT job_name, cmd, start_time, end_time FROM jobs'
+                '  WHERE status = ? AND start_time IS NOT NULL AND end_time IS NOT NULL'
+                '  ORDER BY end_time DESC LIMIT ?'
+                ') ORDER BY end_time',
+                (JobStatus.FINISHED.name, self.config.runtime_history_max_rows))
+        except sqlite3.Error as e:
+            logging.warning(f'Failed to read the runtime history from {path}: {e!r}')
+            return
+        for job_name, cmd, duration in rows:
+            self.observe(self._key(job_name, cmd or ''), duration)
+        logging.info(f'Loaded the runtimes of {len(rows)} jobs with {len(self.history)} keys from {path}')
+
+    def observe(self, key: str, duration: float):
+        self.history[key].append(max(duration, 0.0))
+        self._estimates.pop(key, None)
+        self._default = None
+
+    def _estimate_key(self, key: str) -> Optional[float]:
+        estimate = self._estimates.get(key)
+        if estimate is None and self.history.get(key):
+            estimate = self._estimates[key] = quantile(list(self.history[key]), self.config.runtime_quantile)
+        return estimate
+
+    def estimate(self, job: Job) -> Optional[float]:
+        """Expected seconds from the start to the end of `job`, or None without any history."""
+        estimate = self._estimate_key(self.key(job))
+        if estimate is not None:
+            return estimate
+        if self._default is None and self.history:
+            self._default = quantile([self._estimate_key(key) for key in self.history], 0.5)
+        return self._default
+
+    def on_job_start(self, job: Job, now: float):
+        self._start_times[job] = now
+        job._expected_runtime = self.estimate(job)
+
+    def on_job_end(self, job: Job, now: float):
+        start_time = self._start_times.pop(job, None)
+        if start_time is not None and job.status == JobStatus.FINISHED:
+            self.observe(self.key(job), now - start_time)
+
+    def remaining(self, job: Job, now: float) -> Optional[float]:
+        """Expected seconds until a running job ends; 0 once it runs longer than expected."""
+        start_time = self._start_times.get(job)
+        if start_time is None or job._expected_runtime is None:
+            return None
+        return max(job._expected_runtime - (now - start_time), 0.0)
+
+    def eta(self, queued: Iterable[Job], num_gpus: int, now: float) -> Optional[float]:
+        """Expected seconds until the queued and running jobs are done, if their GPU-seconds were packed
+        perfectly onto `num_gpus`; None while some job has no estimate."""
+        if num_gpus <= 0:
+            return None
+        gpu_seconds = longest = 0.0
+        for job in self._start_times:
+            remaining = self.remaining(job, now)
+            if remaining is None:
+                return None
+            gpu_seconds += remaining * job.cuda_quantity
+            longest = max(longest, remaining)
+        for job in queued:
+            estimate = self.estimate(job)
+            if estimate is None:
+                return None
+            gpu_seconds += estimate * job.cuda_quantity
+            longest = max(longest, estimate)
+        return max(gpu_seconds / num_gpus, longest)
@@ -1,33 +1,91 @@
 import logging
-from typing import List, Optional
+from dataclasses import dataclass
+from typing import Callable, List, Optional
 
 from toyflow.job import Job, JobStatus
 from toyflow.resource import Resource, ResourceType
+from toyflow.runtime import RuntimeEstimator
 
 logging.basicConfig(level=logging.INFO)
 
 
+QUEUED_STATUSES = (JobStatus.PENDING, JobStatus.PREPARING, JobStatus.PREPARED)
+SCHEDULING_POLICIES = ('fifo', 'sjf', 'ljf')
+
+
+def is_ready(job: Job) -> bool:
+    """Whether a queued job can be dispatched, i.e. it is prepared or needs no preparation."""
+    return job.status == JobStatus.PREPARED or (job.status == JobStatus.PENDING and not job.needs_prepare)
+
+
+@dataclass
+class SchedulerConfig:
+    # 'fifo' takes jobs with more GPUs first, then in submission order. With the expected runtimes of
+    # `RuntimeEstimator`, 'sjf' takes the shortest jobs first, for the shortest average wait, and 'ljf' the
+    # jobs with the most GPU-seconds first, for the shortest makespan of a batch.
+    scheduling_policy: str = 'fifo'
+
+
 class JobScheduler:
-    def __init__(self, jobs: List[Job]) -> None:
-        self.jobs = jobs
+    def __init__(self, jobs: List[Job], policy: str = 'fifo',
+                 runtime_estimator: Optional[RuntimeEstimator] = None) -> None:
+        if policy not in SCHEDULING_POLICIES:
+            raise ValueError(f'Unknown scheduling_policy: {policy}')
+        if policy != 'fifo' and runtime_estimator is None:
+            raise ValueError(f'The {policy} policy needs a runtime estimator.')
+        self.policy = policy
+        self.runtime_estimator = runtime_estimator
+        self.jobs = []
+        self.add_jobs(jobs)
+
+    def add_jobs(self, jobs: List[Job]):
+        for job in jobs:
+            job._job_id = len(self.jobs) + 1
+            self.jobs.append(job)
 
     def has_pending_jobs(self):
         for job in self.jobs:
-            if job.status == JobStatus.PENDING:
+            if job.status in QUEUED_STATUSES:
                 return True
         return False
 
-    def get_next_job(self, available_resource: Resource) -> Optional[Job]:
-        remaining_jobs = sorted(
-            [job for job in self.jobs if job.status == JobStatus.PENDING],
-            key=lambda job: (job.cuda_quantity, -job._job_id, job.cpu_quantity)
+    def has_jobs_to_prepare(self):
+        for job in self.jobs:
+            if job.status == JobStatus.PENDING and job.needs_prepare:
+                return True
+        return False
+
+    def _sort_key(self, job: Job):
+        if self.policy == 'fifo':
+            return (-job.cuda_quantity, job._job_id, -job.cpu_quantity)
+        # Without any history yet, all jobs sort as 0 seconds, i.e. in submission order.
+        expected_runtime = self.runtime_estimator.estimate(job) or 0.0
+        if self.policy == 'sjf':
+            return (expected_runtime, -job.cuda_quantity, job._job_id)
+        return (-expected_runtime * job.cuda_quantity, -job.cuda_quantity, job._job_id)
+
+    def queued_jobs(self) -> List[Job]:
+        """Jobs that have not started yet, in the order they are considered for dispatch."""
+        return sorted(
+            [job for job in self.jobs if job.status in QUEUED_STATUSES],
+            key=self._sort_key,
         )
+
+    def get_next_job(self, available_resource: Resource,
+                     admit: Optional[Callable[[Job], bool]] = None) -> Optional[Job]:
+        """The first ready job in dispatch order that fits in `available_resource` and that `admit` accepts."""
+        remaining_jobs = self.queued_jobs()
         if not remaining_jobs:
             return None
-        for job in remaining_jobs[::-1]:
-            if len(list(k for k, v in available_resource[ResourceType.CUDA].items() if v > 0)) < job.cuda_quantity:
+        num_available_cuda = available_resource.count_available(ResourceType.CUDA)
+        for job in remaining_jobs:
+            if num_available_cuda < job.cuda_quantity:
+                continue
+            if job.resources and any(available_resource.max_quantity(ResourceType(name)) < quantity
+                                     for name, quantity in job.resources.items()):
                 continue
-            return job
+            if is_ready(job) and (admit is None or admit(job)):
+                return job
         return None
 
     def update_job(self, job: Job, new_status: JobStatus):
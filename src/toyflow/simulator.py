@@ -0,0 +1,293 @@
+import asyncio
+import contextlib
+import logging
+import math
+import random
+import selectors
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+from toyflow.callbacks.base import Callback
+from toyflow.job import Job, JobStatus
+from toyflow.launcher import Launcher
+from toyflow.packing import GpuPacker
+from toyflow.resource import ResourceType
+from toyflow.runtime import quantile
+from toyflow.utils.gpu_probe import FakeGpuProbe, GpuStats
+
+logging.basicConfig(level=logging.INFO)
+
+
+class _VirtualSelector(selectors.BaseSelector):
+    """Polls the real selector without blocking and fast-forwards the loop's clock instead of sleeping."""
+
+    def __init__(self, loop: "VirtualClockEventLoop"):
+        self._loop = loop
+        self._selector = selectors.DefaultSelector()
+
+    def register(self, fileobj, events, data=None):
+        return self._selector.register(fileobj, events, data)
+
+    def unregister(self, fileobj):
+        return self._selector.unregister(fileobj)
+
+    def modify(self, fileobj, events, data=None):
+        return self._selector.modify(fileobj, events, data)
+
+    def select(self, timeout=None):
+        events = self._selector.select(0)
+        if events or timeout == 0:
+            return events
+        if timeout is None:
+            raise RuntimeError('Simulation is stuck: nothing is scheduled on the event loop.')
+        self._loop._virtual_time += timeout
+        return []
+
+    def get_map(self):
+        return self._selector.get_map()
+
+    def close(self):
+        self._selector.close()
+
+
+class VirtualClockEventLoop(asyncio.SelectorEventLoop):
+    """An event loop whose clock only advances when every task is waiting for a timer."""
+
+    def __init__(self):
+        self._virtual_time = 0.0
+        super().__init__(selector=_VirtualSelector(self))
+
+    def time(self) -> float:
+        return self._virtual_time
+
+
+@contextlib.contextmanager
+def virtual_event_loop():
+    """Sets a new `VirtualClockEventLoop` as the current loop, and closes it on exit."""
+    loop = VirtualClockEventLoop()
+    asyncio.set_event_loop(loop)
+    try:
+        yield loop
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+@dataclass
+class SimulatedJobSpec:
+    name: str
+    duration: float
+    cuda_quantity: int = 1
+    fail: bool = False
+    resources: Dict[str, float] = field(default_factory=dict)
+    packable: bool = False
+    # What the job adds to the utilization (in %) and memory of each of its GPUs, as seen by GPU packing.
+    gpu_utilization: float = 100.0
+    gpu_memory_mb: float = 0.0
+
+
+def generate_workload(
+    num_jobs: int,
+    seed: int = 0,
+    mean_duration: float = 600.0,
+    duration_sigma: float = 1.0,
+    cuda_quantity_weights: Optional[Dict[int, float]] = None,
+    failure_rate: float = 0.0,
+) -> List[SimulatedJobSpec]:
+    """Jobs with log-normal durations, weighted GPU counts and random failures."""
+    rng = random.Random(seed)
+    cuda_quantity_weights = cuda_quantity_weights or {1: 1.0}
+    quantities = list(cuda_quantity_weights.keys())
+    weights = list(cuda_quantity_weights.values())
+    # Pick mu so that the mean of the log-normal distribution equals `mean_duration`.
+    mu = math.log(mean_duration) - duration_sigma ** 2 / 2
+    workload = []
+    for i in range(num_jobs):
+        fail = rng.random() < failure_rate
+        duration = rng.lognormvariate(mu, duration_sigma)
+        if fail:
+            duration *= rng.random()
+        workload.append(SimulatedJobSpec(
+            name=f'sim-{i}',
+            duration=duration,
+            cuda_quantity=rng.choices(quantities, weights)[0],
+            fail=fail,
+        ))
+    return workload
+
+
+class SimulatedProcess:
+    def __init__(self, pid: int, duration: float, returncode: int):
+        self.pid = pid
+        self.returncode: Optional[int] = None
+        self._duration = duration
+        self._final_returncode = returncode
+        self._killed = asyncio.Event()
+
+    async def wait(self) -> int:
+        if self.returncode is None:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._killed.wait(), timeout=self._duration)
+            if self.returncode is None:
+                self.returncode = self._final_returncode
+        return self.returncode
+
+    def kill(self):
+        if self.returncode is None:
+            self.returncode = -9
+            self._killed.set()
+
+    terminate = kill
+
+
+class _SimulationRecorder(Callback):
+    def __init__(self):
+        super().__init__(Callback.config_cls())
+        self.submit_times: Dict[Job, float] = {}
+        self.start_times: Dict[Job, float] = {}
+        self.end_times: Dict[Job, float] = {}
+        self.num_requeued = 0
+
+    def on_launcher_start(self, jobs: List[Job]):
+        now = asyncio.get_running_loop().time()
+        for job in jobs:
+            self.submit_times[job] = now
+
+    def on_jobs_added(self, jobs: List[Job]):
+        self.on_launcher_start(jobs)
+
+    def on_job_start(self, job: Job):
+        self.start_times[job] = asyncio.get_running_loop().time()
+
+    def on_job_end(self, job: Job):
+        self.end_times[job] = asyncio.get_running_loop().time()
+
+    def on_job_requeued(self, job: Job):
+        self.num_requeued += 1
+
+
+class SimulatedLauncher(Launcher):
+    """Runs the real scheduling logic of `Launcher` with fake processes and no default callbacks.
+
+    GPU packing observes the `gpu_utilization` and `gpu_memory_mb` of the running jobs' specs. A job that starts
+    on a GPU whose jobs, itself included, add up to more than 100% utilization runs proportionally longer.
+    """
+
+    def __init__(self, cuda_list: List[int], workload: Sequence[SimulatedJobSpec],
+                 callbacks: Optional[List[Callback]] = None, failing_cuda_ids: Sequence[int] = (),
+                 gpu_memory_mb: float = 81920.0, **kwargs):
+        self.specs: Dict[Job, SimulatedJobSpec] = {}
+        self.gpu_memory_mb = gpu_memory_mb
+        # Every job placed on one of these GPUs fails, like on a card with hardware errors.
+        self.failing_cuda_ids = set(failing_cuda_ids)
+        jobs = self._make_jobs(workload)
+        self.recorder = _SimulationRecorder()
+        kwargs.setdefault('disable_telemetry', True)
+        kwargs.setdefault('disable_runtime_history', True)
+        super().__init__(cuda_list, jobs, callbacks=[self.recorder, *(callbacks or [])], **kwargs)
+        self._next_pid = 100000
+
+    def make_job(self, spec: SimulatedJobSpec) -> Job:
+        """A job that runs as `spec`, e.g. for `submit`."""
+        job = Job(cmd=['true'], job_name=spec.name, cuda_quantity=spec.cuda_quantity, env={},
+                  resources=dict(spec.resources), packable=spec.packable)
+        self.specs[job] = spec
+        return job
+
+    def _make_jobs(self, workload: Sequence[SimulatedJobSpec]) -> List[Job]:
+        return [self.make_job(spec) for spec in workload]
+
+    def add_workload(self, workload: Sequence[SimulatedJobSpec]) -> List[Job]:
+        """Submits more jobs while running, like `Launcher.add_jobs`."""
+        jobs = self._make_jobs(workload)
+        self.add_jobs(jobs)
+        return jobs
+
+    def _build_default_callbacks(self, **kwargs) -> List[Callback]:
+        return []
+
+    def _build_packer(self, **kwargs) -> GpuPacker:
+        return GpuPacker.from_config(
+            self._evict_packed_job, gpu_probe=FakeGpuProbe(stats_fn=self.gpu_stats), **kwargs)
+
+    def gpu_stats(self) -> Dict[int, GpuStats]:
+        """What a GPU probe would report for the running jobs."""
+        stats = {cuda_id: GpuStats(0.0, 0.0, self.gpu_memory_mb) for cuda_id in self.cuda_list}
+        for job in self._processes:
+            spec = self.specs[job]
+            for cuda_id in job._resource.get_cuda_ids():
+                stats[cuda_id].utilization += spec.gpu_utilization
+                stats[cuda_id].memory_used_mb += spec.gpu_memory_mb
+        for gpu in stats.values():
+            gpu.utilization = min(gpu.utilization, 100.0)
+        return stats
+
+    async def _spawn_process(self, job: Job):
+        spec = self.specs[job]
+        self._next_pid += 1
+        cuda_ids = job._resource.get_cuda_ids()
+        fail = spec.fail or bool(self.failing_cuda_ids.intersection(cuda_ids))
+        demand = {cuda_id: spec.gpu_utilization for cuda_id in cuda_ids}
+        for other in self._processes:
+            for cuda_id in other._resource.get_cuda_ids():
+                if cuda_id in demand:
+                    demand[cuda_id] += self.specs[other].gpu_utilization
+        slowdown = max([1.0] + [utilization / 100.0 for utilization in demand.values()])
+        return SimulatedProcess(self._next_pid, spec.duration * slowdown, 1 if fail else 0)
+
+
+@dataclass
+class SimulationResult:
+    num_jobs: int
+    num_gpus: int
+    num_failed: int
+    makespan: float
+    gpu_utilization: float
+    queue_wait_p50: float
+    queue_wait_p90: float
+    queue_wait_p99: float
+    queue_wait_mean: float
+    extra: Dict[str, float] = field(default_factory=dict)
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def run_simulation(
+    cuda_list: List[int],
+    workload: Sequence[SimulatedJobSpec],
+    callbacks: Optional[List[Callback]] = None,
+    quiet: bool = True,
+    **launcher_kwargs,
+) -> SimulationResult:
+    """Simulates `workload` on `cuda_list` in virtual time; `launcher_kwargs` are passed to the launcher."""
+    previous_disable = logging.root.manager.disable
+    if quiet:
+        logging.disable(logging.CRITICAL)
+    try:
+        with virtual_event_loop() as loop:
+            launcher = SimulatedLauncher(cuda_list, workload, callbacks=callbacks, **launcher_kwargs)
+            loop.run_until_complete(launcher._start())
+    finally:
+        logging.disable(previous_disable)
+
+    recorder = launcher.recorder
+    jobs = list(launcher.specs.keys())
+    waits = [recorder.start_times[job] - recorder.submit_times[job] for job in jobs if job in recorder.start_times]
+    makespan = max(recorder.end_times.values(), default=0.0)
+    busy_gpu_seconds = sum(
+        (recorder.end_times[job] - recorder.start_times[job]) * job._resource.count_available(ResourceType.CUDA)
+        for job in jobs if job in recorder.start_times and job in recorder.end_times
+    )
+    return SimulationResult(
+        num_jobs=len(jobs),
+        num_gpus=len(cuda_list),
+        num_failed=sum(1 for job in jobs if job.status == JobStatus.FAILED),
+        makespan=makespan,
+        gpu_utilization=busy_gpu_seconds / (len(cuda_list) * makespan) if makespan > 0 else 0.0,
+        queue_wait_p50=quantile(waits, 0.5),
+        queue_wait_p90=quantile(waits, 0.9),
+        queue_wait_p99=quantile(waits, 0.99),
+        queue_wait_mean=sum(waits) / len(waits) if waits else 0.0,
+        extra={'num_requeued': float(recorder.num_requeued)} if recorder.num_requeued else {},
+    )
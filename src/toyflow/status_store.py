@@ -0,0 +1,222 @@
+import functools
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+logging.basicConfig(level=logging.INFO)
+
+# Not in the launch directory, which is often a log dir on a network filesystem shared by many runs.
+DEFAULT_STATUS_DB = os.path.join(os.path.expanduser('~'), '.toyflow', 'status.db')
+# WAL needs shared memory between processes, which these filesystems do not provide.
+NETWORK_FILESYSTEMS = {
+    'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'lustre', 'gpfs', 'beegfs', 'afs', 'ceph', 'glusterfs',
+    'fuse.glusterfs', 'fuse.sshfs', 'fuse.s3fs',
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    host TEXT,
+    pid INTEGER,
+    cwd TEXT,
+    num_jobs INTEGER,
+    start_time REAL,
+    end_time REAL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    run_id INTEGER NOT NULL,
+    job_id INTEGER NOT NULL,
+    job_name TEXT,
+    cmd TEXT,
+    cwd TEXT,
+    log_dir TEXT,
+    cuda_quantity INTEGER,
+    status TEXT,
+    attempts INTEGER DEFAULT 0,
+    cuda TEXT,
+    pid INTEGER,
+    submit_time REAL,
+    start_time REAL,
+    end_time REAL,
+    returncode INTEGER,
+    exception TEXT,
+    extra_info TEXT,
+    resource_usage TEXT,
+    PRIMARY KEY (run_id, job_id)
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (run_id, status);
+CREATE INDEX IF NOT EXISTS jobs_name ON jobs (job_name);
+CREATE TABLE IF NOT EXISTS attempts (
+    run_id INTEGER NOT NULL,
+    job_id INTEGER NOT NULL,
+    attempt INTEGER NOT NULL,
+    cuda TEXT,
+    pid INTEGER,
+    start_time REAL,
+    end_time REAL,
+    returncode INTEGER,
+    exception TEXT,
+    resource_usage TEXT,
+    PRIMARY KEY (run_id, job_id, attempt)
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL,
+    job_id INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    line INTEGER NOT NULL,
+    resources TEXT,
+    data TEXT,
+    PRIMARY KEY (run_id, job_id, path, line)
+);
+"""
+
+
+def get_filesystem_type(path) -> Optional[str]:
+    """Type of the filesystem holding `path`, from the longest matching mount point in /proc/mounts."""
+    path = os.path.realpath(path)
+    best, best_type = '', None
+    try:
+        with open('/proc/mounts', 'r', encoding='utf-8') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount_point = fields[1].replace('\\040', ' ')
+                if (path == mount_point or path.startswith(mount_point.rstrip('/') + '/')) \
+                        and len(mount_point) > len(best):
+                    best, best_type = mount_point, fields[2]
+    except OSError:
+        return None
+    return best_type
+
+
+@functools.lru_cache(maxsize=None)
+def _journal_mode(path: Path) -> str:
+    fs_type = get_filesystem_type(path.parent)
+    if fs_type in NETWORK_FILESYSTEMS:
+        logging.warning(f'{path} is on {fs_type}, where SQLite cannot use WAL; falling back to a rollback '
+                        'journal, so `toyflow status` may wait while the launcher writes.')
+        return 'DELETE'
+    return 'WAL'
+
+
+def connect(path, readonly: bool = False) -> sqlite3.Connection:
+    if readonly:
+        conn = sqlite3.connect(f'{Path(path).resolve().as_uri()}?mode=ro', uri=True, timeout=10)
+    else:
+        path = Path(path).resolve()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30)
+        # WAL lets `toyflow status` read while the launcher writes.
+        mode = _journal_mode(path)
+        actual = conn.execute(f'PRAGMA journal_mode={mode}').fetchone()[0]
+        if actual.upper() != mode:
+            logging.warning(f'SQLite kept journal mode {actual} for {path} instead of {mode}.')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(SCHEMA)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+class StatusStore:
+    """A SQLite database with a row per job and per attempt, written on a background thread.
+
+    Statements are queued by `execute` and committed in batches, so the event loop never waits for the disk.
+    """
+
+    _STOP = object()
+
+    def __init__(self, path):
+        self.path = Path(path)
+        conn = connect(self.path)
+        conn.close()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='toyflow-status-store', daemon=True)
+        self._thread.start()
+
+    def insert_run(self, host: str, pid: int, cwd: str, num_jobs: int, start_time: float) -> int:
+        conn = connect(self.path)
+        try:
+            with conn:
+                cursor = conn.execute(
+                    'INSERT INTO runs (host, pid, cwd, num_jobs, start_time) VALUES (?, ?, ?, ?, ?)',
+                    (host, pid, cwd, num_jobs, start_time))
+            return cursor.lastrowid
+        finally:
+            conn.close()
+
+    def execute(self, sql: str, params: Sequence[Any] = ()):
+        self._queue.put((sql, params))
+
+    def executemany(self, sql: str, rows: List[Sequence[Any]]):
+        self._queue.put((sql, rows, True))
+
+    def submit(self, fn: Callable[[sqlite3.Connection], None]):
+        """Runs `fn(conn)` on the writer thread, after the statements queued before it."""
+        self._queue.put((fn,))
+
+    def _apply(self, conn: sqlite3.Connection, item: tuple):
+        """Applies one queued item in a savepoint, so that a failing item neither undoes the rest of its batch
+        nor stops the writer thread."""
+        conn.execute('SAVEPOINT item')
+        try:
+            if len(item) == 1:
+                item[0](conn)
+            elif len(item) == 3:
+                conn.executemany(item[0], item[1])
+            else:
+                conn.execute(*item)
+        except Exception as e:  # pylint: disable=broad-except
+            conn.execute('ROLLBACK TO item')
+            logging.warning(f'Failed to update {self.path}: {e!r}')
+        conn.execute('RELEASE item')
+
+    def _run(self):
+        conn = connect(self.path)
+        try:
+            while True:
+                items = [self._queue.get()]
+                while True:
+                    try:
+                        items.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                stop = any(item is self._STOP for item in items)
+                try:
+                    conn.execute('BEGIN')
+                    for item in items:
+                        if item is not self._STOP:
+                            self._apply(conn, item)
+                    conn.commit()
+                except sqlite3.Error as e:
+                    conn.rollback()
+                    logging.warning(f'Failed to update {self.path}: {e!r}')
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def close(self, timeout: Optional[float] = None):
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join(timeout)
+
+
+def query(path, sql: str, params: Sequence[Any] = ()) -> Tuple[List[str], List[tuple]]:
+    """Runs a read-only query and returns the column names and rows."""
+    conn = connect(path, readonly=True)
+    try:
+        cursor = conn.execute(sql, params)
+        columns = [description[0] for description in cursor.description or ()]
+        return columns, [tuple(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+def latest_run_id(path) -> Optional[int]:
+    _, rows = query(path, 'SELECT MAX(run_id) FROM runs')
+    return rows[0][0] if rows else None
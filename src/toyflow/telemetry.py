@@ -0,0 +1,183 @@
+import asyncio
+import contextlib
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from toyflow.job import Job
+from toyflow.utils.config import build_config
+from toyflow.utils.gpu_probe import GpuProbe, GpuStats, get_default_gpu_probe
+from toyflow.utils.proc_stats import (ProcSample, get_children_map,
+                                      get_process_tree, read_proc_sample)
+
+logging.basicConfig(level=logging.INFO)
+
+
+@dataclass
+class TelemetryConfig:
+    telemetry_interval: float = 5.0
+    disable_telemetry: bool = False
+    disable_gpu_telemetry: bool = False
+
+
+@dataclass
+class _GpuUsage:
+    num_samples: int = 0
+    utilization_sum: float = 0.0
+    peak_utilization: float = 0.0
+    peak_memory_used_mb: float = 0.0
+    memory_total_mb: float = 0.0
+    last_utilization: float = 0.0
+
+    def add(self, stats: GpuStats):
+        self.num_samples += 1
+        self.last_utilization = stats.utilization
+        self.utilization_sum += stats.utilization
+        self.peak_utilization = max(self.peak_utilization, stats.utilization)
+        self.peak_memory_used_mb = max(self.peak_memory_used_mb, stats.memory_used_mb)
+        self.memory_total_mb = stats.memory_total_mb
+
+
+@dataclass
+class _JobUsage:
+    pid: int
+    start_time: float
+    base_cpu_time: float
+    base_read_bytes: int = 0
+    base_write_bytes: int = 0
+    num_samples: int = 0
+    cpu_time: float = 0.0
+    rss_sum: float = 0.0
+    rss: int = 0
+    peak_rss: int = 0
+    threads_sum: float = 0.0
+    peak_threads: int = 0
+    read_bytes: int = 0
+    write_bytes: int = 0
+    gpus: Dict[int, _GpuUsage] = field(default_factory=dict)
+    # Roots of the other process trees of the job, e.g. the other ranks of a distributed job.
+    other_pids: List[int] = field(default_factory=list)
+
+    def add(self, sample: ProcSample):
+        if sample.num_processes == 0:
+            return
+        self.num_samples += 1
+        # Exited descendants drop out of the tree, so keep the largest totals seen.
+        self.cpu_time = max(self.cpu_time, sample.cpu_time - self.base_cpu_time)
+        self.rss_sum += sample.rss_bytes
+        self.rss = sample.rss_bytes
+        self.peak_rss = max(self.peak_rss, sample.rss_bytes)
+        self.threads_sum += sample.num_threads
+        self.peak_threads = max(self.peak_threads, sample.num_threads)
+        self.read_bytes = max(self.read_bytes, sample.read_bytes - self.base_read_bytes)
+        self.write_bytes = max(self.write_bytes, sample.write_bytes - self.base_write_bytes)
+
+    def summary(self) -> Dict[str, Any]:
+        n = max(self.num_samples, 1)
+        wall_time = time.monotonic() - self.start_time
+        return {
+            'num_samples': self.num_samples,
+            'wall_time_s': round(wall_time, 3),
+            'cpu_time_s': round(self.cpu_time, 3),
+            'avg_cpu_cores': round(self.cpu_time / wall_time, 3) if wall_time > 0 else 0.0,
+            'peak_rss_mb': round(self.peak_rss / 2 ** 20, 1),
+            'avg_rss_mb': round(self.rss_sum / n / 2 ** 20, 1),
+            'rss_mb': round(self.rss / 2 ** 20, 1),
+            'peak_threads': self.peak_threads,
+            'avg_threads': round(self.threads_sum / n, 1),
+            'io_read_bytes': self.read_bytes,
+            'io_write_bytes': self.write_bytes,
+            'gpus': {
+                rid: {
+                    'avg_utilization': round(gpu.utilization_sum / max(gpu.num_samples, 1), 1),
+                    'peak_utilization': gpu.peak_utilization,
+                    'peak_memory_used_mb': gpu.peak_memory_used_mb,
+                    'memory_total_mb': gpu.memory_total_mb,
+                } for rid, gpu in self.gpus.items()
+            },
+        }
+
+
+class ResourceSampler:
+    """Periodically samples the process tree (and GPUs) of all running jobs in one task."""
+
+    config_cls = TelemetryConfig
+
+    @classmethod
+    def from_config(cls, **kwargs):
+        return cls(build_config(cls.config_cls, **kwargs))
+
+    def __init__(self, config: TelemetryConfig, gpu_probe: Optional[GpuProbe] = None):
+        self.config = config
+        if gpu_probe is None and not config.disable_gpu_telemetry:
+            gpu_probe = get_default_gpu_probe()
+        self.gpu_probe = gpu_probe
+        self._tracked: Dict[Job, _JobUsage] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.config.disable_telemetry or self._task is not None:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+
+    def track(self, job: Job, pids: Union[int, List[int]]):
+        """Samples the process trees of `pids`, e.g. the ranks of a distributed job, as the usage of `job`."""
+        if self.config.disable_telemetry:
+            return
+        pids = [pids] if isinstance(pids, int) else list(pids)
+        # Pool workers are reused, so only count the CPU time and I/O after this point.
+        base = read_proc_sample(pids)
+        self._tracked[job] = _JobUsage(
+            pid=pids[0], other_pids=pids[1:], start_time=time.monotonic(), base_cpu_time=base.cpu_time,
+            base_read_bytes=base.read_bytes, base_write_bytes=base.write_bytes)
+        job._usage = {}
+
+    def untrack(self, job: Job):
+        usage = self._tracked.pop(job, None)
+        if usage is not None:
+            job._usage = usage.summary()
+
+    def last_gpu_utilization(self, job: Job) -> Optional[float]:
+        """Highest utilization of the GPUs of `job` in the latest sample, if they were sampled."""
+        usage = self._tracked.get(job)
+        if usage is None or not usage.gpus:
+            return None
+        return max(gpu.last_utilization for gpu in usage.gpus.values())
+
+    def _sample(self, targets: List[Tuple[Job, List[int]]]):
+        children_map = get_children_map()
+        proc_samples = [read_proc_sample([pid for root in roots for pid in get_process_tree(root, children_map)])
+                        for _, roots in targets]
+        gpu_stats = self.gpu_probe.query() if self.gpu_probe is not None else {}
+        return proc_samples, gpu_stats
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.config.telemetry_interval)
+            if not self._tracked:
+                continue
+            targets = [(job, [usage.pid] + usage.other_pids) for job, usage in self._tracked.items()]
+            try:
+                proc_samples, gpu_stats = await loop.run_in_executor(None, self._sample, targets)
+            except Exception as e:  # pylint: disable=broad-except
+                logging.warning(f'Failed to sample resource usage: {e!r}')
+                continue
+            for (job, _), sample in zip(targets, proc_samples):
+                usage = self._tracked.get(job)
+                if usage is None:
+                    continue
+                usage.add(sample)
+                for rid in job._resource.get_cuda_ids():
+                    if rid in gpu_stats:
+                        usage.gpus.setdefault(rid, _GpuUsage()).add(gpu_stats[rid])
+                job._usage = usage.summary()
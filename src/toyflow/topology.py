@@ -0,0 +1,161 @@
+import itertools
+import json
+import logging
+import math
+import re
+import subprocess
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from toyflow.utils.config import build_config
+
+logging.basicConfig(level=logging.INFO)
+
+# Higher is better connected; NV# links additionally count the number of bonded NVLinks.
+LINK_SCORES = {
+    'PIX': 50.0,
+    'PXB': 40.0,
+    'PHB': 30.0,
+    'NODE': 20.0,
+    'SYS': 10.0,
+    'SOC': 10.0,
+}
+NVLINK_BASE_SCORE = 100.0
+
+
+@dataclass
+class PlacementConfig:
+    gpu_placement: str = 'greedy'  # or 'topology'
+    gpu_topology_file: Optional[str] = None
+
+
+def link_score(link: str) -> float:
+    link = link.strip().upper()
+    match = re.fullmatch(r'NV(\d+)', link)
+    if match:
+        return NVLINK_BASE_SCORE + int(match.group(1))
+    return LINK_SCORES.get(link, 0.0)
+
+
+class GpuTopology:
+    """Pairwise link scores between GPUs, as reported by `nvidia-smi topo -m`."""
+
+    def __init__(self, scores: Dict[int, Dict[int, float]]):
+        self.scores = scores
+
+    def score(self, a: int, b: int) -> float:
+        return self.scores.get(a, {}).get(b, 0.0)
+
+    @classmethod
+    def from_text(cls, text: str) -> "GpuTopology":
+        """Parses the matrix printed by `nvidia-smi topo -m`."""
+        scores: Dict[int, Dict[int, float]] = {}
+        gpu_columns: List[int] = []
+        # The header row is underlined with ANSI escape codes.
+        text = re.sub(r'\x1b\[[0-9;]*m', '', text)
+        for line in text.splitlines():
+            tokens = line.split()
+            if not tokens or not re.fullmatch(r'GPU\d+', tokens[0]):
+                continue
+            if not gpu_columns:
+                # The header comes first: GPU0 GPU1 ... NIC0 CPU Affinity ...
+                gpu_columns = [
+                    int(x[3:]) for x in itertools.takewhile(lambda x: re.fullmatch(r'GPU\d+', x), tokens)
+                ]
+                continue
+            row = int(tokens[0][3:])
+            links = tokens[1:1 + len(gpu_columns)]
+            scores[row] = {
+                column: link_score(link) for column, link in zip(gpu_columns, links) if column != row
+            }
+        if not scores:
+            raise ValueError('No GPU topology matrix found.')
+        return cls(scores)
+
+    @classmethod
+    def from_file(cls, path) -> "GpuTopology":
+        """Reads a saved `nvidia-smi topo -m` output, or JSON like `{"0": {"1": "NV12", "2": "SYS"}}`."""
+        text = Path(path).read_text(encoding='utf-8')
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            return cls.from_text(text)
+        return cls({
+            int(a): {
+                int(b): link if isinstance(link, (int, float)) else link_score(link)
+                for b, link in row.items() if int(b) != int(a)
+            } for a, row in data.items()
+        })
+
+    @classmethod
+    def from_nvidia_smi(cls) -> "GpuTopology":
+        output = subprocess.run(
+            ['nvidia-smi', 'topo', '-m'], capture_output=True, text=True, check=True, timeout=30
+        ).stdout
+        return cls.from_text(output)
+
+
+class TopologyPlacement:
+    """Picks the best connected set of free GPUs.
+
+    Candidates are compared by their weakest link, then their total link score, and then by how little
+    they are connected to the GPUs left free, so that well connected groups stay whole for larger jobs.
+    """
+
+    def __init__(self, topology: GpuTopology, max_combinations: int = 5000):
+        self.topology = topology
+        self.max_combinations = max_combinations
+
+    def _sum_scores(self, group_a: Iterable[int], group_b: Iterable[int]) -> float:
+        group_b = list(group_b)
+        return sum(self.topology.score(a, b) for a in group_a for b in group_b)
+
+    def _rank(self, candidate: Tuple[int, ...], free_ids: List[int]) -> Tuple:
+        pair_scores = [self.topology.score(a, b) for a, b in itertools.combinations(candidate, 2)]
+        rest = [rid for rid in free_ids if rid not in candidate]
+        return (
+            min(pair_scores, default=0.0),
+            sum(pair_scores),
+            -self._sum_scores(candidate, rest),
+            [-free_ids.index(rid) for rid in candidate],
+        )
+
+    def _greedy_candidates(self, free_ids: List[int], num_gpus: int):
+        for seed in free_ids:
+            group = [seed]
+            while len(group) < num_gpus:
+                best = max(
+                    (rid for rid in free_ids if rid not in group),
+                    key=lambda rid: (
+                        min(self.topology.score(rid, other) for other in group),
+                        sum(self.topology.score(rid, other) for other in group),
+                    ),
+                )
+                group.append(best)
+            yield tuple(sorted(group, key=free_ids.index))
+
+    def choose(self, free_ids: List[int], num_gpus: int) -> Optional[List[int]]:
+        if num_gpus > len(free_ids):
+            return None
+        if num_gpus == 0:
+            return []
+        if math.comb(len(free_ids), num_gpus) <= self.max_combinations:
+            candidates = itertools.combinations(free_ids, num_gpus)
+        else:
+            candidates = self._greedy_candidates(free_ids, num_gpus)
+        return list(max(candidates, key=lambda candidate: self._rank(candidate, free_ids)))
+
+
+def build_gpu_placement(**kwargs) -> Optional[TopologyPlacement]:
+    config = build_config(PlacementConfig, **kwargs)
+    if config.gpu_placement == 'greedy':
+        return None
+    if config.gpu_placement != 'topology':
+        raise ValueError(f'Unknown gpu_placement: {config.gpu_placement}')
+    if config.gpu_topology_file:
+        topology = GpuTopology.from_file(config.gpu_topology_file)
+    else:
+        topology = GpuTopology.from_nvidia_smi()
+    logging.info(f'Using topology-aware GPU placement over {sorted(topology.scores)}')
+    return TopologyPlacement(topology)
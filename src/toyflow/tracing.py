@@ -0,0 +1,104 @@
+import contextlib
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from toyflow.utils.config import build_config
+
+logging.basicConfig(level=logging.INFO)
+
+SCHEDULER_TID = 0
+CALLBACK_TID = 1
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+@dataclass
+class TracerConfig:
+    trace_file: Optional[str] = None
+
+
+class NullTracer:
+    """The tracer used when tracing is off; every method is a no-op."""
+
+    enabled = False
+
+    def span(self, name: str, tid: int = SCHEDULER_TID, args: Optional[Dict[str, Any]] = None):
+        return _NULL_SPAN
+
+    def complete(self, name: str, start: float, end: float, tid: int = SCHEDULER_TID,
+                 args: Optional[Dict[str, Any]] = None):
+        pass
+
+    def counter(self, name: str, values: Dict[str, float]):
+        pass
+
+    def set_track_name(self, tid: int, name: str):
+        pass
+
+    def save(self):
+        pass
+
+
+class Tracer(NullTracer):
+    """Records spans and counters, and saves them in the Chrome trace format (opens in Perfetto)."""
+
+    enabled = True
+
+    def __init__(self, trace_file: str):
+        self.trace_file = Path(trace_file)
+        self.events = []
+        self._pid = os.getpid()
+        self._origin = time.perf_counter()
+        self.set_track_name(SCHEDULER_TID, 'scheduler')
+        self.set_track_name(CALLBACK_TID, 'callbacks')
+
+    def _ts(self, t: float) -> float:
+        return (t - self._origin) * 1e6
+
+    @contextlib.contextmanager
+    def span(self, name: str, tid: int = SCHEDULER_TID, args: Optional[Dict[str, Any]] = None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.complete(name, start, time.perf_counter(), tid, args)
+
+    def complete(self, name: str, start: float, end: float, tid: int = SCHEDULER_TID,
+                 args: Optional[Dict[str, Any]] = None):
+        event = {
+            'name': name, 'ph': 'X', 'pid': self._pid, 'tid': tid,
+            'ts': self._ts(start), 'dur': (end - start) * 1e6,
+        }
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    def counter(self, name: str, values: Dict[str, float]):
+        self.events.append({
+            'name': name, 'ph': 'C', 'pid': self._pid,
+            'ts': self._ts(time.perf_counter()), 'args': values,
+        })
+
+    def set_track_name(self, tid: int, name: str):
+        self.events.append({
+            'name': 'thread_name', 'ph': 'M', 'pid': self._pid, 'tid': tid,
+            'args': {'name': name},
+        })
+
+    def save(self):
+        self.trace_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.trace_file, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f, default=str)
+        logging.info(f'Trace with {len(self.events)} events saved to {self.trace_file}')
+
+
+def build_tracer(**kwargs) -> NullTracer:
+    config = build_config(TracerConfig, **kwargs)
+    if config.trace_file:
+        return Tracer(config.trace_file)
+    return NullTracer()
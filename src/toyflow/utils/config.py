@@ -0,0 +1,11 @@
+from dataclasses import fields
+from typing import Any, Type, TypeVar
+
+T = TypeVar('T')
+
+
+def build_config(config_cls: Type[T], **kwargs: Any) -> T:
+    """Builds `config_cls` from the subset of `kwargs` that are fields of it."""
+    valid_keys = {field.name for field in fields(config_cls)}
+    filtered_kwargs = {k: v for k, v in kwargs.items() if k in valid_keys}
+    return config_cls(**filtered_kwargs)
@@ -0,0 +1,67 @@
+import logging
+import shutil
+import subprocess
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+
+@dataclass
+class GpuStats:
+    utilization: float  # percent
+    memory_used_mb: float
+    memory_total_mb: float
+
+
+class GpuProbe:
+    """Reports the current utilization and memory of each GPU, keyed by device index."""
+    # Whether `query` blocks, so that it has to run on a thread.
+    blocking = True
+
+    def query(self) -> Dict[int, GpuStats]:
+        raise NotImplementedError
+
+
+class NvidiaSmiGpuProbe(GpuProbe):
+    def __init__(self, executable: str = 'nvidia-smi', timeout: float = 10):
+        self.executable = executable
+        self.timeout = timeout
+
+    def query(self) -> Dict[int, GpuStats]:
+        try:
+            output = subprocess.run(
+                [self.executable, '--query-gpu=index,utilization.gpu,memory.used,memory.total',
+                 '--format=csv,noheader,nounits'],
+                capture_output=True, text=True, check=True, timeout=self.timeout,
+            ).stdout
+        except (OSError, subprocess.SubprocessError) as e:
+            logging.warning(f'Failed to query GPUs with {self.executable}: {e}')
+            return {}
+        result = {}
+        for line in output.strip().splitlines():
+            try:
+                index, utilization, memory_used, memory_total = [x.strip() for x in line.split(',')]
+                result[int(index)] = GpuStats(float(utilization), float(memory_used), float(memory_total))
+            except ValueError:
+                continue
+        return result
+
+
+class FakeGpuProbe(GpuProbe):
+    """Reports `stats`, or what `stats_fn` returns, e.g. for tests and simulations."""
+    blocking = False
+
+    def __init__(self, stats: Optional[Dict[int, GpuStats]] = None,
+                 stats_fn: Optional[Callable[[], Dict[int, GpuStats]]] = None):
+        self.stats = dict(stats or {})
+        self.stats_fn = stats_fn
+
+    def query(self) -> Dict[int, GpuStats]:
+        if self.stats_fn is not None:
+            return self.stats_fn()
+        return dict(self.stats)
+
+
+def get_default_gpu_probe() -> Optional[GpuProbe]:
+    if shutil.which('nvidia-smi'):
+        return NvidiaSmiGpuProbe()
+    return None
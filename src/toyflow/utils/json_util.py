@@ -1,27 +1,47 @@
 import json
 import logging
+import os
 from pathlib import Path
 from typing import Any
 
 
-def dump_json(obj: Any, file_path: str | Path):
-    num_not_standard_objs = [0]
+def dumps_json(obj: Any) -> str:
+    num_not_standard_objs = 0
 
-    class CustomEncoder(json.JSONEncoder):
-        def default(self, obj):
-            try:
-                return super().default(obj)
-            except TypeError:
-                num_not_standard_objs[0] += 1
-                return str(obj)
+    def to_str(o):
+        nonlocal num_not_standard_objs
+        num_not_standard_objs += 1
+        return str(o)
 
-    Path(file_path).parent.mkdir(exist_ok=True, parents=True)
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(obj, f, indent=2, cls=CustomEncoder)
-    if num_not_standard_objs[0] > 0:
+    text = json.dumps(obj, indent=2, default=to_str)
+    if num_not_standard_objs > 0:
         logging.warning(
-            f"[WARN] {num_not_standard_objs[0]} objs are not serializable and are converted to string format.")
-    return Path(file_path)
+            f"[WARN] {num_not_standard_objs} objs are not serializable and are converted to string format.")
+    return text
+
+
+def write_text(text: str, file_path: str | Path, atomic: bool = False):
+    """With `atomic`, readers see either the old or the new file, never a partial one."""
+    file_path = Path(file_path)
+    file_path.parent.mkdir(exist_ok=True, parents=True)
+    if not atomic:
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return file_path
+    tmp_path = file_path.with_name(f'.{file_path.name}.{os.getpid()}.tmp')
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, file_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return file_path
+
+
+def dump_json(obj: Any, file_path: str | Path, atomic: bool = False):
+    """Writes `obj` as indented JSON, see `write_text`."""
+    return write_text(dumps_json(obj), file_path, atomic=atomic)
 
 
 def load_json(file_path: str | Path):
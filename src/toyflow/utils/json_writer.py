@@ -0,0 +1,90 @@
+import atexit
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from toyflow.utils.json_util import dumps_json, write_text
+
+logging.basicConfig(level=logging.INFO)
+
+
+def _write_text_atomic(text: str, path: Path):
+    write_text(text, path, atomic=True)
+
+
+class CoalescingJsonWriter:
+    """Writes JSON files on a background thread, keeping only the latest pending content per path.
+
+    `submit` never touches the filesystem, so it is safe to call from the event loop. When several
+    updates of the same file arrive while the thread is busy, only the last one is written.
+    """
+
+    def __init__(self, write_fn: Callable[[str, Path], None] = _write_text_atomic):
+        self.write_fn = write_fn
+        self._pending: Dict[Path, str] = {}
+        self._writing = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self.num_submitted = 0
+        self.num_written = 0
+
+    def submit(self, obj: Any, path):
+        """Schedules a write of `obj`, serialized right away, so the caller may keep updating it."""
+        text = dumps_json(obj)
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='toyflow-json-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+            self._pending[Path(path)] = text
+            self.num_submitted += 1
+            self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                batch, self._pending = self._pending, {}
+                self._writing = True
+            for path, text in batch.items():
+                try:
+                    self.write_fn(text, path)
+                except Exception as e:
+                    logging.warning(f'Failed to write {path}: {e!r}')
+            with self._condition:
+                self.num_written += len(batch)
+                self._writing = False
+                self._condition.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Waits until everything submitted so far is written. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._pending or self._writing:
+                if self._thread is None or not self._thread.is_alive():
+                    return False
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = None):
+        """Writes what is pending and stops the thread. A later `submit` starts a new one."""
+        with self._condition:
+            thread = self._thread
+            if thread is None:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        thread.join(timeout)
+        atexit.unregister(self.close)
+        with self._condition:
+            self._thread = None
+            self._closed = False
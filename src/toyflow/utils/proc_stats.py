@@ -0,0 +1,106 @@
+import os
+import signal
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+@dataclass
+class ProcSample:
+    cpu_time: float = 0.0  # seconds, including reaped children
+    rss_bytes: int = 0
+    num_threads: int = 0
+    read_bytes: int = 0
+    write_bytes: int = 0
+    num_processes: int = 0
+
+
+def _read_stat_fields(pid: int) -> Optional[List[str]]:
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            data = f.read().decode('utf-8', errors='replace')
+    except OSError:
+        return None
+    # `comm` may contain spaces and parentheses, so split after the last ')'.
+    # The returned list starts from field 3 (`state`).
+    return data[data.rfind(')') + 2:].split()
+
+
+def get_process_start_time(pid: int) -> Optional[int]:
+    """Start time of `pid` in clock ticks after boot, which tells it apart from a later process with the same pid."""
+    fields = _read_stat_fields(pid)
+    # `starttime` is field 22.
+    return int(fields[19]) if fields is not None else None
+
+
+def get_children_map() -> Dict[int, List[int]]:
+    """Scans /proc once and maps each pid to its direct children."""
+    children: Dict[int, List[int]] = {}
+    try:
+        entries = os.listdir('/proc')
+    except OSError:
+        return children
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        fields = _read_stat_fields(int(entry))
+        if fields is None:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(entry))
+    return children
+
+
+def get_process_tree(root_pid: int, children_map: Optional[Dict[int, List[int]]] = None) -> List[int]:
+    if children_map is None:
+        children_map = get_children_map()
+    result = []
+    stack = [root_pid]
+    while stack:
+        pid = stack.pop()
+        result.append(pid)
+        stack.extend(children_map.get(pid, ()))
+    return result
+
+
+def signal_pids(pids: Iterable[int], sig: int = signal.SIGKILL) -> List[int]:
+    """Sends `sig` to each of `pids` and returns the ones that still existed."""
+    result = []
+    for pid in pids:
+        try:
+            os.kill(pid, sig)
+        except (ProcessLookupError, PermissionError):
+            continue
+        result.append(pid)
+    return result
+
+
+def kill_process_tree(root_pid: int, sig: int = signal.SIGTERM) -> List[int]:
+    """Sends `sig` to `root_pid` and all its descendants, children first."""
+    return signal_pids(get_process_tree(root_pid)[::-1], sig)
+
+
+def read_proc_sample(pids: Iterable[int]) -> ProcSample:
+    """Sums the usage of `pids`; processes that are gone are skipped."""
+    sample = ProcSample()
+    for pid in pids:
+        fields = _read_stat_fields(pid)
+        if fields is None:
+            continue
+        # utime, stime, cutime, cstime are fields 14-17; num_threads is 20; rss is 24.
+        sample.cpu_time += sum(int(x) for x in fields[11:15]) / CLOCK_TICKS
+        sample.num_threads += int(fields[17])
+        sample.rss_bytes += int(fields[21]) * PAGE_SIZE
+        sample.num_processes += 1
+        try:
+            with open(f'/proc/{pid}/io', 'r', encoding='utf-8') as f:
+                for line in f:
+                    key, _, value = line.partition(':')
+                    if key == 'read_bytes':
+                        sample.read_bytes += int(value)
+                    elif key == 'write_bytes':
+                        sample.write_bytes += int(value)
+        except OSError:
+            pass
+    return sample
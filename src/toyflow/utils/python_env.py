@@ -2,7 +2,7 @@ import json
 import os
 import subprocess
 from copy import deepcopy
-from typing import Dict
+from typing import Dict, List, Optional
 
 
 def get_conda_env_info() -> Dict:
@@ -12,16 +12,17 @@ def get_conda_env_info() -> Dict:
     return conda_info
 
 
-def get_simple_conda_env_info(keywords: list[str]):
-    obj: dict = deepcopy(get_conda_env_info())
+def get_simple_conda_env_info(keywords: list[str], conda_info: Optional[Dict] = None):
+    obj: dict = deepcopy(conda_info if conda_info is not None else get_conda_env_info())
     obj.pop('channels', None)
     conda_dependencies = [
         x for x in obj.get('dependencies', tuple())
         if isinstance(x, str) and
         any(k.lower() in x.lower() for k in keywords)
     ]
-    pip_dict = obj.get('dependencies')[-1]
-    assert isinstance(pip_dict, dict) and 'pip' in pip_dict
+    # Envs without pip packages, e.g. a bare base env, have no pip section.
+    pip_dict = next((x for x in obj.get('dependencies', tuple()) if isinstance(x, dict) and 'pip' in x),
+                    {'pip': []})
     pip_dependencies = [
         x for x in pip_dict['pip']
         if isinstance(x, str) and
@@ -60,10 +61,15 @@ def get_git_info(path, return_diff=True):
     return output
 
 
-def get_pip_editable_packages_with_git_info(return_diff=False):
+def get_pip_editable_packages() -> List[Dict]:
     result = subprocess.run(
         ['pip', 'list', '--editable', '--format=json'], capture_output=True, text=True)
-    editable_packages = json.loads(result.stdout)
+    return json.loads(result.stdout)
+
+
+def get_pip_editable_packages_with_git_info(return_diff=False, editable_packages: Optional[List[Dict]] = None):
+    if editable_packages is None:
+        editable_packages = get_pip_editable_packages()
     packages_with_git_info = []
     for package in editable_packages:
         package_name = package['name']
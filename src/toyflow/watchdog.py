@@ -0,0 +1,221 @@
+import asyncio
+import contextlib
+import datetime
+import logging
+import os
+import shutil
+import signal
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from toyflow.job import Job, JobStatus
+from toyflow.telemetry import ResourceSampler
+from toyflow.utils.config import build_config
+from toyflow.utils.proc_stats import get_process_tree, signal_pids
+
+logging.basicConfig(level=logging.INFO)
+
+HANG_ACTIONS = ('fail', 'restart')
+STACK_DUMP_MODES = ('auto', 'py-spy', 'signal', 'none')
+
+
+@dataclass
+class WatchdogConfig:
+    # Seconds without new output on stdout or stderr after which a running job is HUNG; 0 disables the watchdog.
+    hang_timeout: float = 0.0
+    hang_check_interval: float = 30.0
+    # A silent job whose GPUs are busier than this (in %) still counts as active; needs GPU telemetry.
+    hang_gpu_utilization_threshold: Optional[float] = None
+    # 'fail' the hung job, or 'restart' it on the same GPUs as another attempt, at most `hang_max_restarts` times.
+    hang_action: str = 'fail'
+    hang_max_restarts: int = 1
+    # How to record where a hung job is stuck before it is killed: 'py-spy' appends `py-spy dump` of its Python
+    # processes to hang_stacks.txt in the log dir; 'signal' sends `hang_stack_signal` to them, e.g. for jobs
+    # that call `faulthandler.register(signal.SIGUSR1)`; 'auto' uses py-spy when it is installed.
+    hang_stack_dump: str = 'auto'
+    hang_stack_signal: str = 'SIGUSR1'
+    # Seconds to let the stack dump finish before the job is killed.
+    hang_stack_dump_timeout: float = 10.0
+
+
+@dataclass
+class _Watched:
+    process: object
+    output_size: int
+    last_activity: float
+    reason: Optional[str] = None
+
+
+def _output_size(job: Job) -> Optional[int]:
+    """Total size of the files that stdout and stderr of `job` go to, or None if neither is a file."""
+    total = None
+    for stream in (job._stdout, job._stderr):
+        if stream is sys.stdout or stream is sys.stderr:
+            continue
+        try:
+            size = os.fstat(stream.fileno()).st_size
+        except (AttributeError, OSError, ValueError):
+            continue
+        total = (total or 0) + size
+    return total
+
+
+def _python_pids(pids: List[int]) -> List[int]:
+    """The pids of Python interpreters; signals with a default action of exiting would kill the others."""
+    result = []
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/comm', 'r', encoding='utf-8') as f:
+                comm = f.read().strip()
+        except OSError:
+            continue
+        if comm.startswith('python'):
+            result.append(pid)
+    return result
+
+
+class Watchdog:
+    """Finds running jobs that stopped writing output, e.g. stuck in a collective or on a dead data loader.
+
+    One task checks all jobs every `hang_check_interval`. A job is HUNG once its output files did not grow
+    for `hang_timeout`; its stacks are dumped and its process tree is killed, and the launcher then fails or
+    restarts it.
+    """
+
+    config_cls = WatchdogConfig
+
+    @classmethod
+    def from_config(cls, kill_process: Callable[[object], None],
+                    resource_sampler: Optional[ResourceSampler] = None, **kwargs):
+        return cls(build_config(cls.config_cls, **kwargs), kill_process, resource_sampler)
+
+    def __init__(self, config: WatchdogConfig, kill_process: Callable[[object], None],
+                 resource_sampler: Optional[ResourceSampler] = None):
+        if config.hang_action not in HANG_ACTIONS:
+            raise ValueError(f'Unknown hang_action: {config.hang_action}')
+        if config.hang_stack_dump not in STACK_DUMP_MODES:
+            raise ValueError(f'Unknown hang_stack_dump: {config.hang_stack_dump}')
+        self.config = config
+        self.kill_process = kill_process
+        self.resource_sampler = resource_sampler
+        self._watched: Dict[Job, _Watched] = {}
+        self._restarts: Dict[Job, int] = {}
+        self._warned_unwatchable = False
+        self._task: Optional[asyncio.Task] = None
+        self._handlers = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.hang_timeout > 0
+
+    def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        for task in self._handlers:
+            task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await asyncio.gather(self._task, *self._handlers, return_exceptions=True)
+        self._task = None
+
+    def watch(self, job: Job, process):
+        if not self.enabled:
+            return
+        size = _output_size(job)
+        if size is None:
+            if not self._warned_unwatchable:
+                logging.warning('The watchdog needs the output of jobs in files, e.g. by the LoggingCallback; '
+                                f'{job.job_name} and other jobs that write to the console are not watched.')
+                self._warned_unwatchable = True
+            return
+        self._watched[job] = _Watched(process, size, time.monotonic())
+
+    def unwatch(self, job: Job) -> Optional[str]:
+        """Stops watching `job` after its process exited; returns why it was killed, if it was hung."""
+        watched = self._watched.pop(job, None)
+        return watched.reason if watched is not None else None
+
+    def should_restart(self, job: Job) -> bool:
+        if self.config.hang_action != 'restart' or self._restarts.get(job, 0) >= self.config.hang_max_restarts:
+            self._restarts.pop(job, None)
+            return False
+        self._restarts[job] = self._restarts.get(job, 0) + 1
+        return True
+
+    def _gpus_busy(self, job: Job) -> bool:
+        threshold = self.config.hang_gpu_utilization_threshold
+        if threshold is None or self.resource_sampler is None:
+            return False
+        utilization = self.resource_sampler.last_gpu_utilization(job)
+        return utilization is not None and utilization > threshold
+
+    def check(self, now: float):
+        for job, watched in list(self._watched.items()):
+            if watched.reason is not None:
+                continue
+            size = _output_size(job)
+            if size != watched.output_size or self._gpus_busy(job):
+                watched.output_size = size
+                watched.last_activity = now
+                continue
+            silence = now - watched.last_activity
+            if silence < self.config.hang_timeout:
+                continue
+            watched.reason = f'no output for {silence:.0f} seconds'
+            task = asyncio.get_running_loop().create_task(self._handle_hung(job, watched))
+            self._handlers.add(task)
+            task.add_done_callback(self._handlers.discard)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.config.hang_check_interval)
+            self.check(time.monotonic())
+
+    async def _handle_hung(self, job: Job, watched: _Watched):
+        logging.error(f'Job {job.job_name} (pid {job._pid}) is hung: {watched.reason}; killing it.')
+        job.status = JobStatus.HUNG
+        try:
+            await self._dump_stacks(job, getattr(watched.process, 'pids', [job._pid]))
+        except Exception as e:  # pylint: disable=broad-except
+            logging.warning(f'Failed to dump the stacks of {job.job_name}: {e!r}')
+        if job in self._watched:
+            self.kill_process(watched.process)
+
+    async def _dump_stacks(self, job: Job, root_pids: List[int]):
+        mode = self.config.hang_stack_dump
+        py_spy = shutil.which('py-spy')
+        if mode == 'auto':
+            mode = 'py-spy' if py_spy else 'none'
+        if mode == 'none':
+            return
+        # Of all the ranks of a distributed job, since a hung collective waits on whichever rank is behind.
+        pids = _python_pids([pid for root in root_pids for pid in get_process_tree(root)])
+        if mode == 'signal':
+            signal_pids(pids, getattr(signal, self.config.hang_stack_signal))
+            # The handlers write to the job's stderr; give them a moment before the kill.
+            await asyncio.sleep(min(self.config.hang_stack_dump_timeout, 2.0))
+            return
+        if py_spy is None:
+            logging.warning('hang_stack_dump is py-spy, but py-spy is not installed.')
+            return
+        path = Path(job.log_dir, 'hang_stacks.txt')
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(f'# {datetime.datetime.now().isoformat()} {job.job_name}\n')
+            f.flush()
+            for pid in pids:
+                process = await asyncio.create_subprocess_exec(
+                    py_spy, 'dump', '--pid', str(pid), stdout=f, stderr=f)
+                try:
+                    await asyncio.wait_for(process.wait(), self.config.hang_stack_dump_timeout)
+                except asyncio.TimeoutError:
+                    process.kill()
+                    await process.wait()
+        logging.info(f'Stacks of {job.job_name} are in {path}')
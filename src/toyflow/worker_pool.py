@@ -0,0 +1,314 @@
+import asyncio
+import contextlib
+import logging
+import multiprocessing
+import os
+import pickle
+import sys
+import traceback
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from toyflow.job import Job
+from toyflow.utils.config import build_config
+
+logging.basicConfig(level=logging.INFO)
+
+
+@dataclass
+class WorkerPoolConfig:
+    worker_max_tasks: int = 100
+    worker_max_rss_growth_mb: float = 4096.0
+    worker_start_method: str = 'spawn'
+
+
+def _get_rss_mb() -> float:
+    try:
+        with open('/proc/self/statm', 'r', encoding='utf-8') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@contextlib.contextmanager
+def _redirect_fds(stdout_path: Optional[str], stderr_path: Optional[str]):
+    saved = []
+    for fd, path, stream in ((1, stdout_path, sys.stdout), (2, stderr_path, sys.stderr)):
+        if path is None:
+            continue
+        stream.flush()
+        saved.append((fd, os.dup(fd), stream))
+        target = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+        os.dup2(target, fd)
+        os.close(target)
+    try:
+        yield
+    finally:
+        for fd, saved_fd, stream in saved:
+            stream.flush()
+            os.dup2(saved_fd, fd)
+            os.close(saved_fd)
+
+
+def _worker_main(conn, env: Dict[str, str]):
+    os.environ.clear()
+    os.environ.update(env)
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        fn, args, kwargs, cwd, stdout_path, stderr_path = task
+        with _redirect_fds(stdout_path, stderr_path):
+            try:
+                os.chdir(cwd)
+                reply = (0, fn(*args, **kwargs))
+            except SystemExit as e:
+                # Same exit codes as the interpreter: `sys.exit()` is 0, and a message is printed and is 1.
+                if e.code is None or isinstance(e.code, int):
+                    reply = (e.code or 0, None)
+                else:
+                    print(e.code, file=sys.stderr)
+                    reply = (1, None)
+            except BaseException as e:  # pylint: disable=broad-except
+                traceback.print_exc()
+                reply = (1, e)
+        try:
+            conn.send((*reply, _get_rss_mb()))
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            conn.send((1, RuntimeError(f'Failed to send back the result of {fn}: {e!r}'), _get_rss_mb()))
+
+
+class _Worker:
+    def __init__(self, ctx, env: Dict[str, str]):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, env))
+        # Pin the worker before its interpreter starts, so that the re-imported
+        # `__main__` of the launcher script sees the right devices as well.
+        old_cuda = os.environ.get('CUDA_VISIBLE_DEVICES')
+        os.environ['CUDA_VISIBLE_DEVICES'] = env.get('CUDA_VISIBLE_DEVICES', '')
+        try:
+            self.process.start()
+        finally:
+            if old_cuda is None:
+                os.environ.pop('CUDA_VISIBLE_DEVICES', None)
+            else:
+                os.environ['CUDA_VISIBLE_DEVICES'] = old_cuda
+        child_conn.close()
+        self.cuda_ids = {
+            int(cuda_id) for cuda_id in env.get('CUDA_VISIBLE_DEVICES', '').split(',') if cuda_id.strip().isdigit()
+        }
+        self.num_tasks = 0
+        self.base_rss_mb: Optional[float] = None
+        self.rss_mb: Optional[float] = None
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+    def stop(self, timeout: float = 5):
+        with contextlib.suppress(OSError, BrokenPipeError):
+            self.conn.send(None)
+        self.process.join(timeout=timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def retire(self, on_exit: Callable[["_Worker"], None], timeout: float = 5):
+        """Like `stop`, but without blocking the running event loop: the process is reaped once its sentinel
+        is readable, and killed if it is still alive after `timeout`. Stops it right away without a loop."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.stop(timeout)
+            on_exit(self)
+            return
+        with contextlib.suppress(OSError, BrokenPipeError):
+            self.conn.send(None)
+        self.conn.close()
+        sentinel = self.process.sentinel
+
+        def reap():
+            loop.remove_reader(sentinel)
+            deadline.cancel()
+            self.process.join()
+            on_exit(self)
+
+        def force_kill():
+            if self.process.is_alive():
+                logging.warning(f'Worker {self.process.pid} did not exit within {timeout}s; killing it.')
+                self.process.kill()
+
+        loop.add_reader(sentinel, reap)
+        deadline = loop.call_later(timeout, force_kill)
+
+
+class WorkerTask:
+    """A handle of a callable job on a pool worker, mimicking `asyncio.subprocess.Process`."""
+
+    def __init__(self, pool: "WorkerPool", key: Tuple, worker: _Worker, job: Job):
+        self._pool = pool
+        self._key = key
+        self._worker = worker
+        self._job = job
+        self.pid = worker.process.pid
+        self.returncode: Optional[int] = None
+
+    async def wait(self) -> int:
+        if self.returncode is not None:
+            return self.returncode
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        fd = self._worker.conn.fileno()
+
+        def _on_readable():
+            loop.remove_reader(fd)
+            try:
+                future.set_result(self._worker.conn.recv())
+            except Exception as e:  # pylint: disable=broad-except
+                future.set_exception(e)
+
+        loop.add_reader(fd, _on_readable)
+        try:
+            returncode, payload, rss_mb = await future
+        except (EOFError, OSError):
+            self._worker.kill()
+            self.returncode = self._worker.process.exitcode or -1
+            self._job._exception = RuntimeError(
+                f'Worker {self.pid} died with exit code {self._worker.process.exitcode}.')
+            return self.returncode
+        except Exception as e:  # pylint: disable=broad-except
+            returncode, payload, rss_mb = 1, RuntimeError(f'Failed to receive the result: {e!r}'), None
+
+        self._worker.num_tasks += 1
+        if rss_mb is not None:
+            self._worker.rss_mb = rss_mb
+            if self._worker.base_rss_mb is None:
+                self._worker.base_rss_mb = rss_mb
+        if returncode == 0:
+            self._job._result = payload
+        elif isinstance(payload, BaseException):
+            self._job._exception = payload
+        self.returncode = returncode
+        self._pool._release(self._key, self._worker)
+        return returncode
+
+    def kill(self):
+        # `wait` notices the closed pipe and discards the worker.
+        if self._worker.is_alive():
+            self._worker.process.kill()
+
+    terminate = kill
+
+
+class WorkerPool:
+    """Long-lived worker processes running `Job.fn`, reused across jobs with the same env."""
+
+    config_cls = WorkerPoolConfig
+
+    @classmethod
+    def from_config(cls, **kwargs):
+        return cls(build_config(cls.config_cls, **kwargs))
+
+    def __init__(self, config: WorkerPoolConfig):
+        self.config = config
+        self._ctx = multiprocessing.get_context(config.worker_start_method)
+        self._idle_workers: Dict[Tuple, List[_Worker]] = {}
+        # Workers that were asked to exit and have not been reaped yet.
+        self._retiring: Set[_Worker] = set()
+
+    @staticmethod
+    def _get_key(job: Job) -> Tuple:
+        # `job.env` already holds the allocated `CUDA_VISIBLE_DEVICES`.
+        return tuple(sorted(job.env.items()))
+
+    def _acquire(self, key: Tuple, job: Job) -> _Worker:
+        idle_workers = self._idle_workers.get(key, [])
+        while idle_workers:
+            worker = idle_workers.pop()
+            if worker.is_alive():
+                return worker
+            worker.kill()
+        return _Worker(self._ctx, job.env)
+
+    def _release(self, key: Tuple, worker: _Worker):
+        if worker.num_tasks >= self.config.worker_max_tasks:
+            logging.info(f'Recycling worker {worker.process.pid} after {worker.num_tasks} tasks.')
+            self._retire(worker)
+        elif worker.rss_mb is not None and \
+                worker.rss_mb - worker.base_rss_mb > self.config.worker_max_rss_growth_mb:
+            logging.info(
+                f'Recycling worker {worker.process.pid} whose RSS grew '
+                f'from {worker.base_rss_mb:.0f}MB to {worker.rss_mb:.0f}MB.')
+            self._retire(worker)
+        else:
+            self._idle_workers.setdefault(key, []).append(worker)
+
+    def _retire(self, worker: _Worker):
+        self._retiring.add(worker)
+        worker.retire(self._retiring.discard)
+
+    def evict_idle(self, job: Job):
+        """Stops idle workers pinned to the GPUs of `job`, unless `job` would reuse them.
+
+        A worker that has initialized CUDA holds memory on its GPUs even when idle, and the launcher hands
+        those GPUs to other jobs once the worker's task has ended.
+        """
+        cuda_ids = set(job._resource.get_cuda_ids())
+        if not cuda_ids:
+            return
+        key = self._get_key(job) if job.is_callable else None
+        for idle_key in list(self._idle_workers):
+            if idle_key == key:
+                continue
+            workers = self._idle_workers[idle_key]
+            if any(worker.cuda_ids & cuda_ids for worker in workers):
+                for worker in workers:
+                    self._retire(worker)
+                del self._idle_workers[idle_key]
+
+    def start_task(self, job: Job) -> WorkerTask:
+        key = self._get_key(job)
+        worker = self._acquire(key, job)
+        stdout_path = getattr(job._stdout, 'name', None) if job._stdout is not sys.stdout else None
+        stderr_path = getattr(job._stderr, 'name', None) if job._stderr is not sys.stderr else None
+        for stream in (job._stdout, job._stderr):
+            stream.flush()
+        job._result = None
+        job._exception = None
+        task = WorkerTask(self, key, worker, job)
+        try:
+            worker.conn.send((
+                job.fn, tuple(job.fn_args or ()), dict(job.fn_kwargs or {}),
+                str(job.cwd), stdout_path, stderr_path,
+            ))
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            job._exception = e
+            task.returncode = 1
+            self._release(key, worker)
+            logging.error(f'Job {job.job_name} is not picklable: {e!r}')
+        return task
+
+    def shutdown(self):
+        for workers in self._idle_workers.values():
+            for worker in workers:
+                worker.stop()
+        self._idle_workers.clear()
+        # Workers that are still exiting are waited for here, since the event loop may not run again.
+        for worker in list(self._retiring):
+            with contextlib.suppress(RuntimeError, ValueError, OSError):
+                asyncio.get_running_loop().remove_reader(worker.process.sentinel)
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.kill()
+                worker.process.join()
+        self._retiring.clear()
@@ -0,0 +1,66 @@
+import asyncio
+import stat
+import threading
+import time
+from typing import List
+
+from toyflow import daemon
+from toyflow.callbacks import Callback
+from toyflow.daemon import LauncherDaemon
+from toyflow.daemon_client import DaemonClient, DaemonError
+from toyflow.launcher import Launcher
+
+
+class _QuietLauncher(Launcher):
+    def _build_default_callbacks(self, **kwargs) -> List[Callback]:
+        return []
+
+
+def _wait_for(predicate, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def test_client_round_trips_submit_jobs_and_cancel(tmp_path, monkeypatch):
+    monkeypatch.setattr(daemon, 'Launcher', _QuietLauncher)
+    socket_path = tmp_path / 'daemon.sock'
+    launcher_daemon = LauncherDaemon([0, 1], daemon_socket=str(socket_path), disable_telemetry=True,
+                                     disable_runtime_history=True, cancel_grace_period=1.0)
+    client = DaemonClient(str(socket_path), timeout=10.0)
+    results = {}
+
+    def talk():
+        try:
+            _wait_for(socket_path.exists)
+            results['mode'] = stat.S_IMODE(socket_path.stat().st_mode)
+            results['job_ids'] = client.submit(
+                [{'cmd': 'sleep 60', 'job_name': 'long'}, {'cmd': 'true', 'job_name': 'short'}],
+                defaults={'cwd': tmp_path, 'log_dir': tmp_path})
+            _wait_for(lambda: client.status(status=['RUNNING', 'FINISHED'])['counts'].get('RUNNING') == 1 and
+                      client.status(job_ids=[2])['jobs'][0]['status'] == 'FINISHED')
+            results['cancelled'] = client.cancel(name='lo*')
+            _wait_for(lambda: client.status(job_ids=[1])['jobs'][0]['status'] == 'CANCELLED')
+            results['jobs'] = client.status()['jobs']
+            try:
+                client.submit([{'cmd': 'true', 'gpus': 1}])
+            except DaemonError as e:
+                results['error'] = str(e)
+        finally:
+            client.shutdown()
+
+    thread = threading.Thread(target=talk)
+    thread.start()
+    # The daemon installs signal handlers, so it runs in the main thread.
+    asyncio.run(launcher_daemon.serve())
+    thread.join()
+
+    assert results['mode'] & 0o077 == 0
+    assert results['job_ids'] == [1, 2]
+    assert results['cancelled'] == [1]
+    assert [(job['job_name'], job['status']) for job in results['jobs']] == [('long', 'CANCELLED'),
+                                                                          ('short', 'FINISHED')]
+    assert results['jobs'][0]['log_dir'] == tmp_path.resolve().as_posix()
+    assert "Unknown job fields: ['gpus']" in results['error']
+    assert not socket_path.exists()
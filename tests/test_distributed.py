@@ -0,0 +1,65 @@
+import asyncio
+import time
+from pathlib import Path
+from typing import List
+
+from toyflow.callbacks import Callback, LoggingCallback
+from toyflow.job import Job, JobStatus
+from toyflow.launcher import Launcher
+
+
+class _FileOutputLauncher(Launcher):
+    """Runs real processes with their output in log files, and no dashboards."""
+
+    def _build_default_callbacks(self, **kwargs) -> List[Callback]:
+        return [LoggingCallback.from_config(disable_env_info=True, async_json_writes=False)]
+
+
+class _ReturnCodes(Callback):
+    def __init__(self):
+        super().__init__(Callback.config_cls())
+        self.returncodes = {}
+
+    def on_process_end(self, job, process):
+        self.returncodes[job.job_name] = process.returncode
+
+
+def _read_env(path: Path):
+    return dict(line.split('=', 1) for line in path.read_text().split())
+
+
+def test_ranks_get_their_own_rendezvous(tmp_path):
+    dump = ('for key in MASTER_ADDR MASTER_PORT WORLD_SIZE RANK LOCAL_RANK CUDA_VISIBLE_DEVICES; do '
+            'eval echo $key=\\$$key; done > rank-$RANK.txt; sleep 0.5')
+    jobs = [Job(cmd=dump, apply_shlex_parsing_for_cmd=False, cwd=tmp_path / name, log_dir=tmp_path / name,
+                job_name=name, cuda_quantity=2, distributed=True) for name in ('a', 'b')]
+    for job in jobs:
+        Path(job.log_dir).mkdir()
+    launcher = _FileOutputLauncher([0, 1, 2, 3], jobs, disable_telemetry=True, disable_runtime_history=True,
+                                   distributed_port_range=(29500, 29509))
+    asyncio.run(launcher._start())
+
+    assert [job.status for job in jobs] == [JobStatus.FINISHED] * 2
+    envs = {job.job_name: [_read_env(Path(job.log_dir, f'rank-{rank}.txt')) for rank in range(2)] for job in jobs}
+    for ranks in envs.values():
+        assert [(env['RANK'], env['LOCAL_RANK'], env['WORLD_SIZE']) for env in ranks] == [('0', '0', '2'),
+                                                                                          ('1', '1', '2')]
+        assert ranks[0]['MASTER_PORT'] == ranks[1]['MASTER_PORT']
+        assert ranks[0]['CUDA_VISIBLE_DEVICES'] == ranks[1]['CUDA_VISIBLE_DEVICES']
+    ports = {int(ranks[0]['MASTER_PORT']) for ranks in envs.values()}
+    assert len(ports) == 2 and all(29500 <= port <= 29509 for port in ports)
+    assert not launcher.port_allocator.ports
+
+
+def test_a_failed_rank_stops_the_gang(tmp_path):
+    job = Job(cmd='if [ "$RANK" = 1 ]; then exit 3; fi; sleep 60', apply_shlex_parsing_for_cmd=False,
+              log_dir=tmp_path, job_name='gang', cuda_quantity=2, distributed=True)
+    returncodes = _ReturnCodes()
+    launcher = _FileOutputLauncher([0, 1], [job], callbacks=[returncodes], disable_telemetry=True,
+                                   disable_runtime_history=True, cancel_grace_period=1.0)
+    start = time.monotonic()
+    asyncio.run(launcher._start())
+
+    assert time.monotonic() - start < 10
+    assert job.status == JobStatus.FAILED
+    assert returncodes.returncodes == {'gang': 3}
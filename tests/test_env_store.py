@@ -0,0 +1,73 @@
+import subprocess
+
+from toyflow import env_store
+from toyflow.callbacks import LoggingCallback
+from toyflow.env_store import load_env_info
+from toyflow.job import Job
+from toyflow.utils.json_util import load_json
+
+CONDA_INFO = {'name': 'base', 'channels': ['defaults'],
+              'dependencies': ['python=3.11', 'torch=2.4', {'pip': ['transformers==4.44', 'six==1.16']}]}
+
+
+def test_env_snapshots_are_shared_by_jobs_and_runs(tmp_path, monkeypatch):
+    calls = []
+    fingerprint = {'prefix': '/opt/env', 'mtimes': {'site-packages': 1}}
+
+    def conda_env_export():
+        calls.append('conda')
+        return CONDA_INFO
+
+    monkeypatch.setattr(env_store, 'get_conda_env_info', conda_env_export)
+    monkeypatch.setattr(env_store, 'get_pip_editable_packages', lambda: calls.append('pip') or [])
+    monkeypatch.setattr(env_store, 'get_env_fingerprint', lambda: dict(fingerprint))
+    store_dir = tmp_path / 'store'
+
+    def job_env(run: int, job_name: str):
+        # A new callback per run, as if each run was a new process.
+        callback = LoggingCallback.from_config(env_store_dir=str(store_dir), async_json_writes=False)
+        job = Job(cmd='true', cwd=tmp_path, log_dir=tmp_path / f'run{run}' / job_name, job_name=job_name)
+        callback.on_job_start(job)
+        return load_json(job.log_dir / '.job-log' / 'job_env.json'), job
+
+    first, _ = job_env(0, 'a')
+    second, job = job_env(1, 'b')
+    assert sorted(calls) == ['conda', 'pip']
+    assert first['conda'] == second['conda'] == {'$snapshot': env_store._sha256(env_store.canonical_json(CONDA_INFO))}
+    assert first['cwd_git_diff'] == second['cwd_git_diff']
+    assert len(list((store_dir / 'objects').rglob('*.json'))) == 3
+
+    info = load_env_info(job.log_dir)
+    assert info['conda'] == CONDA_INFO
+    assert info['cwd_git_diff']['git_commit_id'] == 'Not a Git repository'
+    assert info['pip_editable'] == []
+
+    # Installing a package changes the fingerprint, so the next job exports again.
+    fingerprint['mtimes']['site-packages'] = 2
+    job_env(1, 'c')
+    assert sorted(calls) == ['conda', 'conda', 'pip', 'pip']
+
+
+def test_failed_env_captures_are_retried_by_the_next_run(tmp_path, monkeypatch):
+    calls = []
+
+    def conda_env_export():
+        calls.append('conda')
+        if len(calls) == 1:
+            raise subprocess.CalledProcessError(1, 'conda', stderr='conda is busy')
+        return CONDA_INFO
+
+    monkeypatch.setattr(env_store, 'get_conda_env_info', conda_env_export)
+    monkeypatch.setattr(env_store, 'get_pip_editable_packages', lambda: [])
+    monkeypatch.setattr(env_store, 'get_env_fingerprint', lambda: {'prefix': '/opt/env'})
+
+    infos = []
+    for run in range(3):
+        callback = LoggingCallback.from_config(env_store_dir=str(tmp_path / 'store'), async_json_writes=False,
+                                               log_folder_name='logs')
+        job = Job(cmd='true', cwd=tmp_path, log_dir=tmp_path / f'run{run}', job_name='a')
+        callback.on_job_start(job)
+        infos.append(load_env_info(job.log_dir, log_folder_name='logs'))
+    assert calls == ['conda', 'conda']
+    assert 'CalledProcessError' in infos[0]['conda']['error']
+    assert infos[1]['conda'] == infos[2]['conda'] == CONDA_INFO
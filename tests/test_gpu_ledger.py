@@ -0,0 +1,65 @@
+import asyncio
+import subprocess
+import sys
+
+from toyflow.gpu_ledger import GpuLedger
+from toyflow.resource import ResourceItem, ResourcePool, ResourceType
+
+# Holds GPU 0 until a line is read from stdin, then releases it and waits until killed.
+HOLDER = """
+import sys, time
+from toyflow.gpu_ledger import GpuLedger
+ledger = GpuLedger(sys.argv[1])
+assert ledger.reserve({0: 1.0}, 'other launcher')
+print('reserved', flush=True)
+sys.stdin.readline()
+ledger.release({0: 1.0})
+print('released', flush=True)
+time.sleep(60)
+"""
+
+
+def _start_holder(path) -> subprocess.Popen:
+    holder = subprocess.Popen([sys.executable, '-c', HOLDER, str(path)], stdin=subprocess.PIPE,
+                              stdout=subprocess.PIPE, text=True)
+    assert holder.stdout.readline().strip() == 'reserved'
+    return holder
+
+
+def test_pools_of_other_processes_are_respected(tmp_path):
+    path = tmp_path / 'ledger.json'
+    ledger = GpuLedger(path)
+    pool = ResourcePool([ResourceItem(ResourceType.CUDA, i, 1.0) for i in (0, 1)], ledger=ledger)
+
+    async def main():
+        woken = asyncio.Event()
+        ledger.listen(woken.set)
+        holder = _start_holder(path)
+        try:
+            assert ledger.used_by_others() == {0: 1.0}
+            available = await pool.allocate_all()
+            assert available[ResourceType.CUDA] == {1: 1.0}
+            await pool.release(available)
+            assert not ledger.reserve({0: 1.0}) and ledger.reserve({1: 1.0}, 'job')
+
+            # Releasing GPU 0 wakes this process up without polling.
+            holder.stdin.write('\n')
+            holder.stdin.flush()
+            await asyncio.wait_for(woken.wait(), timeout=10)
+            assert ledger.used_by_others() == {}
+            assert ledger.reserve({0: 1.0})
+            ledger.release({0: 1.0})
+        finally:
+            holder.kill()
+            holder.wait()
+
+        # The entries of a process that died without releasing are dropped.
+        holder = _start_holder(path)
+        assert not ledger.reserve({0: 1.0})
+        holder.kill()
+        holder.wait()
+        assert ledger.reserve({0: 1.0})
+        ledger.close()
+        assert GpuLedger(path).entries() == []
+
+    asyncio.run(main())
@@ -0,0 +1,57 @@
+import threading
+
+from toyflow.utils.json_util import load_json
+from toyflow.utils.json_writer import CoalescingJsonWriter, _write_text_atomic
+
+
+def test_updates_are_coalesced_and_snapshotted_at_submit(tmp_path):
+    started, release = threading.Event(), threading.Event()
+    written = []
+
+    def write(text, path):
+        written.append(path.parent.name)
+        started.set()
+        release.wait(10)
+        _write_text_atomic(text, path)
+
+    writer = CoalescingJsonWriter(write_fn=write)
+    a, b = tmp_path / 'a' / 'info.json', tmp_path / 'b' / 'info.json'
+    info = {'update': 0, 'extra_info': {'step': 0}}
+    writer.submit(info, a)
+    assert started.wait(10)
+    # The thread is busy with the first write, so these three pile up and the two of `a` merge.
+    for update in (1, 2):
+        info['update'] = update
+        info['extra_info']['step'] = update
+        writer.submit(info, a)
+    writer.submit({'update': 0}, b)
+    info['extra_info']['step'] = 'changed after submit'
+    release.set()
+    assert writer.flush(timeout=10)
+
+    assert load_json(a) == {'update': 2, 'extra_info': {'step': 2}}
+    assert load_json(b) == {'update': 0}
+    assert (writer.num_submitted, writer.num_written) == (4, 3)
+    assert sorted(written) == ['a', 'a', 'b']
+    writer.close()
+    # Atomic writes leave no temporary files behind.
+    assert sorted(p.name for p in tmp_path.rglob('*') if p.is_file()) == ['info.json', 'info.json']
+
+
+def test_close_writes_pending_updates_and_failures_are_isolated(tmp_path):
+    def write(text, path):
+        if path.parent.name == 'bad':
+            raise OSError('read-only file system')
+        _write_text_atomic(text, path)
+
+    writer = CoalescingJsonWriter(write_fn=write)
+    for name in ('bad', 'good'):
+        writer.submit({'name': name}, tmp_path / name / 'info.json')
+    writer.close()
+    assert load_json(tmp_path / 'good' / 'info.json') == {'name': 'good'}
+    assert not (tmp_path / 'bad' / 'info.json').exists()
+
+    # A closed writer starts a new thread on the next submit.
+    writer.submit({'name': 'again'}, tmp_path / 'good' / 'info.json')
+    writer.close()
+    assert load_json(tmp_path / 'good' / 'info.json') == {'name': 'again'}
@@ -0,0 +1,81 @@
+import asyncio
+import sys
+from pathlib import Path
+from typing import List
+
+from toyflow import memory
+from toyflow.callbacks import Callback, LoggingCallback
+from toyflow.job import Job, JobStatus
+from toyflow.launcher import Launcher
+from toyflow.memory import GB, MemoryGuard
+
+
+class _FileOutputLauncher(Launcher):
+    """Runs real processes with their output in log files, and no dashboards."""
+
+    def _build_default_callbacks(self, **kwargs) -> List[Callback]:
+        return [LoggingCallback.from_config(disable_env_info=True, async_json_writes=False)]
+
+
+def test_admission_subtracts_what_running_jobs_may_still_use(monkeypatch):
+    monkeypatch.setattr(memory, 'read_meminfo', lambda: {'MemTotal': 64 * GB, 'MemAvailable': 20 * GB})
+    guard = MemoryGuard.from_config(memory_headroom_gb=4)
+    first, second, small = Job(cmd='true', host_memory_gb=10), Job(cmd='true', host_memory_gb=10), \
+        Job(cmd='true', host_memory_gb=5)
+    assert guard.admits(first)
+    guard.reserve(first)
+    assert not guard.admits(second) and guard.admits(small) and guard.admits(Job(cmd='true'))
+
+    # Once the first job uses 8 GB, MemAvailable no longer includes them.
+    first._usage = {'rss_mb': 8 * 1024}
+    monkeypatch.setattr(memory, 'read_meminfo', lambda: {'MemTotal': 64 * GB, 'MemAvailable': 12 * GB})
+    guard.refresh()
+    assert guard.spare() == 6 * GB
+    assert not guard.admits(second)
+    guard.release(first)
+    monkeypatch.setattr(memory, 'read_meminfo', lambda: {'MemTotal': 64 * GB, 'MemAvailable': 20 * GB})
+    guard.refresh()
+    assert guard.admits(second)
+    assert 'at most 60.0 GB' in guard.exceeds_host(Job(cmd='true', host_memory_gb=100))
+
+
+def test_breaches_are_reported_as_memory_errors(tmp_path):
+    allocate = f'"{sys.executable}" -c "x = b\'x\' * (1 << 30)"'
+    jobs = [
+        Job(cmd=allocate, apply_shlex_parsing_for_cmd=False, log_dir=tmp_path / 'greedy', job_name='greedy',
+            host_memory_gb=0.25),
+        Job(cmd=f'"{sys.executable}" -c "x = b\'x\' * (1 << 20)"', apply_shlex_parsing_for_cmd=False,
+            log_dir=tmp_path / 'modest', job_name='modest', host_memory_gb=0.25),
+        Job(cmd='true', job_name='huge', host_memory_gb=1 << 20),
+    ]
+    for job in jobs[:2]:
+        Path(job.log_dir).mkdir()
+    launcher = _FileOutputLauncher([0], jobs, disable_telemetry=True, disable_runtime_history=True,
+                                   memory_limit='rlimit', memory_headroom_gb=0)
+    asyncio.run(launcher._start())
+
+    greedy, modest, huge = jobs
+    assert greedy.status == JobStatus.FAILED
+    assert isinstance(greedy.exception, MemoryError) and 'memory limit of 0.25 GB' in str(greedy.exception)
+    assert modest.status == JobStatus.FINISHED
+    assert huge.status == JobStatus.FAILED and 'host memory' in str(huge.exception)
+
+
+def test_only_host_allocation_errors_of_the_current_attempt_are_breaches(tmp_path):
+    guard = MemoryGuard.from_config(memory_limit='rlimit')
+    guard._mode = 'rlimit'
+    with open(tmp_path / 'stderr.log', 'a', encoding='utf-8') as stderr:
+        job = Job(cmd='true', host_memory_gb=1)
+        job._stderr = stderr
+        guard.start_attempt(job)
+        stderr.write('torch.cuda.OutOfMemoryError: CUDA out of memory. Tried to allocate 2.00 GiB\n')
+        stderr.flush()
+        assert guard.get_breach(job, 1) is None
+        stderr.write('MemoryError\n')
+        stderr.flush()
+        assert 'allocation failed' in guard.get_breach(job, 1)
+        # The next attempt fails for another reason.
+        guard.start_attempt(job)
+        stderr.write('ValueError: bad input\n')
+        stderr.flush()
+        assert guard.get_breach(job, 1) is None
@@ -0,0 +1,56 @@
+from toyflow.callbacks import Callback, MetricsCallback
+from toyflow.simulator import SimulatedJobSpec, SimulatedLauncher, run_simulation
+
+
+class _CancelOnFirstStart(Callback):
+    def __init__(self, job_name: str):
+        super().__init__(Callback.config_cls())
+        self.job_name = job_name
+
+    def on_job_start(self, job):
+        for other in self.launcher.job_scheduler.jobs:
+            if other.job_name == self.job_name:
+                self.launcher.cancel_job(other)
+
+
+def test_metrics_are_rendered_in_the_exposition_format():
+    metrics = MetricsCallback.from_config(metrics_job_name_patterns=['train-*'], metrics_hook_latency=True)
+    workload = [
+        SimulatedJobSpec('train-a', duration=10.0),
+        SimulatedJobSpec('eval-b', duration=10.0, fail=True),
+        SimulatedJobSpec('train-c', duration=10.0),
+        SimulatedJobSpec('doomed', duration=10.0),
+    ]
+    run_simulation([0, 1], workload, callbacks=[metrics, _CancelOnFirstStart('doomed')])
+    text = metrics.render()
+    lines = set(text.splitlines())
+
+    assert text.endswith('\n')
+    assert '# TYPE toyflow_jobs gauge' in lines
+    assert '# TYPE toyflow_job_duration_seconds histogram' in lines
+    # The cancelled job never started, and left the pending count without entering the running one.
+    for status, count in (('PENDING', 0), ('RUNNING', 0), ('FINISHED', 2), ('FAILED', 1), ('CANCELLED', 1)):
+        assert f'toyflow_jobs{{status="{status}"}} {float(count)}' in lines
+    assert 'toyflow_jobs_ended_total{status="CANCELLED"} 1.0' in lines
+    assert 'toyflow_job_queue_wait_seconds_count 3.0' in lines
+    # Buckets are cumulative and end with +Inf.
+    assert 'toyflow_job_duration_seconds_bucket{pattern="train-*",status="FINISHED",le="1"} 2.0' in lines
+    assert 'toyflow_job_duration_seconds_bucket{pattern="train-*",status="FINISHED",le="+Inf"} 2.0' in lines
+    assert 'toyflow_job_duration_seconds_count{pattern="other",status="FAILED"} 1.0' in lines
+    for cuda_id in (0, 1):
+        assert any(line.startswith(f'toyflow_gpu_allocated_seconds_total{{gpu="{cuda_id}"}} ') for line in lines)
+        assert any(line.startswith(f'toyflow_gpu_idle_seconds_total{{gpu="{cuda_id}"}} ') for line in lines)
+    assert 'toyflow_callback_hook_duration_seconds_count{callback="_CancelOnFirstStart",hook="on_job_start"} 3.0' \
+        in lines
+
+
+def test_hooks_are_only_timed_on_request_and_the_endpoint_is_local():
+    metrics = MetricsCallback.from_config(metrics_port=0)
+    launcher = SimulatedLauncher([0], [], callbacks=[metrics])
+    assert not launcher.callback.hook_observers
+    metrics._start_server(0)
+    try:
+        assert metrics._server.server_address[0] == '127.0.0.1'
+    finally:
+        metrics._server.shutdown()
+        metrics._server.server_close()
@@ -0,0 +1,32 @@
+from toyflow.job import JobStatus
+from toyflow.simulator import SimulatedJobSpec, SimulatedLauncher, run_simulation, virtual_event_loop
+
+
+def test_packing_runs_light_jobs_next_to_others():
+    # Each training job is followed by six evals that use a GPU at 15% and 6 GB.
+    workload = []
+    for i in range(8):
+        workload.append(SimulatedJobSpec(f'train-{i}', duration=3600, gpu_utilization=95, gpu_memory_mb=60000))
+        workload.extend(SimulatedJobSpec(f'eval-{i}-{k}', duration=600, packable=True, gpu_utilization=15,
+                                         gpu_memory_mb=6144) for k in range(6))
+    exclusive = run_simulation([0, 1, 2, 3], workload)
+    packed = run_simulation([0, 1, 2, 3], workload, gpu_packing=True)
+    assert exclusive.num_failed == packed.num_failed == 0
+    assert packed.makespan < 0.85 * exclusive.makespan
+    assert packed.queue_wait_mean < exclusive.queue_wait_mean
+
+
+def test_contended_gpus_requeue_the_newest_packed_job():
+    workload = [
+        SimulatedJobSpec('host', duration=100, gpu_utilization=40),
+        SimulatedJobSpec('guest', duration=10, packable=True, gpu_utilization=60),
+    ]
+    with virtual_event_loop() as loop:
+        launcher = SimulatedLauncher([0], workload, gpu_packing=True, packing_interval=5)
+        loop.run_until_complete(launcher._start())
+    host, guest = launcher.specs
+    assert host.status == guest.status == JobStatus.FINISHED
+    assert launcher.recorder.num_requeued == 1
+    # Packed at the first observation, evicted at the next one, and then it waited for the whole GPU.
+    assert launcher.recorder.start_times[guest] == 100.0
+    assert launcher.recorder.end_times[guest] == 110.0
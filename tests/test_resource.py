@@ -0,0 +1,80 @@
+import pytest
+
+from toyflow.job import JobStatus
+from toyflow.resource import Resource, ResourceItem, ResourceType
+from toyflow.simulator import SimulatedJobSpec, SimulatedLauncher, virtual_event_loop
+
+
+def _make_resource(quantities):
+    return Resource.from_resource_items([
+        ResourceItem(ResourceType.CUDA, rid, quantity) for rid, quantity in quantities.items()
+    ])
+
+
+def test_split_takes_first_free_devices():
+    resource = _make_resource({3: 1.0, 1: 1.0, 2: 1.0})
+    allocated = resource.split({ResourceType.CUDA: [1.0, 1.0]})
+    assert allocated.get_cuda_ids() == [3, 1]
+    assert allocated.as_dict() == {'cpu': {}, 'cuda': {3: 1.0, 1: 1.0}}
+    # split does not modify the source
+    assert resource.count_available(ResourceType.CUDA) == 3
+    assert resource.split({ResourceType.CUDA: [1.0] * 4}) is None
+
+
+def test_split_best_fit_for_fractions():
+    resource = _make_resource({0: 1.0, 1: 0.5, 2: 0.25})
+    allocated = resource.split({ResourceType.CUDA: [0.2, 0.5]})
+    assert allocated[ResourceType.CUDA] == {1: 0.5, 2: 0.2}
+
+
+def test_add_and_minus_round_trip():
+    resource = _make_resource({i: 1.0 for i in range(8)})
+    allocated = resource.split({ResourceType.CUDA: [1.0] * 3})
+    resource.minus_(allocated)
+    assert resource.count_available(ResourceType.CUDA) == 5
+    assert resource.split({ResourceType.CUDA: [1.0] * 3}).get_cuda_ids() == [3, 4, 5]
+
+    pool = Resource()
+    pool.add_(resource)
+    pool.add_(allocated)
+    assert pool[ResourceType.CUDA] == {i: 1.0 for i in range(8)}
+
+
+def test_empty_resource():
+    resource = Resource()
+    assert resource.get_cuda_ids() == []
+    assert resource.as_dict() == {}
+    assert resource.split({ResourceType.CUDA: [1.0]}) is None
+
+
+def test_jobs_are_packed_by_all_their_resources():
+    ram = ResourceType('ram_gb')
+    assert ResourceType('ram_gb') is ram and ram not in (ResourceType.CPU, ResourceType.CUDA)
+    workload = [
+        # Each big job takes most of the memory, so they run one after the other despite the free GPUs.
+        SimulatedJobSpec('big-0', duration=10.0, resources={'ram_gb': 300}),
+        SimulatedJobSpec('big-1', duration=10.0, resources={'ram_gb': 300}),
+        # Fits next to big-0, and only one of the two license seats is taken at a time.
+        SimulatedJobSpec('small-0', duration=10.0, resources={'ram_gb': 100, 'license': 1}),
+        SimulatedJobSpec('small-1', duration=10.0, resources={'ram_gb': 50, 'scratch_gb': 500}),
+        SimulatedJobSpec('too-big', duration=10.0, resources={'ram_gb': 600}),
+    ]
+    with virtual_event_loop() as loop:
+        launcher = SimulatedLauncher(
+            list(range(8)), workload,
+            resource_capacities={'ram_gb': 512, 'license': 2, 'scratch_gb': {0: 400, 1: 800}})
+        loop.run_until_complete(launcher._start())
+    starts = launcher.recorder.start_times
+    big_0, big_1, small_0, small_1, too_big = launcher.job_scheduler.jobs
+    assert starts[big_0] == starts[small_0] == starts[small_1] == 0.0
+    assert starts[big_1] == 10.0
+    assert small_1._resource.as_dict()['scratch_gb'] == {1: 500.0}
+    assert too_big.status == JobStatus.FAILED and 'ram_gb' in str(too_big.exception)
+
+
+def test_quantities_by_type_are_read_only():
+    resource = Resource.from_resource_items([ResourceItem(ResourceType.CUDA, 0, 1.0)])
+    quantities = resource[ResourceType.CUDA]
+    assert dict(quantities) == {0: 1.0}
+    with pytest.raises(TypeError):
+        quantities[0] = 0.0
@@ -0,0 +1,57 @@
+import asyncio
+from typing import List
+
+from toyflow.callbacks import Callback, StatusStoreCallback
+from toyflow.cli import main
+from toyflow.job import Job, JobStatus
+from toyflow.launcher import Launcher
+from toyflow.results import ingest_results, load_results
+from toyflow.status_store import connect
+
+
+class _StatusStoreLauncher(Launcher):
+    def _build_default_callbacks(self, **kwargs) -> List[Callback]:
+        return [StatusStoreCallback.from_config(status_db=kwargs['status_db'])]
+
+
+def test_results_are_collected_once_and_joined_with_their_jobs(tmp_path, capsys):
+    jobs = []
+    for lr in (0.1, 0.01):
+        log_dir = tmp_path / f'lr-{lr}'
+        log_dir.mkdir()
+        write = (f'echo \'{{"accuracy": {lr * 5}, "job_name": "mine"}}\' > metrics.json && '
+                 f'printf \'{{"step": 1}}\\n{{"step": 2}}\\n\' > eval.jsonl')
+        jobs.append(Job(cmd=write, apply_shlex_parsing_for_cmd=False, cwd=log_dir, log_dir=log_dir,
+                        job_name=f'lr-{lr}', extra_info={'lr': lr}, results='*.json*'))
+    jobs.append(Job(cmd='false', log_dir=tmp_path, job_name='no-results'))
+    db = tmp_path / 'status.db'
+    launcher = _StatusStoreLauncher([0, 1], jobs, status_db=str(db), disable_telemetry=True,
+                                    disable_runtime_history=True)
+    asyncio.run(launcher._start())
+    assert [job.status for job in jobs] == [JobStatus.FINISHED, JobStatus.FINISHED, JobStatus.FAILED]
+
+    # The files are gone, so the table is all that is read.
+    for job in jobs[:2]:
+        for path in job.log_dir.iterdir():
+            path.unlink()
+    df = load_results(db)
+    assert len(df) == 6
+    metrics = df[df['path'].str.endswith('metrics.json')].sort_values('extra_info.lr')
+    assert metrics['accuracy'].tolist() == [0.05, 0.5]
+    assert metrics['job_name'].tolist() == ['mine', 'mine']
+    assert metrics['job.job_name'].tolist() == ['lr-0.01', 'lr-0.1']
+    assert set(metrics['status']) == {'FINISHED'} and (metrics['duration'] >= 0).all()
+    assert sorted(metrics['resources.cuda'].map(tuple)) == [(0,), (1,)]
+    assert df[df['path'].str.endswith('eval.jsonl')]['step'].tolist() == [1, 2, 1, 2]
+
+    main(['results', '--db', str(db), '--output', str(tmp_path / 'results.csv')])
+    assert len((tmp_path / 'results.csv').read_text().splitlines()) == 7
+
+
+def test_bad_result_patterns_and_files_are_skipped(tmp_path):
+    (tmp_path / 'broken.json').write_text('{not json')
+    (tmp_path / 'ok.json').write_text('{"loss": 1.5}')
+    conn = connect(tmp_path / 'status.db')
+    assert ingest_results(conn, 1, 1, tmp_path, '**bad', {}) == 0
+    assert ingest_results(conn, 1, 2, tmp_path, '*.json', {}) == 1
+    conn.close()
@@ -0,0 +1,38 @@
+import io
+
+from rich.console import Console
+
+from toyflow.callbacks import RichCallback
+from toyflow.simulator import SimulatedJobSpec, SimulatedLauncher, virtual_event_loop
+
+
+def test_rich_view_counts_jobs_and_caps_rows():
+    rich_callback = RichCallback.from_config(rich_max_finished_rows=2, rich_max_failed_rows=1)
+    output = io.StringIO()
+    rich_callback.console = Console(file=output, width=160)
+    workload = [
+        SimulatedJobSpec('ok-0', duration=10.0),
+        SimulatedJobSpec('bad-1', duration=10.0, fail=True),
+        SimulatedJobSpec('ok-2', duration=10.0),
+        SimulatedJobSpec('bad-3', duration=10.0, fail=True),
+        SimulatedJobSpec('ok-4', duration=10.0),
+        SimulatedJobSpec('doomed', duration=10.0),
+    ]
+    with virtual_event_loop() as loop:
+        launcher = SimulatedLauncher([0], workload, callbacks=[rich_callback])
+        # Cancelled while still pending.
+        loop.call_at(5.0, launcher.cancel_job, launcher.job_scheduler.jobs[-1])
+        loop.run_until_complete(launcher._start())
+
+    counts = rich_callback.counts
+    assert (counts['PENDING'], counts['RUNNING']) == (0, 0)
+    assert (counts['FINISHED'], counts['FAILED'], counts['CANCELLED']) == (3, 2, 1)
+    assert not rich_callback.running
+    assert [row.name for row in rich_callback.finished] == ['ok-2', 'ok-4']
+    assert [(row.name, row.status) for row in rich_callback.failed] == [('bad-3', 'FAILED')]
+
+    text = output.getvalue()
+    assert '[Job Summary]' in text
+    assert '[6/6] CANCELLED=1 FINISHED=3 FAILED=2' in text
+    # One of the two failures is beyond the cap.
+    assert '... and 1 more' in text
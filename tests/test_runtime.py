@@ -0,0 +1,50 @@
+from toyflow.job import Job
+from toyflow.runtime import RuntimeEstimator, cmd_template
+from toyflow.simulator import SimulatedJobSpec, run_simulation
+from toyflow.status_store import connect
+
+
+def _write_history(path, runtimes):
+    conn = connect(path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO jobs (run_id, job_id, job_name, cmd, status, start_time, end_time) "
+            "VALUES (1, ?, ?, ?, ?, 1000.0, ?)",
+            [(i, name, cmd, status, 1000.0 + runtime) for i, (name, cmd, status, runtime) in enumerate(runtimes)])
+    conn.close()
+
+
+def test_estimates_come_from_earlier_runs(tmp_path):
+    db = tmp_path / 'status.db'
+    _write_history(db, [
+        ('train-a', 'python train.py --lr 0.1 --seed 1', 'FINISHED', 100.0),
+        ('train-b', 'python train.py --lr 1e-3 --seed 2', 'FINISHED', 300.0),
+        ('train-c', 'python train.py --lr 0.01 --seed 3', 'FAILED', 5.0),
+        ('eval', 'python eval.py ckpt-3', 'FINISHED', 10.0),
+    ])
+    assert cmd_template('python train.py --lr 1e-3 --seed 2 --out run3') == \
+        'python train.py --lr <n> --seed <n> --out run3'
+
+    by_cmd = RuntimeEstimator.from_config(status_db=str(db), runtime_history_key='cmd')
+    assert by_cmd.estimate(Job(cmd='python train.py --lr 0.5 --seed 9')) == 200.0
+    by_name = RuntimeEstimator.from_config(status_db=str(db), runtime_quantile=1.0)
+    assert by_name.estimate(Job(cmd='python eval.py ckpt-4', job_name='eval')) == 10.0
+    # Unknown keys get the median over the known ones.
+    assert by_name.estimate(Job(cmd='sleep 1', job_name='new')) == 100.0
+
+
+def test_policies_use_the_history(tmp_path):
+    db = tmp_path / 'status.db'
+    _write_history(db, [('long', 'true', 'FINISHED', 100.0), ('short', 'true', 'FINISHED', 1.0)])
+    history = dict(status_db=str(db), disable_runtime_history=False)
+
+    workload = [SimulatedJobSpec('long', duration=100.0)] + [SimulatedJobSpec('short', duration=1.0)] * 5
+    fifo = run_simulation([0], workload, **history)
+    sjf = run_simulation([0], workload, scheduling_policy='sjf', **history)
+    assert fifo.makespan == sjf.makespan == 105.0
+    assert fifo.queue_wait_mean == (100 + 101 + 102 + 103 + 104) / 6
+    assert sjf.queue_wait_mean == (1 + 2 + 3 + 4 + 5) / 6
+
+    workload = [SimulatedJobSpec('short', duration=10.0)] * 4 + [SimulatedJobSpec('long', duration=40.0)]
+    assert run_simulation([0, 1], workload, **history).makespan == 60.0
+    assert run_simulation([0, 1], workload, scheduling_policy='ljf', **history).makespan == 40.0
@@ -0,0 +1,189 @@
+import asyncio
+import threading
+import time
+
+from toyflow.callbacks import Callback
+from toyflow.devices import DeviceState
+from toyflow.job import Job, JobStatus
+from toyflow.resource import Resource, ResourceItem, ResourceType
+from toyflow.simulator import (SimulatedJobSpec, SimulatedLauncher,
+                               generate_workload, run_simulation,
+                               virtual_event_loop)
+
+
+def test_simulation_uses_virtual_time():
+    workload = [SimulatedJobSpec(f'job-{i}', duration=3600.0) for i in range(4)]
+    result = run_simulation([0, 1], workload)
+    assert result.makespan == 7200.0
+    assert result.gpu_utilization == 1.0
+    assert result.queue_wait_p50 == 1800.0
+
+
+def test_simulation_counts_failures_and_gangs():
+    workload = [
+        SimulatedJobSpec('big', duration=100.0, cuda_quantity=2),
+        SimulatedJobSpec('small', duration=50.0, fail=True),
+    ]
+    result = run_simulation([0, 1], workload)
+    assert result.num_failed == 1
+    assert result.makespan == 150.0
+
+
+def test_simulation_is_deterministic():
+    workload = generate_workload(50, seed=7, cuda_quantity_weights={1: 0.7, 2: 0.3}, failure_rate=0.1)
+    assert run_simulation([0, 1, 2, 3], workload) == run_simulation([0, 1, 2, 3], workload)
+
+
+def test_job_whose_callback_raises_fails_and_releases_its_gpu():
+    class _Raising(Callback):
+        def __init__(self):
+            super().__init__(Callback.config_cls())
+
+        def on_process_end(self, job, process):
+            if job.job_name == 'first':
+                raise ValueError('broken callback')
+
+    async def driver(launcher):
+        async with launcher:
+            futures = [launcher.submit(launcher.make_job(SimulatedJobSpec(name, duration=10.0)))
+                       for name in ('first', 'second')]
+        return [future.result() for future in futures]
+
+    with virtual_event_loop() as loop:
+        launcher = SimulatedLauncher([0], [], callbacks=[_Raising()])
+        first, second = loop.run_until_complete(driver(launcher))
+
+    assert first.status == JobStatus.FAILED and isinstance(first.exception, ValueError)
+    assert second.status == JobStatus.FINISHED
+    assert launcher.recorder.end_times[first] == 10.0 and launcher.recorder.end_times[second] == 20.0
+
+
+def test_keep_alive_launcher_accepts_and_cancels_jobs():
+    with virtual_event_loop() as loop:
+        launcher = SimulatedLauncher([0], [SimulatedJobSpec('first', duration=10.0)], keep_alive=True)
+        added = []
+
+        def submit():
+            added.extend(launcher.add_workload([
+                SimulatedJobSpec('long', duration=100.0),
+                SimulatedJobSpec('queued', duration=10.0),
+            ]))
+
+        loop.call_at(20.0, submit)
+        loop.call_at(30.0, lambda: launcher.cancel_job(added[1]))
+        loop.call_at(40.0, lambda: launcher.cancel_job(added[0]))
+        loop.call_at(50.0, launcher.stop)
+        loop.run_until_complete(launcher._start())
+
+    assert [job.status for job in launcher.job_scheduler.jobs] == [
+        JobStatus.FINISHED, JobStatus.CANCELLED, JobStatus.CANCELLED,
+    ]
+    assert launcher.recorder.end_times[added[0]] == 40.0
+    assert added[1] not in launcher.recorder.start_times
+
+
+def test_submit_resolves_futures_and_close_drains():
+    async def driver(loop, launcher):
+        async with launcher:
+            first = await launcher.submit(launcher.make_job(SimulatedJobSpec('first', duration=10.0)))
+            assert loop.time() == 10.0 and first.status == JobStatus.FINISHED
+            # Follow-ups depend on the first result, and start as soon as they are submitted.
+            follow_ups = [launcher.submit(launcher.make_job(SimulatedJobSpec(f'next-{i}', duration=5.0)))
+                          for i in range(3)]
+            done = await asyncio.gather(*follow_ups[:2])
+            assert loop.time() == 15.0 and all(job.status == JobStatus.FINISHED for job in done)
+        # Leaving the block waits for the last job.
+        assert loop.time() == 20.0 and follow_ups[2].result().status == JobStatus.FINISHED
+        try:
+            launcher.submit(launcher.make_job(SimulatedJobSpec('late', duration=1.0)))
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError('A closed launcher accepted a job.')
+
+    with virtual_event_loop() as loop:
+        launcher = SimulatedLauncher([0, 1], [])
+        loop.run_until_complete(driver(loop, launcher))
+
+    # Without `async with`, a job submitted when the last running one ends still runs.
+    class FollowUp(Callback):
+        def on_job_end(self, job):
+            if job.job_name == 'last':
+                futures.append(self.launcher.submit(self.launcher.make_job(SimulatedJobSpec('next', duration=5.0))))
+
+    futures = []
+    with virtual_event_loop() as loop:
+        launcher = SimulatedLauncher([0], [SimulatedJobSpec('last', duration=10.0)],
+                                     callbacks=[FollowUp(Callback.config_cls())])
+        loop.run_until_complete(launcher._start())
+        assert loop.time() == 15.0
+    assert futures[0].done() and futures[0].result().status == JobStatus.FINISHED
+
+
+def test_failing_gpu_is_quarantined_and_drained_gpu_is_skipped():
+    workload = [SimulatedJobSpec(f'job-{i}', duration=10.0) for i in range(8)]
+    result = run_simulation([0, 1, 2], workload, failing_cuda_ids=[1], gpu_quarantine_after_failures=2)
+    # GPU 1 fails two jobs, then the remaining six run on GPUs 0 and 2.
+    assert result.num_failed == 2
+    assert result.makespan == 30.0
+
+    with virtual_event_loop() as loop:
+        launcher = SimulatedLauncher([0, 1], [SimulatedJobSpec(f'job-{i}', duration=10.0) for i in range(4)])
+        loop.call_at(5.0, launcher.devices.drain, 1)
+        loop.call_at(25.0, launcher.devices.activate, 1)
+        loop.run_until_complete(launcher._start())
+    cuda_ids = [job._resource.get_cuda_ids() for job in launcher.job_scheduler.jobs]
+    ends = [launcher.recorder.end_times[job] for job in launcher.job_scheduler.jobs]
+    assert sorted(zip(ends, cuda_ids)) == [(10.0, [0]), (10.0, [1]), (20.0, [0]), (30.0, [0])]
+
+    # A quarantine that leaves too few GPUs for a queued job fails it instead of waiting forever.
+    workload = [SimulatedJobSpec(f'pair-{i}', duration=10.0, cuda_quantity=2) for i in range(2)]
+    result = run_simulation([0, 1], workload, failing_cuda_ids=[1], gpu_quarantine_after_failures=1)
+    assert result.num_failed == 2 and result.makespan == 10.0
+
+
+def test_only_exclusive_gpu_failures_count_toward_quarantine():
+    launcher = SimulatedLauncher([0, 1], [], gpu_quarantine_after_failures=1)
+
+    def end(rtype, exception=None):
+        job = Job(cmd='true', status=JobStatus.FAILED)
+        job._resource = Resource.from_resource_items([ResourceItem(rtype, 0, 1.0)])
+        job._exception = exception
+        launcher.devices.on_job_start(job)
+        launcher.devices.on_job_end(job)
+
+    end(ResourceType.CUDA_SHARE)
+    end(ResourceType.CUDA, MemoryError('exceeded its memory limit'))
+    end(ResourceType.CUDA, TimeoutError('no output'))
+    assert launcher.devices.devices[0].state == DeviceState.ACTIVE
+    end(ResourceType.CUDA)
+    assert launcher.devices.devices[0].state == DeviceState.QUARANTINED
+
+
+def test_prepare_fn_runs_ahead_with_bounded_concurrency():
+    lock = threading.Lock()
+    running, peak, prepared = [0], [0], []
+
+    def stage(name):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+            prepared.append(name)
+        if name == 'job-3':
+            raise OSError('disk full')
+
+    with virtual_event_loop() as loop:
+        launcher = SimulatedLauncher(
+            [0, 1], [SimulatedJobSpec(f'job-{i}', duration=10.0) for i in range(8)], prepare_concurrency=2)
+        for job in launcher.job_scheduler.jobs:
+            job.prepare_fn, job.prepare_fn_args = stage, (job.job_name,)
+        loop.run_until_complete(launcher._start())
+
+    jobs = {job.job_name: job for job in launcher.job_scheduler.jobs}
+    assert peak[0] <= 2 and sorted(prepared) == sorted(jobs)
+    assert jobs['job-3'].status == JobStatus.FAILED and isinstance(jobs['job-3'].exception, OSError)
+    assert jobs['job-3'] not in launcher.recorder.start_times
+    assert all(job.status == JobStatus.FINISHED for name, job in jobs.items() if name != 'job-3')
@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from toyflow import status_store
+from toyflow.callbacks import StatusStoreCallback
+from toyflow.cli import main
+from toyflow.simulator import SimulatedJobSpec, run_simulation
+from toyflow.status_store import connect, query
+
+
+def test_status_store_records_jobs_and_cli_filters(tmp_path, capsys):
+    db = tmp_path / 'status.db'
+    workload = [
+        SimulatedJobSpec('train-0', duration=10.0),
+        SimulatedJobSpec('train-1', duration=10.0, fail=True),
+        SimulatedJobSpec('eval-0', duration=5.0, cuda_quantity=2),
+    ]
+    run_simulation([0, 1], workload, callbacks=[StatusStoreCallback.from_config(status_db=str(db))])
+
+    _, rows = query(db, 'SELECT job_name, status, cuda, returncode, attempts FROM jobs ORDER BY job_id')
+    assert rows == [
+        ('train-0', 'FINISHED', '0', 0, 1),
+        ('train-1', 'FAILED', '1', 1, 1),
+        ('eval-0', 'FINISHED', '0,1', 0, 1),
+    ]
+
+    main(['query', '--db', str(db), '--gpu', '1', '--columns', 'job_name', '--format', 'json'])
+    assert [row['job_name'] for row in json.loads(capsys.readouterr().out)] == ['train-1', 'eval-0']
+    main(['query', '--db', str(db), '--count-by', 'status', '--format', 'json'])
+    assert json.loads(capsys.readouterr().out) == [
+        {'status': 'FINISHED', 'count': 2}, {'status': 'FAILED', 'count': 1},
+    ]
+    with pytest.raises(SystemExit, match='single run'):
+        main(['status', '--db', str(db), '--run', 'all'])
+
+
+def test_status_store_avoids_wal_on_network_filesystems(tmp_path, monkeypatch):
+    conn = connect(tmp_path / 'local.db')
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    conn.close()
+
+    monkeypatch.setattr(status_store, 'get_filesystem_type', lambda path: 'nfs4')
+    status_store._journal_mode.cache_clear()
+    try:
+        conn = connect(tmp_path / 'status.db')
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'delete'
+        conn.close()
+    finally:
+        status_store._journal_mode.cache_clear()
+
+
+def test_failing_writes_are_skipped_without_losing_the_batch(tmp_path):
+    db = tmp_path / 'status.db'
+    store = status_store.StatusStore(db)
+    run_id = store.insert_run('host', 1, '.', 2, 0.0)
+
+    def broken(conn):
+        conn.execute("INSERT INTO jobs (run_id, job_id, job_name) VALUES (?, 3, 'partial')", (run_id,))
+        raise ValueError('broken')
+
+    store.execute("INSERT INTO jobs (run_id, job_id, job_name) VALUES (?, 1, 'before')", (run_id,))
+    store.submit(broken)
+    store.execute('INSERT INTO no_such_table VALUES (1)')
+    store.execute("INSERT INTO jobs (run_id, job_id, job_name) VALUES (?, 2, 'after')", (run_id,))
+    store.close()
+
+    _, rows = query(db, 'SELECT job_name FROM jobs ORDER BY job_id')
+    assert rows == [('before',), ('after',)]
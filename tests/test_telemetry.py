@@ -0,0 +1,41 @@
+import subprocess
+import sys
+import time
+
+from toyflow.telemetry import _JobUsage
+from toyflow.utils.proc_stats import (ProcSample, get_process_tree,
+                                      kill_process_tree, read_proc_sample)
+
+
+def test_process_tree_of_a_real_child_is_sampled():
+    child = subprocess.Popen(['sh', '-c', f'"{sys.executable}" -c "import time; time.sleep(30)" & wait'])
+    try:
+        deadline = time.monotonic() + 10
+        while len(get_process_tree(child.pid)) < 2 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        pids = get_process_tree(child.pid)
+        assert pids[0] == child.pid and len(pids) == 2
+        sample = read_proc_sample(pids + [2 ** 22 + 1])  # a pid that does not exist is skipped
+        assert sample.num_processes == 2
+        assert sample.rss_bytes > 0 and sample.num_threads >= 2
+    finally:
+        kill_process_tree(child.pid)
+        child.wait()
+
+
+def test_usage_summary_is_relative_to_the_baseline():
+    usage = _JobUsage(pid=1, start_time=time.monotonic() - 4.0, base_cpu_time=10.0,
+                      base_read_bytes=100, base_write_bytes=50)
+    usage.add(ProcSample(cpu_time=12.0, rss_bytes=30 * 2 ** 20, num_threads=4,
+                         read_bytes=1100, write_bytes=50, num_processes=2))
+    # A descendant exited, so the totals went down; the largest ones are kept.
+    usage.add(ProcSample(cpu_time=11.0, rss_bytes=10 * 2 ** 20, num_threads=2,
+                         read_bytes=600, write_bytes=50, num_processes=1))
+    usage.add(ProcSample())  # the process is gone
+
+    summary = usage.summary()
+    assert summary['num_samples'] == 2
+    assert summary['cpu_time_s'] == 2.0 and 0.4 < summary['avg_cpu_cores'] <= 0.5
+    assert summary['peak_rss_mb'] == 30.0 and summary['avg_rss_mb'] == 20.0
+    assert summary['peak_threads'] == 4 and summary['avg_threads'] == 3.0
+    assert summary['io_read_bytes'] == 1000 and summary['io_write_bytes'] == 0
@@ -0,0 +1,51 @@
+import json
+
+from toyflow.simulator import SimulatedJobSpec, SimulatedLauncher, virtual_event_loop
+from toyflow.topology import GpuTopology, TopologyPlacement
+
+# Saved `nvidia-smi topo -m` output of a node with two NVLink pairs.
+TOPO_TEXT = """\
+\t\x1b[4mGPU0\tGPU1\tGPU2\tGPU3\tNIC0\tCPU Affinity\tNUMA Affinity\tGPU NUMA ID\x1b[0m
+GPU0\t X \tNV4\tSYS\tSYS\tPXB\t0-31\t0\t\tN/A
+GPU1\tNV4\t X \tSYS\tSYS\tPXB\t0-31\t0\t\tN/A
+GPU2\tSYS\tSYS\t X \tNV4\tSYS\t32-63\t1\t\tN/A
+GPU3\tSYS\tSYS\tNV4\t X \tSYS\t32-63\t1\t\tN/A
+NIC0\tPXB\tPXB\tSYS\tSYS\t X
+
+Legend:
+
+  X    = Self
+  SYS  = Connection traversing PCIe as well as the SMP interconnect between NUMA nodes
+  NV#  = Connection traversing a bonded set of # NVLinks
+"""
+
+
+def test_topology_matrix_is_parsed_and_pairs_are_kept_whole(tmp_path):
+    path = tmp_path / 'topo.txt'
+    path.write_text(TOPO_TEXT, encoding='utf-8')
+    topology = GpuTopology.from_file(path)
+    assert sorted(topology.scores) == [0, 1, 2, 3]
+    assert topology.score(0, 1) == topology.score(3, 2) > topology.score(1, 2)
+
+    placement = TopologyPlacement(topology)
+    assert placement.choose([0, 1, 2, 3], 2) == [0, 1]
+    assert placement.choose([2, 3], 2) == [2, 3]
+    # With GPU 1 busy, a single-GPU job takes its orphaned partner and leaves the 2-3 pair whole.
+    assert placement.choose([0, 2, 3], 1) == [0]
+    assert placement.choose([0, 2, 3], 2) == [2, 3]
+    assert placement.choose([0, 2], 3) is None
+
+
+def test_launcher_places_jobs_by_a_json_link_map(tmp_path):
+    # The NVLink pairs are 0-2 and 1-3, so lowest-ids-first would split both.
+    links = {'0': {'1': 'SYS', '2': 'NV12', '3': 'SYS'}, '1': {'0': 'SYS', '2': 'SYS', '3': 'NV12'},
+             '2': {'0': 'NV12', '1': 'SYS', '3': 'SYS'}, '3': {'0': 'SYS', '1': 'NV12', '2': 'SYS'}}
+    path = tmp_path / 'topo.json'
+    path.write_text(json.dumps(links), encoding='utf-8')
+
+    with virtual_event_loop() as loop:
+        launcher = SimulatedLauncher(
+            [0, 1, 2, 3], [SimulatedJobSpec(f'job-{i}', duration=10.0, cuda_quantity=2) for i in range(2)],
+            gpu_placement='topology', gpu_topology_file=str(path))
+        loop.run_until_complete(launcher._start())
+    assert [job._resource.get_cuda_ids() for job in launcher.job_scheduler.jobs] == [[0, 2], [1, 3]]
@@ -0,0 +1,31 @@
+import json
+
+from toyflow.simulator import SimulatedJobSpec, run_simulation
+
+
+def test_simulated_run_saves_a_chrome_trace(tmp_path):
+    trace_file = tmp_path / 'trace' / 'run.json'
+    workload = [SimulatedJobSpec(f'job-{i}', duration=10.0) for i in range(3)]
+    run_simulation([0, 1], workload, trace_file=str(trace_file))
+
+    with open(trace_file, encoding='utf-8') as f:
+        trace = json.load(f)
+    events = trace['traceEvents']
+    assert all({'name', 'ph', 'pid'} <= set(event) for event in events)
+
+    track_names = {event['tid']: event['args']['name'] for event in events if event['ph'] == 'M'}
+    assert track_names[0] == 'scheduler' and track_names[1] == 'callbacks'
+    assert sorted(name for tid, name in track_names.items() if tid >= 2) == [
+        'job #1 job-0', 'job #2 job-1', 'job #3 job-2']
+
+    spans = [event for event in events if event['ph'] == 'X']
+    assert all(event['dur'] >= 0 for event in spans)
+    for name in ('spawn', 'wait'):
+        assert sorted(event['tid'] for event in spans if event['name'] == name) == [3, 4, 5]
+    assert {'dispatch', 'allocate_all', 'get_next_job', 'release'} <= {event['name'] for event in spans}
+
+    occupancy = [event['args'] for event in events if event['ph'] == 'C' and event['name'] == 'GPU occupancy']
+    # Each job adds and then removes one GPU holder.
+    assert len(occupancy) == 6
+    assert max(sum(values.values()) for values in occupancy) == 2
+    assert occupancy[-1] == {'cuda:0': 0, 'cuda:1': 0}
@@ -0,0 +1,50 @@
+import asyncio
+import sys
+from pathlib import Path
+from typing import List
+
+from toyflow.callbacks import Callback, LoggingCallback
+from toyflow.job import Job, JobStatus
+from toyflow.launcher import Launcher
+
+
+class _FileOutputLauncher(Launcher):
+    """Runs real processes with their output in log files, and no dashboards."""
+
+    def _build_default_callbacks(self, **kwargs) -> List[Callback]:
+        return [LoggingCallback.from_config(disable_env_info=True, async_json_writes=False)]
+
+
+class _AttemptStatuses(Callback):
+    def __init__(self):
+        super().__init__(Callback.config_cls())
+        self.statuses = {}
+
+    def on_process_end(self, job, process):
+        self.statuses.setdefault(job.job_name, []).append(job.status.name)
+
+
+def test_silent_jobs_are_killed_and_restarted_once(tmp_path):
+    hung_python = (f'"{sys.executable}" -c "import faulthandler, signal, time; '
+                   f'faulthandler.register(signal.SIGUSR1); print(1, flush=True); time.sleep(60)"')
+    jobs = [
+        Job(cmd=hung_python, apply_shlex_parsing_for_cmd=False, log_dir=tmp_path / 'hung', job_name='hung'),
+        Job(cmd='for i in 1 2 3 4 5 6; do echo $i; sleep 0.3; done', apply_shlex_parsing_for_cmd=False,
+            log_dir=tmp_path / 'chatty', job_name='chatty'),
+    ]
+    for job in jobs:
+        Path(job.log_dir).mkdir()
+    attempts = _AttemptStatuses()
+    launcher = _FileOutputLauncher(
+        [0, 1], jobs, callbacks=[attempts], disable_telemetry=True, disable_runtime_history=True,
+        hang_timeout=1.0, hang_check_interval=0.1, hang_action='restart', hang_stack_dump='signal',
+        hang_stack_dump_timeout=0.5)
+    asyncio.run(launcher._start())
+
+    hung, chatty = jobs
+    assert chatty.status == JobStatus.FINISHED and attempts.statuses['chatty'] == ['FINISHED']
+    assert hung.status == JobStatus.FAILED
+    assert isinstance(hung.exception, TimeoutError) and 'no output' in str(hung.exception)
+    assert attempts.statuses['hung'] == ['HUNG', 'HUNG']
+    # The Python process dumped its stack on SIGUSR1 before the kill.
+    assert 'most recent call first' in (tmp_path / 'hung' / 'stderr.log').read_text(encoding='utf-8')
@@ -0,0 +1,32 @@
+import asyncio
+import threading
+
+from flask import Flask
+
+from toyflow.callbacks import WebCallback
+from toyflow.callbacks.web_callback import TOKEN_HEADER
+from toyflow.simulator import SimulatedLauncher
+
+
+def test_gpu_actions_need_the_dashboard_token():
+    web = WebCallback.from_config()
+    launcher = SimulatedLauncher([0, 1], [], callbacks=[web])
+    web.app = Flask('Web')
+    web._setup_routes()
+    web.loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=web.loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        client = web.app.test_client()
+        assert web.token in client.get('/').get_data(as_text=True)
+        assert client.post('/gpus/1/drain').status_code == 403
+        assert client.post('/gpus/1/drain', headers={TOKEN_HEADER: 'guess'}).status_code == 403
+        assert client.post('/gpus/1/drain', headers={TOKEN_HEADER: web.token, 'Origin': 'http://evil.example'}
+                           ).status_code == 403
+        assert launcher.devices.devices[1].state.name == 'ACTIVE'
+        response = client.post('/gpus/1/drain', headers={TOKEN_HEADER: web.token})
+        assert response.status_code == 200
+        assert launcher.devices.devices[1].state.name == 'DRAINING'
+    finally:
+        web.loop.call_soon_threadsafe(web.loop.stop)
+        thread.join()
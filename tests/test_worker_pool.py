@@ -0,0 +1,113 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+
+from toyflow.job import Job
+from toyflow.resource import Resource, ResourceItem, ResourceType
+from toyflow.worker_pool import WorkerPool
+
+
+def add(a, b):
+    return a + b
+
+
+def fail(message):
+    raise ValueError(message)
+
+
+def leave(code):
+    sys.exit(code)
+
+
+def die():
+    os._exit(7)
+
+
+def linger(seconds):
+    # A non-daemon thread keeps the worker process alive after it is asked to exit.
+    threading.Thread(target=time.sleep, args=(seconds,)).start()
+
+
+def make_job(fn, *args, cuda_id=0):
+    return Job(fn=fn, fn_args=args, env={**os.environ, 'CUDA_VISIBLE_DEVICES': str(cuda_id)})
+
+
+def run(pool, *jobs):
+    async def main():
+        tasks = []
+        for job in jobs:
+            task = pool.start_task(job)
+            await task.wait()
+            tasks.append(task)
+        return tasks
+    return asyncio.run(main())
+
+
+def test_results_exceptions_and_exit_codes_round_trip():
+    pool = WorkerPool.from_config()
+    try:
+        jobs = [make_job(add, 1, 2), make_job(fail, 'boom'), make_job(leave, None), make_job(leave, 3)]
+        tasks = run(pool, *jobs)
+    finally:
+        pool.shutdown()
+    assert [task.returncode for task in tasks] == [0, 1, 0, 3]
+    assert jobs[0].result == 3
+    assert isinstance(jobs[1].exception, ValueError) and str(jobs[1].exception) == 'boom'
+    # All four ran on the same warm worker.
+    assert len({task.pid for task in tasks}) == 1
+
+
+def test_workers_are_recycled_and_replaced():
+    pool = WorkerPool.from_config(worker_max_tasks=2)
+    try:
+        tasks = run(pool, make_job(add, 1, 1), make_job(add, 2, 2), make_job(die), make_job(add, 3, 3))
+    finally:
+        pool.shutdown()
+    first, second, dead, last = tasks
+    assert first.pid == second.pid != dead.pid != last.pid
+    assert dead.returncode == 7 and last.returncode == 0
+
+
+def test_unpicklable_fn_fails_without_losing_the_worker():
+    pool = WorkerPool.from_config()
+    try:
+        unpicklable, ok = make_job(lambda: None), make_job(add, 1, 2)
+        tasks = run(pool, unpicklable, ok)
+    finally:
+        pool.shutdown()
+    assert tasks[0].returncode == 1 and unpicklable.exception is not None
+    assert tasks[1].returncode == 0 and tasks[0].pid == tasks[1].pid
+
+
+def test_idle_workers_are_evicted_when_their_gpus_are_reused():
+    pool = WorkerPool.from_config()
+    try:
+        run(pool, make_job(add, 1, 2, cuda_id=0), make_job(add, 1, 2, cuda_id=1))
+        job = Job(cmd='true')
+        job._resource = Resource.from_resource_items([ResourceItem(ResourceType.CUDA, 0, 1.0)])
+        pool.evict_idle(job)
+        assert [workers[0].cuda_ids for workers in pool._idle_workers.values()] == [{1}]
+    finally:
+        pool.shutdown()
+
+
+def test_recycling_a_slow_worker_does_not_block_the_loop():
+    pool = WorkerPool.from_config(worker_max_tasks=1)
+
+    async def main():
+        start = time.monotonic()
+        task = pool.start_task(make_job(linger, 3))
+        await task.wait()
+        elapsed = time.monotonic() - start
+        assert pool._retiring and elapsed < 2.5
+        while pool._retiring:
+            await asyncio.sleep(0.1)
+        return task
+
+    try:
+        task = asyncio.run(main())
+    finally:
+        pool.shutdown()
+    assert task.returncode == 0